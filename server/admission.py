@@ -0,0 +1,136 @@
+# server/admission.py
+"""
+模型调用的准入控制与背压
+- 同时进行的模型调用不超过 ADMISSION_MAX_CONCURRENT（名额只包住模型调用，本地分析由执行池限流）
+- 超出部分进入有界 FIFO 等待队列，等待超过 ADMISSION_MAX_WAIT 秒即放弃
+- 队列已满时立即拒绝（429），等待超时拒绝（503），均附带 Retry-After 估计
+流量突增时服务逐步变慢而不是全部超时，同时避免大量请求堆积占用内存
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "16"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "30"))
+
+# 指数滑动平均系数
+_EWMA_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    """请求被准入控制拒绝"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """单进程内的并发上限 + 有界等待队列（仅在事件循环线程中使用）"""
+
+    def __init__(self, max_concurrent: int, max_queue: int, max_wait: float):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self._wait_ewma = 0.0
+        # 初始服务时间估计：一次模型调用约 30 秒
+        self._service_ewma = 30.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """按当前排队长度和平均服务时间估计多久后重试（秒）"""
+        estimate = self._service_ewma * (self.queued + 1) / self.max_concurrent
+        return max(1, math.ceil(estimate))
+
+    def check(self) -> None:
+        """快速预检：队列已满时直接拒绝（用于读取上传内容之前）"""
+        if self.active >= self.max_concurrent and self.queued >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected(429, "Server busy: analysis queue is full", self.retry_after())
+
+    def _release(self) -> None:
+        # 直接把名额交给队首仍在等待的请求，active 不变
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[Dict[str, Any]]:
+        """
+        获取一个模型调用名额；返回的字典包含排队耗时 queued_ms
+        """
+        t0 = time.monotonic()
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+        else:
+            self.check()
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, timeout=self.max_wait)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if waiter.done() and not waiter.cancelled():
+                    # 超时/取消与名额交接同时发生：名额已到手，归还给下一个
+                    self._release()
+                else:
+                    try:
+                        self._waiters.remove(waiter)
+                    except ValueError:
+                        pass
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                self.rejected_timeout += 1
+                raise AdmissionRejected(
+                    503, f"Server busy: waited {self.max_wait:.0f}s in analysis queue", self.retry_after()
+                )
+
+        waited = time.monotonic() - t0
+        self._wait_ewma += _EWMA_ALPHA * (waited - self._wait_ewma)
+        self.admitted += 1
+        started = time.monotonic()
+        try:
+            yield {"queued_ms": round(waited * 1000, 1)}
+        finally:
+            self._service_ewma += _EWMA_ALPHA * (time.monotonic() - started - self._service_ewma)
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_wait_ms": round(self._wait_ewma * 1000, 1),
+            "avg_service_s": round(self._service_ewma, 2),
+        }
+
+
+_controller: Optional[AdmissionController] = None
+
+
+def get_admission() -> AdmissionController:
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController(ADMISSION_MAX_CONCURRENT, ADMISSION_MAX_QUEUE, ADMISSION_MAX_WAIT)
+    return _controller
@@ -0,0 +1,119 @@
+# server/bench/bench_batching.py
+"""
+检测微批处理基准（ONNX 引擎，需要 dynamic=True 或 batch=N 导出的模型，路径取环境变量 ONNX_MODEL）
+
+1. 纯推理：同一实例逐张 detect() 与按 batch 大小 detect_batch() 的吞吐
+2. 并发：CONCURRENCY 个线程同时调用 run_detection，关闭 / 开启微批处理时的吞吐和单次延迟
+
+用法：DETECTOR_BATCH_SIZE=8 python bench/bench_batching.py
+"""
+import os
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import cv2
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault("DETECTOR_BATCH_SIZE", "8")
+
+import model_registry  # noqa: E402
+import detectors  # noqa: E402
+from image_artifact import DecodedImage  # noqa: E402
+
+IMAGES = 16
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "8"))
+ROUNDS = 3
+
+
+def make_images() -> List[DecodedImage]:
+    """不同尺寸的合成 JPEG，预先解码并准备好检测用的缩放图"""
+    rng = np.random.default_rng(0)
+    images = []
+    for i in range(IMAGES):
+        w, h = ((1920, 1080), (1080, 1920), (1600, 1200), (1280, 1280))[i % 4]
+        arr = cv2.resize(rng.integers(0, 255, (h // 16, w // 16, 3), dtype=np.uint8), (w, h))
+        ok, buf = cv2.imencode(".jpg", arr)
+        image = DecodedImage(buf.tobytes())
+        image.rgb
+        images.append(image)
+    return images
+
+
+def bench_inference(images: List[DecodedImage]) -> Dict[str, float]:
+    """单实例吞吐（张/秒）：逐张推理 vs 按 batch 推理"""
+    with model_registry.get_pool("onnx").acquire() as detector:
+        items = [(*image.downscaled(detector.size), image.dims) for image in images]
+        detector.detect_batch(items)
+        rates = {}
+        for label, batch in (("single", 1), (f"batch={detector.max_batch}", detector.max_batch)):
+            t = time.perf_counter()
+            for _ in range(ROUNDS):
+                for start in range(0, len(items), batch):
+                    detector.detect_batch(items[start:start + batch])
+            rates[label] = ROUNDS * len(items) / (time.perf_counter() - t)
+    return rates
+
+
+def bench_concurrent(images: List[DecodedImage]) -> Dict[str, float]:
+    """CONCURRENCY 个线程各自检测全部图片：吞吐（张/秒）与单次延迟（毫秒）"""
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def worker(offset: int) -> None:
+        for i in range(len(images)):
+            t = time.perf_counter()
+            result = detectors.run_detection(images[(i + offset) % len(images)])
+            assert result["engine"] == "onnx"
+            with lock:
+                latencies.append((time.perf_counter() - t) * 1000)
+
+    threads = [threading.Thread(target=worker, args=(k,)) for k in range(CONCURRENCY)]
+    t = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    elapsed = time.perf_counter() - t
+    latencies.sort()
+    return {
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[int(len(latencies) * 0.95)],
+    }
+
+
+def main() -> None:
+    status = model_registry.init_models()
+    if status.get("onnx", {}).get("state") != "ready":
+        print("ONNX 引擎不可用（检查 onnxruntime 与 ONNX_MODEL）：", status.get("onnx"))
+        return
+    images = make_images()
+
+    print(f"纯推理（单实例，{IMAGES} 张 x {ROUNDS} 轮）")
+    rates = bench_inference(images)
+    base = rates["single"]
+    for label, rate in rates.items():
+        print(f"  {label:<10}{rate:8.1f} 张/秒 {rate / base:6.2f}x")
+
+    print(f"\n并发 run_detection（{CONCURRENCY} 线程，实例池 {model_registry.DETECTOR_POOL_SIZE}）")
+    batch_size = model_registry.DETECTOR_BATCH_SIZE
+    results = {}
+    for label, size in (("batch off", 1), (f"batch<={batch_size}", batch_size)):
+        model_registry.DETECTOR_BATCH_SIZE = size
+        bench_concurrent(images)  # 预热
+        results[label] = bench_concurrent(images)
+    base = results["batch off"]["throughput"]
+    for label, r in results.items():
+        print(f"  {label:<12}{r['throughput']:8.1f} 张/秒 {r['throughput'] / base:6.2f}x"
+              f"   p50 {r['p50_ms']:6.1f} ms  p95 {r['p95_ms']:6.1f} ms")
+    print("  微批统计：", model_registry.models_status()["batching"].get("onnx"))
+
+
+if __name__ == "__main__":
+    main()
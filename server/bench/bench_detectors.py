@@ -0,0 +1,122 @@
+# server/bench/bench_detectors.py
+"""
+本地检测引擎基准：HOG / ONNX Runtime / ultralytics YOLO 在同一组图片上的单张耗时，
+以及各引擎依赖的导入耗时和常驻内存（子进程中测量）
+
+未安装或未配置模型的引擎会跳过；ONNX 模型路径取环境变量 ONNX_MODEL
+
+用法：
+  python bench/bench_detectors.py [图片 ...]
+  python bench/bench_detectors.py --quantize yolov8n.onnx   # 生成 INT8 动态量化模型 yolov8n.int8.onnx
+"""
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import cv2
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from image_artifact import DecodedImage  # noqa: E402
+from model_registry import get_pool, init_models  # noqa: E402
+import detectors  # noqa: E402
+
+REPEAT = 5
+
+ENGINES: Dict[str, Callable[[DecodedImage], Optional[dict]]] = {
+    "hog": lambda image: {"persons": detectors._hog_person_detect(image)},
+    "onnx": detectors._try_onnx_detect,
+    "yolo": detectors._try_yolo_detect,
+}
+
+# 各引擎额外引入的依赖（测量导入耗时和内存），baseline 为只导入 numpy/cv2 的进程
+ENGINE_IMPORTS = {
+    "baseline": "pass",
+    "onnx": "import onnxruntime",
+    "yolo": "from ultralytics import YOLO",
+}
+
+_IMPORT_PROBE = """
+import resource, time
+import numpy, cv2
+t = time.perf_counter()
+{stmt}
+print(time.perf_counter() - t, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def synthetic_images() -> List[bytes]:
+    """无参数时使用的合成照片：4032x3024 / 1920x1080 / 1080x1920"""
+    images = []
+    rng = np.random.default_rng(0)
+    for w, h in ((4032, 3024), (1920, 1080), (1080, 1920)):
+        arr = cv2.resize(rng.integers(0, 255, (h // 16, w // 16, 3), dtype=np.uint8), (w, h))
+        ok, buf = cv2.imencode(".jpg", arr, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        images.append(buf.tobytes())
+    return images
+
+
+def import_cost(stmt: str) -> Optional[str]:
+    """在新进程中测量导入耗时（秒）和导入后的最大常驻内存（MB）"""
+    proc = subprocess.run([sys.executable, "-c", _IMPORT_PROBE.format(stmt=stmt)], capture_output=True, text=True)
+    if proc.returncode != 0:
+        return None
+    seconds, kb = proc.stdout.split()
+    return f"{float(seconds):.2f} s, {int(kb) / 1024:.0f} MB"
+
+
+def bench(images: List[bytes]) -> Dict[str, List[float]]:
+    """每个引擎每张图的耗时（毫秒，解码结果预先缓存，不计入）"""
+    decoded = [DecodedImage(data) for data in images]
+    for image in decoded:
+        image.rgb
+    times: Dict[str, List[float]] = {}
+    for name, fn in ENGINES.items():
+        if name != "hog" and get_pool(name) is None:
+            continue
+        for image in decoded:
+            fn(image)  # 预热，同时填充缩放金字塔
+            for _ in range(REPEAT):
+                t = time.perf_counter()
+                fn(image)
+                times.setdefault(name, []).append((time.perf_counter() - t) * 1000)
+    return times
+
+
+def quantize(path: str) -> str:
+    """ONNX Runtime 动态量化（权重 INT8），输入输出与原模型一致"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    out = str(Path(path).with_suffix(".int8.onnx"))
+    quantize_dynamic(path, out, weight_type=QuantType.QUInt8)
+    return out
+
+
+def main(args: List[str]) -> None:
+    if args[:1] == ["--quantize"]:
+        print(quantize(args[1]))
+        return
+
+    status = init_models()
+    print("引擎状态：", {name: info["state"] for name, info in status.items()})
+    images = [Path(p).read_bytes() for p in args] or synthetic_images()
+
+    times = bench(images)
+    print(f"\n{len(images)} 张图片，每张 {REPEAT} 次")
+    print(f"{'引擎':<8}{'均值 ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'相对 HOG':>10}")
+    base = statistics.mean(times["hog"])
+    for name, ts in times.items():
+        ts = sorted(ts)
+        mean = statistics.mean(ts)
+        print(f"{name:<8}{mean:>10.1f}{ts[len(ts) // 2]:>10.1f}{ts[int(len(ts) * 0.95)]:>10.1f}{base / mean:>9.1f}x")
+
+    print("\n依赖导入耗时 / 进程常驻内存（新进程）")
+    for name, stmt in ENGINE_IMPORTS.items():
+        print(f"  {name:<10}{import_cost(stmt) or '未安装'}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,162 @@
+# server/bench/bench_llm_json.py
+"""
+模型输出 JSON 提取的基准：旧实现（正则提取代码块 + rfind('}') 截断重试）与
+llm_json 单遍解析器在同一语料上的恢复率和耗时对比
+
+语料 llm_responses.jsonl 每行一个原始响应，脚本在其基础上生成变体：
+代码块/前后说明文字、多余逗号、缺逗号、在 TRUNCATE_POINTS 个位置截断
+
+用法：python bench/bench_llm_json.py [语料路径]
+"""
+import json
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from llm_json import TopLevelFieldParser, repair_json  # noqa: E402
+
+CORPUS = Path(__file__).with_name("llm_responses.jsonl")
+TRUNCATE_POINTS = 60
+STREAM_CHUNK = 20
+REPEAT = 20
+
+
+def baseline_extract(content: str) -> Optional[Dict[str, Any]]:
+    """旧实现（qwen_client 非流式版本）的提取逻辑"""
+    m = re.search(r"```(?:json)?\s*(.*?)```", content, re.S)
+    if m:
+        content = m.group(1).strip()
+    else:
+        first_brace = content.find('{')
+        last_brace = content.rfind('}')
+        if first_brace >= 0 and last_brace > first_brace:
+            content = content[first_brace:last_brace + 1].strip()
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        try:
+            last_brace = content.rfind('}')
+            if last_brace > 0:
+                return json.loads(content[:last_brace + 1])
+        except Exception:
+            pass
+    return None
+
+
+def tolerant_extract(content: str) -> Optional[Dict[str, Any]]:
+    """流式解析器：按 STREAM_CHUNK 分块喂入，结束时 close()"""
+    parser = TopLevelFieldParser()
+    for i in range(0, len(content), STREAM_CHUNK):
+        parser.feed(content[i:i + STREAM_CHUNK])
+    parser.close()
+    return parser.fields or None
+
+
+METHODS: Dict[str, Callable[[str], Optional[Dict[str, Any]]]] = {
+    "baseline": baseline_extract,
+    "tolerant": tolerant_extract,
+}
+
+
+def make_variants(raw: str) -> List[Tuple[str, str]]:
+    """(变体类型, 文本)"""
+    variants = [
+        ("clean", raw),
+        ("prose_around", "好的，以下是分析结果：\n" + raw + "\n如需进一步分析请告诉我。"),
+        # 容器结束前多余的逗号
+        ("trailing_commas", re.sub(r'(["\]}\de])(\s*)([}\]])', r'\1,\2\3', raw)),
+        # 删掉两个相邻顶层字段之间的逗号
+        ("missing_comma", re.sub(r',(\s*"(?:lifestyle|l)":)', r'\1', raw, count=1)),
+    ]
+    for k in range(1, TRUNCATE_POINTS + 1):
+        variants.append(("truncated", raw[:len(raw) * k // (TRUNCATE_POINTS + 1)]))
+    return variants
+
+
+def field_ends(raw: str) -> Dict[str, int]:
+    """完整响应中每个顶层字段的值在原文中的结束位置"""
+    decoder = json.JSONDecoder()
+    ws = re.compile(r"[\s,]*")
+    pos = ws.match(raw, raw.index("{") + 1).end()
+    ends: Dict[str, int] = {}
+    while raw[pos] == '"':
+        key, pos = decoder.raw_decode(raw, pos)
+        pos = raw.index(":", pos) + 1
+        _, pos = decoder.raw_decode(raw, ws.match(raw, pos).end())
+        ends[key] = pos
+        pos = ws.match(raw, pos).end()
+    return ends
+
+
+def score(result: Optional[Dict[str, Any]], reference: Dict[str, Any], expected: List[str]) -> int:
+    """与参考值完全一致的字段数"""
+    return sum(1 for k in expected if result is not None and result.get(k) == reference[k])
+
+
+def _timed(fn: Callable[[str], Any], texts: List[str]) -> float:
+    """每个响应的平均耗时（微秒）"""
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        for t in texts:
+            fn(t)
+    return (time.perf_counter() - start) / (REPEAT * len(texts)) * 1e6
+
+
+def _scaling() -> List[Tuple[int, float]]:
+    """repair_json 对不同长度的截断输入的耗时，验证线性"""
+    item = {"claim": "画面中检测到物体：床, 桌子", "evidence": ["来自画面：\"床\""], "confidence": "low"}
+    rows = []
+    for n in (10, 100, 1000, 10000):
+        text = json.dumps({"items": [item] * n}, ensure_ascii=False)[:-7]
+        start = time.perf_counter()
+        repaired, _ = repair_json(text)
+        elapsed = (time.perf_counter() - start) * 1000
+        json.loads(repaired)
+        rows.append((len(text), elapsed))
+    return rows
+
+
+def main(path: Path) -> None:
+    cases = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+    totals: Dict[Tuple[str, str], List[int]] = {}
+    texts: List[str] = []
+
+    for case in cases:
+        raw = case["raw"]
+        reference = baseline_extract(raw) or {}
+        ends = field_ends(raw)
+        for kind, text in make_variants(raw):
+            texts.append(text)
+            # 截断变体：值在截断点之前已完整输出的字段视为应当可恢复
+            expected = [k for k in reference if kind != "truncated" or ends[k] <= len(text)]
+            for name, fn in METHODS.items():
+                got = score(fn(text), reference, expected)
+                t = totals.setdefault((name, kind), [0, 0, 0, 0])
+                t[0] += got
+                t[1] += len(expected)
+                t[2] += 1 if got == len(expected) else 0
+                t[3] += 1
+
+    print(f"语料：{len(cases)} 个响应，{len(texts)} 个变体\n")
+    print(f"{'变体':<18}{'方法':<10}{'字段恢复率':>10}{'完全恢复':>10}")
+    for kind in dict.fromkeys(k for _, k in totals):
+        for name in METHODS:
+            got, expected, full, n = totals[(name, kind)]
+            rate = got / expected if expected else 1.0
+            print(f"{kind:<18}{name:<10}{rate:>10.1%}{f'{full}/{n}':>10}")
+
+    print(f"\n平均耗时（{STREAM_CHUNK} 字符分块流式喂入，每个响应）")
+    for name, fn in METHODS.items():
+        print(f"  {name:<10}{_timed(fn, texts):8.1f} us")
+
+    print("\nrepair_json 耗时随输入长度")
+    for size, ms in _scaling():
+        print(f"  {size:>9} 字符 {ms:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main(Path(sys.argv[1]) if len(sys.argv) > 1 else CORPUS)
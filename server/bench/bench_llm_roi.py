@@ -0,0 +1,118 @@
+# server/bench/bench_llm_roi.py
+"""
+发送给模型的图片：单张缩放图（prepare_llm_image）与低分辨率全图 + 人物区域裁剪（prepare_roi_request）对比
+
+- 字节数：base64 前的图片总大小（上传耗时与之成正比）
+- 像素数：所有图片的像素总和
+- 图片 token 估算：按 768x768 分块、每块 258 token 的计费方式（两边都不超过 384 时按 1 块计）；
+  按每张图片固定 token 计费的模型上，多张图片不会减少 token，以实际账单为准
+- 准备耗时：本地检测 + 人脸检测之后生成请求图片的耗时
+
+用法：LLM_ROI_CROPS=1 python bench/bench_llm_roi.py [图片 ...]
+"""
+import io
+import math
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from detectors import run_detection  # noqa: E402
+from face_detector import attach_faces, detect_faces  # noqa: E402
+from image_artifact import DecodedImage  # noqa: E402
+from llm_image import prepare_llm_image, prepare_roi_request  # noqa: E402
+from model_registry import init_models  # noqa: E402
+
+REPEAT = 3
+TILE = 768
+TOKENS_PER_TILE = 258
+
+
+def tile_tokens(width: int, height: int) -> int:
+    if width <= TILE // 2 and height <= TILE // 2:
+        return TOKENS_PER_TILE
+    return math.ceil(width / TILE) * math.ceil(height / TILE) * TOKENS_PER_TILE
+
+
+def measure(images: List[Tuple[bytes, str]]) -> Dict[str, Any]:
+    """images: [(编码后的字节, mime)]"""
+    sizes = [Image.open(io.BytesIO(data)).size for data, _ in images]
+    return {
+        "count": len(images),
+        "bytes": sum(len(data) for data, _ in images),
+        "pixels": sum(w * h for w, h in sizes),
+        "tokens": sum(tile_tokens(w, h) for w, h in sizes),
+    }
+
+
+def decoded(data: bytes) -> DecodedImage:
+    """新的 DecodedImage（不复用缩放金字塔），解码本身不计入准备耗时"""
+    image = DecodedImage(data)
+    image.rgb
+    return image
+
+
+def bench_image(path: str) -> Dict[str, Any]:
+    data = Path(path).read_bytes()
+    image = DecodedImage(data)
+    det = run_detection(image)
+    attach_faces(det, detect_faces(image))
+
+    single_times, roi_times = [], []
+    for _ in range(REPEAT):
+        fresh = decoded(data)
+        t = time.perf_counter()
+        single = prepare_llm_image(fresh, "image/jpeg")
+        single_times.append((time.perf_counter() - t) * 1000)
+        fresh = decoded(data)
+        t = time.perf_counter()
+        roi = prepare_roi_request(fresh, "image/jpeg", det)
+        roi_times.append((time.perf_counter() - t) * 1000)
+
+    single_parts = [(bytes(single["bytes"]), single["mime"])]
+    roi_parts = single_parts if roi is None else [(roi["bytes"], roi["mime"])] + [
+        (c["bytes"], c["mime"]) for c in roi["crops"]
+    ]
+    return {
+        "name": Path(path).name,
+        "dims": f"{image.dims['width']}x{image.dims['height']}",
+        "persons": len(det["persons"]),
+        "faces": len(det.get("faces", [])),
+        "single": measure(single_parts),
+        "roi": measure(roi_parts),
+        "roi_used": roi is not None,
+        "single_ms": statistics.median(single_times),
+        "roi_ms": statistics.median(roi_times),
+    }
+
+
+def main(paths: List[str]) -> None:
+    status = init_models()
+    print("人脸检测：", {k: status[k]["state"] for k in ("face_dnn", "face_cascade")})
+    print(f"{'图片':<18}{'尺寸':>11}{'人/脸':>6}{'张数':>6}{'KB 单张→ROI':>16}{'Mpx 单张→ROI':>16}"
+          f"{'token 单张→ROI':>18}{'ms 单张/ROI':>14}")
+    totals = {"single": [0, 0], "roi": [0, 0]}
+    for path in paths:
+        r = bench_image(path)
+        s, o = r["single"], r["roi"]
+        for key, m in (("single", s), ("roi", o)):
+            totals[key][0] += m["bytes"]
+            totals[key][1] += m["tokens"]
+        print(f"{r['name']:<18}{r['dims']:>11}{r['persons']:>3}/{r['faces']:<2}{o['count']:>6}"
+              f"{s['bytes'] / 1024:>8.0f}→{o['bytes'] / 1024:<7.0f}{s['pixels'] / 1e6:>8.2f}→{o['pixels'] / 1e6:<7.2f}"
+              f"{s['tokens']:>9}→{o['tokens']:<8}{r['single_ms']:>7.0f}/{r['roi_ms'] if r['roi_used'] else 0:<6.0f}")
+    (sb, st), (rb, rt) = totals["single"], totals["roi"]
+    print(f"\n合计：{sb / 1024:.0f} KB → {rb / 1024:.0f} KB（{rb / sb - 1:+.0%}），"
+          f"分块 token {st} → {rt}（{rt / st - 1:+.0%}）")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+    else:
+        main(sys.argv[1:])
@@ -0,0 +1,122 @@
+# server/bench/bench_profiles.py
+"""
+检测档位（fast / balanced / accurate）的耗时与人物召回率
+
+标注文件为 JSONL，每行 {"image": 图片路径, "persons": [[x0, y0, x1, y1], ...]}（原图坐标，无人物的负样本为 []）；
+检测框与标注框 IoU >= IOU_MATCH 记为命中，未匹配任何标注的检测框记为误检
+不传标注文件时使用合成图片，只输出耗时
+
+用法：python bench/bench_profiles.py [annotations.jsonl]
+"""
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import cv2
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import detection_profiles  # noqa: E402
+from detection_profiles import PROFILE_ORDER, select_profile  # noqa: E402
+from detectors import run_detection  # noqa: E402
+from image_artifact import DecodedImage  # noqa: E402
+from model_registry import init_models  # noqa: E402
+
+IOU_MATCH = 0.3
+REPEAT = 3
+
+Sample = Tuple[DecodedImage, List[List[float]]]
+
+
+def load_samples(path: str) -> List[Sample]:
+    samples = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            row = json.loads(line)
+            samples.append((DecodedImage(Path(row["image"]).read_bytes()), row["persons"]))
+    return samples
+
+
+def synthetic_samples() -> List[Sample]:
+    rng = np.random.default_rng(0)
+    samples = []
+    for w, h in ((4032, 3024), (1920, 1080), (1080, 1920)):
+        arr = cv2.resize(rng.integers(0, 255, (h // 16, w // 16, 3), dtype=np.uint8), (w, h))
+        ok, buf = cv2.imencode(".jpg", arr)
+        samples.append((DecodedImage(buf.tobytes()), []))
+    return samples
+
+
+def iou(a: List[float], b: List[float]) -> float:
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def bench_profile(profile: str, samples: List[Sample]) -> Dict[str, Any]:
+    times: List[float] = []
+    hits = total = false_pos = 0
+    engines = set()
+    for image, truth in samples:
+        det = run_detection(image, profile=profile)  # 预热，同时填充缩放金字塔
+        for _ in range(REPEAT):
+            t = time.perf_counter()
+            run_detection(image, profile=profile)
+            times.append((time.perf_counter() - t) * 1000)
+        engines.add(det["engine"])
+        boxes = [p["bbox"] for p in det["persons"]]
+        hits += sum(1 for g in truth if any(iou(g, b) >= IOU_MATCH for b in boxes))
+        total += len(truth)
+        false_pos += sum(1 for b in boxes if not any(iou(g, b) >= IOU_MATCH for g in truth))
+    times.sort()
+    return {
+        "engine": "/".join(sorted(engines)),
+        "mean": statistics.mean(times),
+        "p95": times[int(len(times) * 0.95)],
+        "recall": hits / total if total else None,
+        "hits": f"{hits}/{total}",
+        "fp_per_image": false_pos / len(samples),
+    }
+
+
+def degrade_table() -> List[Tuple[int, float, str]]:
+    """模拟不同排队深度 / CPU 负载下 select_profile 的选择（请求档位为 accurate）"""
+    rows = []
+    original = detection_profiles.current_load
+    try:
+        for depth, load in ((0, 0.2), (4, 0.2), (8, 0.2), (0, 1.5), (0, 3.0)):
+            detection_profiles.current_load = lambda d=depth, c=load: {"queue_depth": d, "cpu_load": c}
+            rows.append((depth, load, select_profile("accurate")["profile"]))
+    finally:
+        detection_profiles.current_load = original
+    return rows
+
+
+def main(args: List[str]) -> None:
+    status = init_models()
+    print("引擎状态：", {name: info["state"] for name, info in status.items()})
+    samples = load_samples(args[0]) if args else synthetic_samples()
+    for image, _ in samples:
+        image.rgb
+
+    print(f"\n{len(samples)} 张图片，每张 {REPEAT} 次，IoU >= {IOU_MATCH} 计为命中")
+    print(f"{'档位':<10}{'引擎':<8}{'均值 ms':>10}{'p95 ms':>10}{'召回率':>10}{'命中':>8}{'误检/张':>9}")
+    for profile in reversed(PROFILE_ORDER):
+        r = bench_profile(profile, samples)
+        recall = f"{r['recall']:.0%}" if r["recall"] is not None else "-"
+        print(f"{profile:<10}{r['engine']:<8}{r['mean']:>10.1f}{r['p95']:>10.1f}{recall:>10}{r['hits']:>8}"
+              f"{r['fp_per_image']:>9.2f}")
+
+    print("\n降级策略（请求档位 accurate）")
+    for depth, load, profile in degrade_table():
+        print(f"  排队 {depth:>2}  每核负载 {load:>4}  -> {profile}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,91 @@
+# server/bench/bench_quality.py
+"""
+图像质量指标基准：原先的全尺寸计算（float64 Laplacian 方差 + float32 高斯残差标准差）
+与 quality_metrics（共享金字塔上固定分辨率一次算出全部指标）在 2 ~ 50 MP 输入上的耗时和峰值内存
+
+- 全尺寸：在已解码的全尺寸灰度图上计算（不含灰度转换）
+- 仅指标：金字塔已就绪（检测阶段已生成）时 quality_metrics 本身的耗时
+- 含缩放：从全尺寸 RGB 开始，包括生成金字塔基础层和质量层的耗时
+
+用法：python bench/bench_quality.py
+"""
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+import numpy as np
+import cv2
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from image_artifact import DecodedImage  # noqa: E402
+from image_quality import QUALITY_MAX_SIDE, quality_metrics  # noqa: E402
+
+SIZES_MP = (2, 8, 12, 24, 50)
+REPEAT = 3
+
+
+def make_image(mp: int) -> DecodedImage:
+    """4:3 合成图片，预先解码"""
+    h = int((mp * 1e6 * 3 / 4) ** 0.5)
+    w = h * 4 // 3
+    rng = np.random.default_rng(mp)
+    arr = cv2.resize(rng.integers(0, 255, (h // 32, w // 32, 3), dtype=np.uint8), (w, h))
+    arr = cv2.add(arr, rng.integers(0, 8, arr.shape, dtype=np.uint8))
+    ok, buf = cv2.imencode(".jpg", arr, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    image = DecodedImage(buf.tobytes())
+    image.rgb
+    return image
+
+
+def full_resolution(gray: np.ndarray) -> Tuple[float, float]:
+    blur = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    g = gray.astype(np.float32)
+    noise = float(np.std(g - cv2.GaussianBlur(g, (5, 5), 0)))
+    return blur, noise
+
+
+def drop_pyramid(image: DecodedImage) -> None:
+    for key in [k for k in image._cache if isinstance(k, tuple) and k[0] == "pyramid"]:
+        del image._cache[key]
+
+
+def measure(fn: Callable[[], object], setup: Callable[[], None] = lambda: None) -> Tuple[float, float]:
+    """返回 (耗时中位数 ms, 峰值新增内存 MB)"""
+    times: List[float] = []
+    for _ in range(REPEAT):
+        setup()
+        t = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t) * 1000)
+    setup()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(times), peak / 2 ** 20
+
+
+def main() -> None:
+    print(f"质量指标分辨率：长边 {QUALITY_MAX_SIDE}px，每项取 {REPEAT} 次中位数")
+    print(f"{'输入':<14}{'全尺寸 ms':>10}{'MB':>7}{'仅指标 ms':>11}{'MB':>6}{'含缩放 ms':>11}{'MB':>7}"
+          f"{'模糊度(全尺寸/新)':>20}")
+    for mp in SIZES_MP:
+        image = make_image(mp)
+        gray = image.gray
+        old_ms, old_mb = measure(lambda: full_resolution(gray))
+        quality_metrics(image)
+        new_ms, new_mb = measure(lambda: quality_metrics(image))
+        cold_ms, cold_mb = measure(lambda: quality_metrics(image), setup=lambda: drop_pyramid(image))
+        old_blur = full_resolution(gray)[0]
+        new_blur = quality_metrics(image)["blur"]
+        size = f"{mp}MP {image.dims['width']}x{image.dims['height']}"
+        print(f"{size:<14}{old_ms:>10.1f}{old_mb:>7.0f}{new_ms:>11.1f}{new_mb:>6.1f}{cold_ms:>11.1f}{cold_mb:>7.0f}"
+              f"{old_blur:>12.0f} / {new_blur:<6.0f}")
+
+
+if __name__ == "__main__":
+    main()
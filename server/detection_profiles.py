@@ -0,0 +1,88 @@
+# server/detection_profiles.py
+"""
+本地检测的速度/质量档位（fast / balanced / accurate）与负载感知降级
+每个档位决定引擎优先顺序、输入分辨率和 HOG 金字塔参数；
+执行池排队过深或 CPU 负载过高时自动改用更便宜的档位，实际使用的档位见 _meta.local_engine
+"""
+import os
+from typing import Any, Dict, List, Optional
+
+from executors import CPU_COUNT, local_queue_depth
+
+# engines: 依次尝试的引擎（不可用时跳过，HOG 始终可用）
+# yolo_imgsz: ultralytics 推理尺寸；ONNX 模型输入尺寸在导出时固定，只受引擎顺序影响
+# hog_*: HOG 输入长边上限、滑窗步长、金字塔缩放系数
+DETECTION_PROFILES: Dict[str, Dict[str, Any]] = {
+    "fast": {
+        "engines": ("onnx", "hog"),
+        "yolo_imgsz": 480,
+        "hog_max_side": 640,
+        "hog_win_stride": (8, 8),
+        "hog_scale": 1.1,
+    },
+    "balanced": {
+        "engines": ("onnx", "yolo", "hog"),
+        "yolo_imgsz": 640,
+        "hog_max_side": 1200,
+        "hog_win_stride": (8, 8),
+        "hog_scale": 1.05,
+    },
+    "accurate": {
+        "engines": ("yolo", "onnx", "hog"),
+        "yolo_imgsz": 1280,
+        "hog_max_side": 1600,
+        "hog_win_stride": (4, 4),
+        "hog_scale": 1.05,
+    },
+}
+# 从贵到便宜，降级时向后移动
+PROFILE_ORDER = ("accurate", "balanced", "fast")
+
+DETECTION_PROFILE = os.getenv("DETECTION_PROFILE", "balanced").lower()
+if DETECTION_PROFILE not in DETECTION_PROFILES:
+    DETECTION_PROFILE = "balanced"
+DETECTION_AUTO_DEGRADE = os.getenv("DETECTION_AUTO_DEGRADE", "1") not in ("0", "false", "False")
+# 执行池排队任务数 / 每核 1 分钟平均负载达到阈值时降一档，达到两倍阈值时降两档
+DEGRADE_QUEUE_DEPTH = int(os.getenv("DEGRADE_QUEUE_DEPTH", "4"))
+DEGRADE_CPU_LOAD = float(os.getenv("DEGRADE_CPU_LOAD", "1.5"))
+
+
+def current_load() -> Dict[str, float]:
+    """{"queue_depth": 执行池排队任务数, "cpu_load": 每核 1 分钟平均负载}"""
+    try:
+        cpu_load = os.getloadavg()[0] / CPU_COUNT
+    except (AttributeError, OSError):
+        # Windows 无 getloadavg，只看排队深度
+        cpu_load = 0.0
+    return {"queue_depth": local_queue_depth(), "cpu_load": round(cpu_load, 2)}
+
+
+def _steps(value: float, threshold: float) -> int:
+    if threshold <= 0 or value < threshold:
+        return 0
+    return 2 if value >= 2 * threshold else 1
+
+
+def select_profile(requested: Optional[str] = None) -> Dict[str, Any]:
+    """
+    按当前负载选择检测档位
+    返回 {"profile", "requested", "degraded_by", "load"}；degraded_by 为触发降级的指标（未降级时为空）
+    """
+    requested = requested if requested in DETECTION_PROFILES else DETECTION_PROFILE
+    load = current_load()
+    degraded_by: List[str] = []
+    steps = 0
+    if DETECTION_AUTO_DEGRADE:
+        for key, threshold in (("queue_depth", DEGRADE_QUEUE_DEPTH), ("cpu_load", DEGRADE_CPU_LOAD)):
+            n = _steps(load[key], threshold)
+            if n:
+                degraded_by.append(key)
+                steps = max(steps, n)
+    index = min(PROFILE_ORDER.index(requested) + steps, len(PROFILE_ORDER) - 1)
+    profile = PROFILE_ORDER[index]
+    return {
+        "profile": profile,
+        "requested": requested,
+        "degraded_by": degraded_by if profile != requested else [],
+        "load": load,
+    }
@@ -1,14 +1,16 @@
 # server/detectors.py
 """
-本地检测模块：HOG 默认 + 可选 YOLO
+本地检测模块：HOG 默认 + 可选 ONNX Runtime / YOLO
 提供 person 检测和参照物候选
 """
-from typing import Any, Dict, List, Optional
-import io
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
 import cv2
-from PIL import Image
+
+from detection_profiles import DETECTION_PROFILE, DETECTION_PROFILES
+from image_artifact import DecodedImage, as_decoded
+from model_registry import get_batcher, get_pool
 
 
 # 常见可作为"参照物存在性线索"的类别（COCO 数据集类别）
@@ -28,43 +30,32 @@ COCO_REFERENCE_HINTS = {
 }
 
 
-def _decode_to_bgr(image_bytes: bytes) -> np.ndarray:
-    """将图片字节解码为 BGR 格式的 numpy 数组"""
-    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    arr = np.array(img)
-    return cv2.cvtColor(arr, cv2.COLOR_RGB2BGR)
-
-
-def _get_image_dimensions(image_bytes: bytes) -> Dict[str, int]:
-    """获取图片尺寸"""
-    img = Image.open(io.BytesIO(image_bytes))
-    return {"width": img.width, "height": img.height}
-
-
-def _hog_person_detect(bgr: np.ndarray) -> List[Dict[str, Any]]:
+def _hog_person_detect(
+    image: DecodedImage,
+    preview_side: Optional[int] = None,
+    profile: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
     """
     使用 OpenCV HOG 描述符进行行人检测
-    轻量级，不需要额外模型文件
+    轻量级，不需要额外模型文件；输入长边、滑窗步长和金字塔系数由检测档位决定
     """
-    hog = cv2.HOGDescriptor()
-    hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+    profile = profile or DETECTION_PROFILES[DETECTION_PROFILE]
+    h, w = image.dims["height"], image.dims["width"]
 
-    h, w = bgr.shape[:2]
-    scale = 1.0
-    
-    # 缩放大图以提高速度
-    if max(h, w) > 1200:
-        scale = 1200 / max(h, w)
-        bgr_small = cv2.resize(bgr, (int(w * scale), int(h * scale)))
+    # 使用共享金字塔中的缩放图（HOG 梯度取各通道最大值，与通道顺序无关，直接用 RGB）
+    if preview_side:
+        small, scale = image.preview(min(preview_side, profile["hog_max_side"]))
     else:
-        bgr_small = bgr
-
-    rects, weights = hog.detectMultiScale(
-        bgr_small, 
-        winStride=(8, 8), 
-        padding=(8, 8), 
-        scale=1.05
-    )
+        small, scale = image.downscaled(profile["hog_max_side"])
+
+    # 从注册表借用预先构建好的 HOG 实例
+    with get_pool("hog").acquire() as hog:
+        rects, weights = hog.detectMultiScale(
+            small, 
+            winStride=profile["hog_win_stride"], 
+            padding=(8, 8), 
+            scale=profile["hog_scale"]
+        )
     
     persons = []
     for (x, y, rw, rh), wt in zip(rects, weights):
@@ -92,56 +83,113 @@ def _hog_person_detect(bgr: np.ndarray) -> List[Dict[str, Any]]:
     return persons
 
 
-def _try_yolo_detect(bgr: np.ndarray) -> Optional[Dict[str, Any]]:
+def _onnx_batch(items: Sequence[Tuple[np.ndarray, float, Dict[str, int]]]) -> List[Dict[str, Any]]:
+    """一批 (缩放图, 缩放比例, 原图尺寸) 做一次 ONNX 推理"""
+    with get_pool("onnx").acquire() as detector:
+        return detector.detect_batch(items)
+
+
+def _try_onnx_detect(image: DecodedImage, preview_side: Optional[int] = None) -> Optional[Dict[str, Any]]:
     """
-    可选：如果安装了 ultralytics，使用 YOLO 进行更精确的检测
-    返回 {persons:[], objects:[], engine:"yolo"} 或 None（不可用时）
+    可选：导出的 YOLOv8 ONNX 模型经 ONNX Runtime 在 CPU 上推理（不需要 ultralytics/torch）
+    开启微批处理时与并发请求合并为一次批量推理
+    返回 {persons:[], objects:[], engine:"onnx"} 或 None（不可用时）
     """
-    try:
-        from ultralytics import YOLO
-    except ImportError:
-        return None
-    except Exception:
+    pool = get_pool("onnx")
+    if pool is None:
         return None
 
     try:
-        # 使用默认模型（首次运行会自动下载）
-        model = YOLO("yolov8n.pt")
+        # 共享金字塔中长边等于模型输入尺寸的缩放图，letterbox 时无需再缩放
+        if preview_side:
+            small, scale = image.preview(preview_side)
+        else:
+            small, scale = image.downscaled(pool.peek().size)
+        item = (small, scale, image.dims)
+        batcher = get_batcher("onnx", _onnx_batch)
+        result = batcher.submit(item) if batcher else _onnx_batch([item])[0]
+        return {"engine": "onnx", **result}
 
-        # 推理
-        res = model.predict(source=bgr, verbose=False)[0]
-        names = res.names
-        h, w = bgr.shape[:2]
+    except Exception as e:
+        print(f"[ONNX] Detection failed: {e}")
+        return None
+
+
+def _parse_yolo(res: Any, scale: float, dims: Dict[str, int]) -> Dict[str, Any]:
+    """ultralytics 单张结果 -> {persons, objects}（坐标映射回原图）"""
+    names = res.names
+    h, w = dims["height"], dims["width"]
 
-        persons = []
-        objects = []
+    persons = []
+    objects = []
+    
+    for box in res.boxes:
+        cls_id = int(box.cls[0].item())
+        label = names.get(cls_id, str(cls_id))
+        conf = float(box.conf[0].item())
+        x0, y0, x1, y1 = [float(v) / scale for v in box.xyxy[0].tolist()]
         
-        for box in res.boxes:
-            cls_id = int(box.cls[0].item())
-            label = names.get(cls_id, str(cls_id))
-            conf = float(box.conf[0].item())
-            x0, y0, x1, y1 = [float(v) for v in box.xyxy[0].tolist()]
-            
-            box_height = y1 - y0
-            box_width = x1 - x0
-            height_ratio = box_height / h
-            width_ratio = box_width / w
-            
-            item = {
-                "label": label, 
-                "conf": round(conf, 3), 
-                "bbox": [int(x0), int(y0), int(x1), int(y1)],
-                "box_height_ratio": round(height_ratio, 3),
-                "box_width_ratio": round(width_ratio, 3),
-            }
-            
-            if label == "person":
-                item["is_full_body"] = height_ratio > 0.6
-                persons.append(item)
-            else:
-                objects.append(item)
+        box_height = y1 - y0
+        box_width = x1 - x0
+        height_ratio = box_height / h
+        width_ratio = box_width / w
+        
+        item = {
+            "label": label, 
+            "conf": round(conf, 3), 
+            "bbox": [int(x0), int(y0), int(x1), int(y1)],
+            "box_height_ratio": round(height_ratio, 3),
+            "box_width_ratio": round(width_ratio, 3),
+        }
+        
+        if label == "person":
+            item["is_full_body"] = height_ratio > 0.6
+            persons.append(item)
+        else:
+            objects.append(item)
+
+    return {"persons": persons, "objects": objects}
+
 
-        return {"engine": "yolo", "persons": persons, "objects": objects}
+def _yolo_batch(items: Sequence[Tuple[np.ndarray, float, Dict[str, int], int]]) -> List[Dict[str, Any]]:
+    """一批 (BGR 图, 缩放比例, 原图尺寸, 推理尺寸) 按推理尺寸分组，每组交给 ultralytics 一次推理"""
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    groups: Dict[int, List[int]] = {}
+    for i, item in enumerate(items):
+        groups.setdefault(item[3], []).append(i)
+    with get_pool("yolo").acquire() as model:
+        for imgsz, indices in groups.items():
+            preds = model.predict(source=[items[i][0] for i in indices], imgsz=imgsz, verbose=False)
+            for i, res in zip(indices, preds):
+                results[i] = _parse_yolo(res, items[i][1], items[i][2])
+    return results
+
+
+def _try_yolo_detect(
+    image: DecodedImage,
+    preview_side: Optional[int] = None,
+    imgsz: int = 640
+) -> Optional[Dict[str, Any]]:
+    """
+    可选：如果安装了 ultralytics，使用 YOLO 进行更精确的检测
+    开启微批处理时与并发请求合并为一次批量推理
+    返回 {persons:[], objects:[], engine:"yolo"} 或 None（不可用时）
+    """
+    # 模型在启动时由注册表加载，未安装 ultralytics 时池不存在
+    if get_pool("yolo") is None:
+        return None
+
+    try:
+        # 推理
+        if preview_side:
+            small, scale = image.preview(preview_side)
+            bgr = cv2.cvtColor(small, cv2.COLOR_RGB2BGR)
+        else:
+            bgr, scale = image.bgr, 1.0
+        item = (bgr, scale, image.dims, imgsz)
+        batcher = get_batcher("yolo", _yolo_batch)
+        result = batcher.submit(item) if batcher else _yolo_batch([item])[0]
+        return {"engine": "yolo", **result}
         
     except Exception as e:
         print(f"[YOLO] Detection failed: {e}")
@@ -170,14 +218,31 @@ def _analyze_person_visibility(persons: List[Dict[str, Any]], img_h: int) -> Dic
         return {"visibility": "仅头肩", "detail": f"人物检测框占画面高度约{height_ratio*100:.0f}%，推测为头肩或局部"}
 
 
-def run_detection(image_bytes: bytes) -> Dict[str, Any]:
+def run_detection(
+    image: Union[bytes, DecodedImage],
+    preview_side: Optional[int] = None,
+    profile: Optional[str] = None
+) -> Dict[str, Any]:
     """
     主检测入口
-    优先使用 YOLO（如已安装），否则回退到 HOG
+    按检测档位的引擎顺序尝试 ONNX Runtime 引擎（已配置模型时）/ YOLO（如已安装），都不可用时回退到 HOG
+
+    Args:
+        image: 共享的 DecodedImage（兼容直接传入图片字节）
+        preview_side: 指定时在该尺寸的低分辨率预览上检测（快速模式，不做全尺寸解码）
+        profile: 检测档位 fast / balanced / accurate（默认取环境变量 DETECTION_PROFILE）
     """
+    if profile not in DETECTION_PROFILES:
+        profile = DETECTION_PROFILE
+    config = DETECTION_PROFILES[profile]
     try:
-        bgr = _decode_to_bgr(image_bytes)
-        dims = _get_image_dimensions(image_bytes)
+        image = as_decoded(image)
+        # 触发像素解码（结果缓存），解码失败时在此提前返回
+        if preview_side:
+            image.preview(preview_side)
+        else:
+            image.rgb
+        dims = image.dims
         h, w = dims["height"], dims["width"]
     except Exception as e:
         # 图片解码失败，返回空结果
@@ -191,26 +256,32 @@ def run_detection(image_bytes: bytes) -> Dict[str, Any]:
             "_error": str(e)
         }
 
-    try:
-        # 优先尝试 YOLO
-        yolo = _try_yolo_detect(bgr)
-        if yolo is not None:
-            # 添加参照物筛选
-            yolo["reference_objects"] = [
-                o for o in yolo["objects"] 
-                if o["label"] in COCO_REFERENCE_HINTS
-            ]
-            # 添加人物可见性分析
-            yolo["person_visibility"] = _analyze_person_visibility(yolo["persons"], h)
-            yolo["image_dims"] = dims
-            return yolo
-    except Exception as e:
-        # YOLO 检测失败，继续尝试 HOG
-        pass
+    for engine in config["engines"]:
+        try:
+            if engine == "onnx":
+                result = _try_onnx_detect(image, preview_side)
+            elif engine == "yolo":
+                result = _try_yolo_detect(image, preview_side, config["yolo_imgsz"])
+            else:
+                continue
+            if result is not None:
+                # 添加参照物筛选
+                result["reference_objects"] = [
+                    o for o in result["objects"] 
+                    if o["label"] in COCO_REFERENCE_HINTS
+                ]
+                # 添加人物可见性分析
+                result["person_visibility"] = _analyze_person_visibility(result["persons"], h)
+                result["image_dims"] = dims
+                result["profile"] = profile
+                return result
+        except Exception as e:
+            # 检测失败，继续尝试下一个引擎
+            pass
 
     try:
         # 回退到 HOG（仅检测人物）
-        persons = _hog_person_detect(bgr)
+        persons = _hog_person_detect(image, preview_side, config)
         
         return {
             "engine": "hog",
@@ -219,6 +290,7 @@ def run_detection(image_bytes: bytes) -> Dict[str, Any]:
             "reference_objects": [],
             "person_visibility": _analyze_person_visibility(persons, h),
             "image_dims": dims,
+            "profile": profile,
         }
     except Exception as e:
         # HOG 检测也失败，返回空结果
@@ -0,0 +1,83 @@
+# server/executors.py
+"""
+本地 CPU 密集阶段（EXIF/模糊度/噪声/HOG/YOLO）的执行池
+避免阻塞事件循环，并与 OpenCV 自身的线程池协调线程数
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+import cv2
+
+CPU_COUNT = os.cpu_count() or 1
+
+# thread: OpenCV/NumPy/PIL 大部分运算会释放 GIL，线程池开销最小（默认）
+# process: 完全隔离 GIL，适合纯 Python 计算较多或多核机器
+LOCAL_EXECUTOR = os.getenv("LOCAL_EXECUTOR", "thread").lower()
+
+# 默认与 CPU 核数一致，保证 credibility 与 detection 两个阶段能同时运行
+LOCAL_WORKERS = int(os.getenv("LOCAL_WORKERS", str(max(2, CPU_COUNT))))
+
+# 每个 worker 内 OpenCV 可用的线程数：核数按 worker 平分，避免超额订阅
+# 例如 2 vCPU + 2 worker -> 每个 worker 1 个 OpenCV 线程，事件循环仍有调度余量
+OPENCV_THREADS = int(os.getenv("OPENCV_THREADS", str(max(1, CPU_COUNT // LOCAL_WORKERS))))
+
+_executor: Optional[Executor] = None
+# 已提交但尚未完成的任务数（用于估算排队深度）
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+def _init_worker_process() -> None:
+    """子进程初始化：限制 OpenCV 线程数，并在子进程内加载检测模型"""
+    cv2.setNumThreads(OPENCV_THREADS)
+    from model_registry import init_models
+    init_models()
+
+
+def init_executor() -> Executor:
+    """创建（或返回已存在的）本地分析执行池"""
+    global _executor
+    if _executor is None:
+        if LOCAL_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(
+                max_workers=LOCAL_WORKERS,
+                initializer=_init_worker_process,
+            )
+        else:
+            # 线程模式下 OpenCV 线程池为进程级共享，直接在主进程设置
+            cv2.setNumThreads(OPENCV_THREADS)
+            _executor = ThreadPoolExecutor(
+                max_workers=LOCAL_WORKERS,
+                thread_name_prefix="local-stage",
+            )
+    return _executor
+
+
+def shutdown_executor() -> None:
+    """关闭执行池（应用退出时调用）"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def local_queue_depth() -> int:
+    """执行池中排队等待 worker 的任务数（未完成任务数超出 worker 数的部分）"""
+    return max(0, _pending - LOCAL_WORKERS)
+
+
+async def run_cpu(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """在执行池中运行 CPU 密集函数，不阻塞事件循环"""
+    global _pending
+    loop = asyncio.get_running_loop()
+    with _pending_lock:
+        _pending += 1
+    try:
+        return await loop.run_in_executor(init_executor(), partial(func, *args, **kwargs))
+    finally:
+        with _pending_lock:
+            _pending -= 1
@@ -0,0 +1,99 @@
+# server/face_detector.py
+"""
+本地人脸检测：OpenCV DNN（YuNet，cv2.FaceDetectorYN）默认 + Haar 级联回退
+检测器实例由 model_registry 的实例池管理；与 run_detection 并行运行，完成后再与人物框关联，
+供 llm_image 生成发送给模型的人物区域裁剪
+"""
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import cv2
+
+from image_artifact import DecodedImage
+from model_registry import get_pool
+
+# 检测输入长边（YuNet 按实际尺寸推理，越大越能检出小脸）
+FACE_MAX_SIDE = int(os.getenv("FACE_MAX_SIDE", "640"))
+# 级联检测的最小人脸边长（检测输入上的像素）
+_CASCADE_MIN_FACE = 20
+
+
+class YuNetFaceDetector:
+    """
+    cv2.FaceDetectorYN 封装
+    每次推理前按输入尺寸 setInputSize，同一实例同一时刻只被一个线程使用（由实例池保证）
+    """
+
+    def __init__(self, model_path: str, conf: float = 0.6, nms: float = 0.3):
+        self.detector = cv2.FaceDetectorYN.create(
+            model_path, "", (FACE_MAX_SIDE, FACE_MAX_SIDE), conf, nms, 5000,
+            cv2.dnn.DNN_BACKEND_OPENCV, cv2.dnn.DNN_TARGET_CPU
+        )
+        self._size = (FACE_MAX_SIDE, FACE_MAX_SIDE)
+
+    def detect(self, rgb: np.ndarray) -> List[List[float]]:
+        """返回 [[x0, y0, x1, y1, score], ...]（输入图坐标）"""
+        h, w = rgb.shape[:2]
+        if (w, h) != self._size:
+            self.detector.setInputSize((w, h))
+            self._size = (w, h)
+        _, faces = self.detector.detect(cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR))
+        if faces is None:
+            return []
+        return [[float(x), float(y), float(x + fw), float(y + fh), float(score)]
+                for x, y, fw, fh, *_, score in faces]
+
+
+class CascadeFaceDetector:
+    """Haar 级联回退（OpenCV 自带模型文件，无置信度，固定记为 0.5）"""
+
+    def __init__(self, cascade_path: str):
+        self.cascade = cv2.CascadeClassifier(cascade_path)
+        if self.cascade.empty():
+            raise FileNotFoundError(cascade_path)
+
+    def detect(self, rgb: np.ndarray) -> List[List[float]]:
+        gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+        rects = self.cascade.detectMultiScale(
+            gray, scaleFactor=1.1, minNeighbors=5, minSize=(_CASCADE_MIN_FACE, _CASCADE_MIN_FACE)
+        )
+        return [[float(x), float(y), float(x + fw), float(y + fh), 0.5] for x, y, fw, fh in rects]
+
+
+def _owner(face: List[float], persons: List[Dict[str, Any]]) -> Optional[int]:
+    """人脸中心落在哪个人物框内（多个时取面积最小的）"""
+    cx, cy = (face[0] + face[2]) / 2, (face[1] + face[3]) / 2
+    owner, owner_area = None, None
+    for i, p in enumerate(persons):
+        x0, y0, x1, y1 = p["bbox"]
+        if x0 <= cx <= x1 and y0 <= cy <= y1:
+            area = (x1 - x0) * (y1 - y0)
+            if owner_area is None or area < owner_area:
+                owner, owner_area = i, area
+    return owner
+
+
+def detect_faces(image: DecodedImage, preview_side: Optional[int] = None) -> Dict[str, Any]:
+    """
+    返回 {"engine", "faces"}；faces 为 [{"bbox", "conf"}]（原图坐标）
+    两种检测器都不可用时 engine 为 None
+    """
+    side = min(preview_side, FACE_MAX_SIDE) if preview_side else FACE_MAX_SIDE
+    small, scale = image.preview(side) if preview_side else image.downscaled(side)
+    for engine in ("face_dnn", "face_cascade"):
+        pool = get_pool(engine)
+        if pool is None:
+            continue
+        with pool.acquire() as detector:
+            raw = detector.detect(small)
+        faces = [{"bbox": [int(round(v / scale)) for v in box], "conf": round(score, 3)} for *box, score in raw]
+        return {"engine": "yunet" if engine == "face_dnn" else "cascade", "faces": faces}
+    return {"engine": None, "faces": []}
+
+
+def attach_faces(det: Dict[str, Any], result: Dict[str, Any]) -> None:
+    """把人脸检测结果写入 det["faces"] / det["face_engine"]，person 为所属人物框的下标（不在任何人物框内时为 None）"""
+    persons = det.get("persons", [])
+    det["faces"] = [{**face, "person": _owner(face["bbox"], persons)} for face in result.get("faces", [])]
+    det["face_engine"] = result.get("engine")
@@ -0,0 +1,294 @@
+# server/forensic_triage.py
+"""
+仅读取文件头的取证预检（不做像素解码，通常几毫秒）
+- EXIF：Software / 相机型号 / UserComment（iOS 截图标记）
+- JPEG 量化表：按 IJG（libjpeg）标准表反推质量因子，判断编码器来源（libjpeg 系、Photoshop、相机厂商自定义表、疑似社交软件重压缩）
+- ICC 配置文件描述（如 Display P3、Adobe RGB）
+- XMP：CreatorTool、编辑历史（xmpMM:History）、Camera Raw / Lightroom 调整记录
+结果写入可信度模块，并给出 route：文件头已能判定为截图时，流水线跳过全尺寸解码走更便宜的路径
+"""
+import re
+import struct
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import ExifTags, Image, JpegImagePlugin
+
+from image_artifact import DecodedImage
+from screenshot_detector import PHONE_SCREEN_WIDTHS
+
+# 常见图片编辑软件（EXIF Software / XMP CreatorTool / 编辑历史中出现时视为编辑痕迹）
+EDITING_SOFTWARE = ["photoshop", "lightroom", "snapseed", "vsco",
+                    "美图", "meitu", "facetune", "picsart", "gimp"]
+
+# IJG 标准亮度 / 色度量化表（自然顺序，质量 50）
+_IJG_LUMA = np.array([
+    16, 11, 10, 16, 24, 40, 51, 61,
+    12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56,
+    14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77,
+    24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101,
+    72, 92, 95, 98, 112, 100, 103, 99,
+], dtype=np.int32)
+_IJG_CHROMA = np.array([
+    17, 18, 24, 47, 99, 99, 99, 99,
+    18, 21, 26, 66, 99, 99, 99, 99,
+    24, 26, 56, 99, 99, 99, 99, 99,
+    47, 66, 99, 99, 99, 99, 99, 99,
+] + [99] * 32, dtype=np.int32)
+
+
+def _ijg_tables(base: np.ndarray) -> np.ndarray:
+    """质量 1~100 对应的量化表，形状 (100, 64)"""
+    q = np.arange(1, 101)
+    scale = np.where(q < 50, 5000 // q, 200 - 2 * q)[:, None]
+    return np.clip((base[None, :] * scale + 50) // 100, 1, 255)
+
+
+_LUMA_BY_QUALITY = _ijg_tables(_IJG_LUMA)
+_CHROMA_BY_QUALITY = _ijg_tables(_IJG_CHROMA)
+
+# 社交/聊天软件重压缩的典型特征：IJG 标准表、质量不高、无 EXIF/ICC/XMP、长边缩放到固定值
+RECOMPRESS_MAX_QUALITY = 85
+RECOMPRESS_LONG_SIDES = {1080, 1280, 1440, 1920, 2048, 2560}
+
+_SUBSAMPLING = {0: "4:4:4", 1: "4:2:2", 2: "4:2:0"}
+_XMP_PREFIX = b"http://ns.adobe.com/xap/1.0/\x00"
+_EXIF_IFD = 0x8769
+_USER_COMMENT = 0x9286
+
+
+def _estimate_quality(tables: Dict[int, Any]) -> Dict[str, Any]:
+    """
+    按 IJG 标准表反推质量因子
+    返回 {"quality", "standard"}；standard 表示量化表与某个质量的 IJG 表完全一致（libjpeg 系编码器）
+    """
+    luma = np.asarray(tables.get(0, []), dtype=np.int32)
+    if luma.size != 64:
+        return {"quality": None, "standard": False}
+    diff = np.abs(_LUMA_BY_QUALITY - luma[None, :]).sum(axis=1)
+    chroma = np.asarray(tables.get(1, []), dtype=np.int32)
+    if chroma.size == 64:
+        diff = diff + np.abs(_CHROMA_BY_QUALITY - chroma[None, :]).sum(axis=1)
+    best = int(np.argmin(diff))
+    return {"quality": best + 1, "standard": bool(diff[best] == 0)}
+
+
+def _icc_description(icc: bytes) -> Optional[str]:
+    """读取 ICC 配置文件的 desc 标签（v2 为 ASCII，v4 为 mluc / UTF-16BE）"""
+    try:
+        count = struct.unpack(">I", icc[128:132])[0]
+        for i in range(min(count, 64)):
+            sig, offset, size = struct.unpack(">4sII", icc[132 + 12 * i: 144 + 12 * i])
+            if sig != b"desc":
+                continue
+            tag = icc[offset: offset + size]
+            if tag[:4] == b"desc":
+                length = struct.unpack(">I", tag[8:12])[0]
+                return tag[12: 12 + length].split(b"\x00")[0].decode("latin-1").strip() or None
+            if tag[:4] == b"mluc":
+                rec_len, rec_off = struct.unpack(">II", tag[20:28])
+                return tag[rec_off: rec_off + rec_len].decode("utf-16-be", "ignore").strip() or None
+    except (struct.error, UnicodeDecodeError):
+        pass
+    return None
+
+
+def _xmp_packet(pil: Image.Image) -> Optional[str]:
+    for marker, data in getattr(pil, "applist", []):
+        if marker == "APP1" and data.startswith(_XMP_PREFIX):
+            return data[len(_XMP_PREFIX):].decode("utf-8", "ignore")
+    for key in ("xmp", "XML:com.adobe.xmp"):
+        value = pil.info.get(key)
+        if value:
+            return value.decode("utf-8", "ignore") if isinstance(value, bytes) else str(value)
+    return None
+
+
+def _xmp_attr(xmp: str, name: str) -> List[str]:
+    """同时兼容属性写法 name="v" 和元素写法 <name>v</name>"""
+    pattern = rf'{name}="([^"]*)"|<{name}>([^<]*)</{name}>'
+    return [a or b for a, b in re.findall(pattern, xmp)]
+
+
+def _parse_xmp(xmp: str) -> Dict[str, Any]:
+    history = []
+    section = re.search(r"<xmpMM:History>(.*?)</xmpMM:History>", xmp, re.S)
+    if section:
+        # 每个 rdf:li 为一条编辑事件
+        for event in section.group(1).split("<rdf:li")[1:]:
+            action = next(iter(_xmp_attr(event, "stEvt:action")), None)
+            agent = next(iter(_xmp_attr(event, "stEvt:softwareAgent")), None)
+            history.append({"action": action, "software": agent})
+    return {
+        "creator_tool": next(iter(_xmp_attr(xmp, "xmp:CreatorTool")), None),
+        "history": history[-20:],
+        "photoshop_history": bool(_xmp_attr(xmp, "photoshop:History")),
+        "camera_raw": "crs:" in xmp,
+        "derived_from": "xmpMM:DerivedFrom" in xmp,
+        "screenshot": bool(re.search(r"UserComment.{0,200}?Screenshot", xmp, re.S)),
+    }
+
+
+def _png_chunks(data: memoryview) -> List[str]:
+    """PNG 像素数据（IDAT）之前的块类型；iDOT 为 Apple 截图/屏幕录制写入的私有块"""
+    chunks = []
+    pos = 8
+    while pos + 8 <= len(data) and len(chunks) < 64:
+        length, kind = struct.unpack(">I4s", data[pos: pos + 8])
+        if kind == b"IDAT":
+            break
+        chunks.append(kind.decode("latin-1"))
+        pos += 12 + length
+    return chunks
+
+
+def _header_exif(pil: Image.Image) -> Tuple[Dict[str, Any], Optional[str]]:
+    """只解析文件头中已有的 EXIF 块（PNG 等格式位于像素数据之后的 EXIF 不读取，避免解码）"""
+    raw = pil.info.get("exif")
+    if not raw:
+        return {}, None
+    exif = Image.Exif()
+    exif.load(raw)
+    tags = {ExifTags.TAGS.get(k, str(k)): v for k, v in exif.items()}
+    comment = exif.get_ifd(_EXIF_IFD).get(_USER_COMMENT)
+    if isinstance(comment, bytes):
+        # 前 8 字节为字符集标识
+        comment = comment[8:].decode("utf-8", "ignore")
+    return tags, (str(comment).strip("\x00 ") or None) if comment else None
+
+
+def _encoder(fmt: str, jpeg: Optional[Dict[str, Any]], markers: List[str], camera: Optional[str],
+             bare: bool, long_side: int) -> Optional[str]:
+    if fmt != "JPEG" or jpeg is None:
+        return None
+    if "photoshop" in markers:
+        return "Adobe Photoshop"
+    if jpeg["standard"]:
+        if camera:
+            return f"libjpeg 兼容（{camera}）"
+        if bare and jpeg["quality"] <= RECOMPRESS_MAX_QUALITY and long_side in RECOMPRESS_LONG_SIDES:
+            return "疑似社交/聊天软件重压缩（如微信）"
+        return "libjpeg（IJG 标准量化表）"
+    if camera:
+        return f"{camera} 自定义量化表"
+    if "adobe" in markers:
+        return "Adobe 系编码器（非 IJG 量化表）"
+    return "非 IJG 标准量化表（编码器未知）"
+
+
+def forensic_triage(image: DecodedImage) -> Dict[str, Any]:
+    """
+    返回 {"format", "dims", "file_bytes", "software", "camera", "jpeg", "icc", "xmp",
+          "encoder", "editing", "screenshot", "signals", "route", "elapsed_ms"}
+    screenshot: high（文件头带截图标记）/ medium（PNG、无相机信息、手机屏幕尺寸）/ none
+    route: screenshot（文件头已判定为截图，可走廉价路径）/ full
+    """
+    t0 = time.perf_counter()
+    pil = image.pil
+    fmt = pil.format or "unknown"
+    w, h = pil.size
+    tags, user_comment = _header_exif(pil)
+    make, model = tags.get("Make"), tags.get("Model")
+    camera = f"{make or ''} {model or ''}".strip() or None
+    software = str(tags["Software"]).strip("\x00 ") if tags.get("Software") else None
+
+    markers = []
+    for marker, data in getattr(pil, "applist", []):
+        if marker == "APP13" and data.startswith(b"Photoshop 3.0"):
+            markers.append("photoshop")
+        elif marker == "APP14" and data.startswith(b"Adobe"):
+            markers.append("adobe")
+
+    jpeg = None
+    if fmt == "JPEG" and getattr(pil, "quantization", None):
+        jpeg = {
+            **_estimate_quality(pil.quantization),
+            "tables": len(pil.quantization),
+            "subsampling": _SUBSAMPLING.get(JpegImagePlugin.get_sampling(pil)),
+            "progressive": bool(pil.info.get("progressive") or pil.info.get("progression")),
+        }
+
+    icc_bytes = pil.info.get("icc_profile")
+    icc = {"description": _icc_description(icc_bytes), "bytes": len(icc_bytes)} if icc_bytes else None
+    xmp_text = _xmp_packet(pil)
+    xmp = _parse_xmp(xmp_text) if xmp_text else None
+
+    bare = not tags and icc is None and xmp is None
+    encoder = _encoder(fmt, jpeg, markers, camera, bare, max(w, h))
+
+    signals: List[str] = []
+    editing: List[str] = []
+    if jpeg is not None:
+        table = "IJG 标准量化表" if jpeg["standard"] else "非标准量化表，质量为近似值"
+        signals.append(f"JPEG 量化表估计质量约 {jpeg['quality']}（{table}，色度采样 {jpeg['subsampling'] or '未知'}）")
+    if encoder:
+        signals.append(f"编码器：{encoder}")
+    if "photoshop" in markers:
+        editing.append("JPEG 带 Photoshop（APP13）资源块")
+    tools = [software]
+    if xmp:
+        tools += [xmp["creator_tool"]] + [e["software"] for e in xmp["history"]]
+    for tool in dict.fromkeys(t for t in tools if t):
+        if any(kw in tool.lower() for kw in EDITING_SOFTWARE):
+            editing.append(f"软件标记包含 '{tool}'")
+    if xmp:
+        actions = [e["action"] for e in xmp["history"] if e["action"]]
+        if actions:
+            signals.append(f"XMP 编辑历史 {len(actions)} 条（{'、'.join(dict.fromkeys(actions))}）")
+        if xmp["camera_raw"]:
+            editing.append("XMP 含 Camera Raw / Lightroom 调整参数")
+        if xmp["photoshop_history"]:
+            editing.append("XMP 含 Photoshop 操作历史")
+        if xmp["derived_from"]:
+            signals.append("XMP 记录了派生来源（由其他文件导出）")
+    if icc and icc["description"]:
+        signals.append(f"ICC 配置文件：{icc['description']}")
+
+    short, long = min(w, h), max(w, h)
+    marked = "screenshot" in (user_comment or "").lower() or bool(xmp and xmp["screenshot"])
+    apple_chunk = fmt == "PNG" and "iDOT" in _png_chunks(image.image_bytes)
+    screen_sized = short in PHONE_SCREEN_WIDTHS and 1.7 <= long / short <= 2.3
+    if marked:
+        screenshot = "high"
+        signals.append("元数据带截图标记（iOS 截图写入的 UserComment/XMP）")
+    elif apple_chunk and not camera:
+        screenshot = "high"
+        signals.append("PNG 含 Apple 截图私有块（iDOT）")
+    elif fmt == "PNG" and not camera and screen_sized:
+        screenshot = "medium"
+        signals.append(f"PNG、无相机信息且尺寸 {w}x{h} 与手机屏幕一致")
+    else:
+        screenshot = "none"
+
+    return {
+        "format": fmt,
+        "dims": {"width": w, "height": h},
+        "file_bytes": len(image.image_bytes),
+        "software": software,
+        "camera": camera,
+        "jpeg": jpeg,
+        "icc": icc,
+        "xmp": xmp,
+        "encoder": encoder,
+        "editing": editing,
+        "screenshot": screenshot,
+        "signals": signals,
+        "route": "screenshot" if screenshot != "none" else "full",
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2),
+    }
+
+
+def triage_summary(triage: Dict[str, Any]) -> Dict[str, Any]:
+    """写入 LLM 上下文和 _meta 的精简版本"""
+    return {
+        "route": triage.get("route"),
+        "screenshot": triage.get("screenshot"),
+        "encoder": triage.get("encoder"),
+        "jpeg_quality": (triage.get("jpeg") or {}).get("quality"),
+        "editing": len(triage.get("editing") or []),
+        "elapsed_ms": triage.get("elapsed_ms"),
+    }
@@ -0,0 +1,222 @@
+# server/image_artifact.py
+"""
+单次解码的共享图片对象
+每个请求只创建一个 DecodedImage，在 credibility_module / run_detection 之间共享，
+PIL 句柄、RGB/BGR/灰度数组、缩放金字塔、尺寸和 EXIF 都按需计算并缓存
+缩放金字塔先由全尺寸图生成一个长边 PYRAMID_BASE_SIDE 的基准层，较小的层都从基准层缩放，
+各阶段（检测/质量指标/截图检测）共享一次全尺寸缩放
+上传内容以只读 memoryview 共享，解码时直接从该缓冲区读取，不再复制整份字节
+每个缓存项有独立的锁：并行的阶段各自生成不同的缓存项时互不阻塞，同一项只计算一次
+
+进程池模式（LOCAL_EXECUTOR=process）下每次提交都会把原始字节序列化到子进程，
+子进程按图片 id 保留最近 PROCESS_IMAGE_CACHE 个图片对象，同一请求落到同一子进程的各阶段共享解码结果；
+因此“只解码一次”在进程池模式下为每个子进程各一次，线程池模式（默认）下为整个请求一次
+"""
+import io
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple, Union
+
+import numpy as np
+import cv2
+from PIL import Image
+
+
+# 图片原始数据：bytes 或上传时读入的单一缓冲区（memoryview）
+Buffer = Union[bytes, bytearray, memoryview]
+
+# 缩放金字塔基准层的长边（不小于各阶段使用的最大缩放尺寸）
+PYRAMID_BASE_SIDE = int(os.getenv("PYRAMID_BASE_SIDE", "2048"))
+# 进程池子进程内保留的图片对象数（按最近使用淘汰）
+PROCESS_IMAGE_CACHE = int(os.getenv("PROCESS_IMAGE_CACHE", "2"))
+
+# 子进程内按图片 id 复用的图片对象（仅在反序列化时使用；子进程单线程执行任务）
+_worker_images: "OrderedDict[str, DecodedImage]" = OrderedDict()
+
+
+class _BufferReader(io.RawIOBase):
+    """memoryview 上的只读文件对象；io.BytesIO 对非 bytes 对象会复制整个缓冲区"""
+
+    def __init__(self, buffer: memoryview):
+        self._buffer = buffer
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = max(0, min(len(b), len(self._buffer) - self._pos))
+        b[:n] = self._buffer[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._buffer)
+        self._pos = max(0, offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+
+class DecodedImage:
+    """
+    按需解码的图片对象（线程安全）
+
+    - pil: 仅读取文件头的 PIL 句柄（不持有像素数据）
+    - rgb / bgr / gray: 全分辨率数组，首次访问时解码
+    - downscaled(max_side): 长边不超过 max_side 的缩放版本（金字塔缓存）
+    - gray_f32(max_side): 金字塔对应层的 float32 灰度图（质量指标使用）
+    - preview(max_side): 不做全尺寸解码的低分辨率预览（快速模式）
+    - dims / exif: 来自文件头，无需像素解码
+    - image_bytes: 原始数据的只读 memoryview（哈希、base64 等可直接使用）
+    - release(): 本地分析结束后释放像素缓存
+    """
+
+    def __init__(self, image_bytes: Buffer):
+        self.image_bytes = memoryview(image_bytes).cast("B").toreadonly()
+        self.image_id = uuid.uuid4().hex
+        # _lock 只保护锁表，耗时计算在各缓存项自己的锁内进行
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Any, threading.Lock] = {}
+        self._cache: Dict[Any, Any] = {}
+
+    # 进程池传递时只序列化原始字节和图片 id，缓存和锁在子进程内重建
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"image_bytes": self.image_bytes.tobytes(), "image_id": self.image_id}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        image_id = state["image_id"]
+        shared = _worker_images.get(image_id)
+        if shared is None:
+            self.__init__(state["image_bytes"])
+            self.image_id = image_id
+            if PROCESS_IMAGE_CACHE > 0:
+                _worker_images[image_id] = self
+                while len(_worker_images) > PROCESS_IMAGE_CACHE:
+                    _worker_images.popitem(last=False)
+            return
+        # 同一子进程已处理过该图片：共享原始数据、锁和缓存，不再重复解码
+        _worker_images.move_to_end(image_id)
+        self.image_bytes = shared.image_bytes
+        self.image_id = image_id
+        self._lock = shared._lock
+        self._key_locks = shared._key_locks
+        self._cache = shared._cache
+
+    def release(self) -> None:
+        """释放解码后的数组和缩放金字塔（原始数据保留，之后再访问会重新解码）"""
+        self._cache.clear()
+
+    def open(self) -> Image.Image:
+        """在共享缓冲区上打开新的 PIL 句柄（不复制原始数据）"""
+        return Image.open(_BufferReader(self.image_bytes))
+
+    def _cached(self, key: Any, compute: Callable[[], Any]) -> Any:
+        value = self._cache.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            lock = self._key_locks.setdefault(key, threading.Lock())
+        # 缓存项之间的依赖（缩放层 -> 基准层 -> 全尺寸 -> 解码）无环，按键加锁不会死锁
+        with lock:
+            value = self._cache.get(key)
+            if value is None:
+                value = compute()
+                self._cache[key] = value
+            return value
+
+    @property
+    def pil(self) -> Image.Image:
+        """PIL 句柄（Image.open 为惰性读取，只解析文件头）"""
+        return self._cached("pil", self.open)
+
+    @property
+    def dims(self) -> Dict[str, int]:
+        pil = self.pil
+        return {"width": pil.width, "height": pil.height}
+
+    @property
+    def exif(self) -> Image.Exif:
+        def compute():
+            # 用独立句柄读取 EXIF：部分格式（如 PNG）需要加载数据才能拿到 EXIF
+            with self.open() as img:
+                return img.getexif()
+        return self._cached("exif", compute)
+
+    @property
+    def rgb(self) -> np.ndarray:
+        def compute():
+            # 使用临时句柄解码，解码完成后释放 PIL 内部缓冲区，只保留一份数组
+            with self.open() as img:
+                return np.asarray(img.convert("RGB"))
+        return self._cached("rgb", compute)
+
+    @property
+    def bgr(self) -> np.ndarray:
+        return self._cached("bgr", lambda: cv2.cvtColor(self.rgb, cv2.COLOR_RGB2BGR))
+
+    @property
+    def gray(self) -> np.ndarray:
+        return self._cached("gray", lambda: cv2.cvtColor(self.rgb, cv2.COLOR_RGB2GRAY))
+
+    def downscaled(self, max_side: int, kind: str = "rgb") -> Tuple[np.ndarray, float]:
+        """
+        返回 (缩放后的数组, 缩放比例)
+        长边不超过 max_side 时直接返回原图，比例为 1.0
+        """
+        def compute():
+            src = getattr(self, kind)
+            h, w = src.shape[:2]
+            if max(h, w) <= max_side:
+                return src, 1.0
+            scale = max_side / max(h, w)
+            size = (int(w * scale), int(h * scale))
+            if max_side < PYRAMID_BASE_SIDE < max(h, w):
+                # 从基准层缩放，不再读取全尺寸数组；目标尺寸仍按原图计算，与直接缩放一致
+                src = self.downscaled(PYRAMID_BASE_SIDE, kind)[0]
+            small = cv2.resize(src, size, interpolation=cv2.INTER_AREA)
+            return small, scale
+        return self._cached(("pyramid", kind, max_side), compute)
+
+    def gray_f32(self, max_side: int) -> Tuple[np.ndarray, float]:
+        """返回 (长边不超过 max_side 的 float32 灰度图, 缩放比例)，由 RGB 金字塔对应层转换"""
+        def compute():
+            rgb, scale = self.downscaled(max_side)
+            gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+            return gray.astype(np.float32), scale
+        return self._cached(("pyramid", "gray_f32", max_side), compute)
+
+    def preview(self, max_side: int) -> Tuple[np.ndarray, float]:
+        """
+        返回 (长边不超过 max_side 的 RGB 预览, 缩放比例)
+        不做全尺寸解码：JPEG 用 draft 模式在 DCT 阶段按 1/2~1/8 缩小解码，
+        全尺寸数组已解码时直接复用缩放金字塔
+        """
+        if "rgb" in self._cache:
+            return self.downscaled(max_side)
+
+        def compute():
+            with self.open() as img:
+                width = img.width
+                img.draft("RGB", (max_side, max_side))
+                img = img.convert("RGB")
+                if max(img.size) > max_side:
+                    img.thumbnail((max_side, max_side), Image.Resampling.BILINEAR)
+                return np.asarray(img), img.width / width
+        return self._cached(("preview", max_side), compute)
+
+
+def as_decoded(image: Union[Buffer, DecodedImage]) -> DecodedImage:
+    """兼容旧接口：传入 bytes/memoryview 时包装为 DecodedImage"""
+    if isinstance(image, DecodedImage):
+        return image
+    return DecodedImage(image)
@@ -0,0 +1,98 @@
+# server/image_quality.py
+"""
+单遍图像质量指标
+在共享金字塔中固定分辨率（长边 QUALITY_MAX_SIDE）的 float32 灰度层上一次算出：
+模糊度（Laplacian 方差）、噪声（高频残差标准差）、亮度直方图与曝光、高光/暗部裁切比例、饱和度统计
+所有指标都在同一分辨率上计算，不同像素数的图片之间可直接比较，耗时与原图像素数无关
+"""
+import os
+from typing import Any, Dict, Optional
+
+import numpy as np
+import cv2
+
+from image_artifact import DecodedImage
+
+QUALITY_MAX_SIDE = int(os.getenv("QUALITY_MAX_SIDE", "1024"))
+
+# 直方图输出的区间数（内部统计仍按 256 级）
+HISTOGRAM_BINS = 16
+# 灰度 <= CLIP_LOW 或 >= CLIP_HIGH 视为暗部/高光裁切
+CLIP_LOW = 2
+CLIP_HIGH = 253
+# 饱和度（HSV S 通道）>= SATURATION_CLIP 视为饱和溢出
+SATURATION_CLIP = 250
+
+
+def _percentile(cdf: np.ndarray, q: float) -> int:
+    """累计直方图上的分位数（灰度级）"""
+    return int(np.searchsorted(cdf, q * cdf[-1]))
+
+
+def _exposure_label(mean: float, shadows: float, highlights: float) -> str:
+    if highlights >= 0.05 or mean > 200:
+        return "过曝"
+    if shadows >= 0.2 or mean < 50:
+        return "欠曝"
+    return "正常"
+
+
+def quality_metrics(image: DecodedImage, preview_side: Optional[int] = None) -> Dict[str, Any]:
+    """
+    返回 {"blur", "noise", "exposure", "clipping", "saturation", "analysis_size"}
+    preview_side: 指定时在不做全尺寸解码的预览上计算（快速模式），分辨率为 min(preview_side, QUALITY_MAX_SIDE)
+    """
+    if preview_side:
+        rgb = image.preview(preview_side)[0]
+        if max(rgb.shape[:2]) > QUALITY_MAX_SIDE:
+            h, w = rgb.shape[:2]
+            s = QUALITY_MAX_SIDE / max(h, w)
+            rgb = cv2.resize(rgb, (int(w * s), int(h * s)), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY).astype(np.float32)
+    else:
+        rgb = image.downscaled(QUALITY_MAX_SIDE)[0]
+        gray = image.gray_f32(QUALITY_MAX_SIDE)[0]
+
+    # 模糊度：Laplacian 方差（float32 输出，meanStdDev 单遍统计，不生成平方临时数组）
+    _, lap_std = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_32F))
+    # 噪声：与 5x5 高斯模糊的残差标准差（残差原地计算）
+    residual = cv2.GaussianBlur(gray, (5, 5), 0)
+    cv2.subtract(gray, residual, dst=residual)
+    _, noise_std = cv2.meanStdDev(residual)
+
+    # 亮度直方图 / 曝光 / 裁切
+    hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel().astype(np.float64)
+    total = hist.sum()
+    cdf = np.cumsum(hist)
+    mean = float(np.dot(hist, np.arange(256)) / total)
+    shadows = float(hist[:CLIP_LOW + 1].sum() / total)
+    highlights = float(hist[CLIP_HIGH:].sum() / total)
+    coarse = hist.reshape(HISTOGRAM_BINS, -1).sum(axis=1) / total
+
+    # 饱和度：HSV S 通道
+    sat = cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV)[..., 1]
+    sat_hist = np.bincount(sat.ravel(), minlength=256)
+    sat_cdf = np.cumsum(sat_hist)
+
+    return {
+        "blur": round(float(lap_std[0, 0]) ** 2, 2),
+        "noise": round(float(noise_std[0, 0]), 3),
+        "exposure": {
+            "label": _exposure_label(mean, shadows, highlights),
+            "mean": round(mean, 1),
+            "p1": _percentile(cdf, 0.01),
+            "p50": _percentile(cdf, 0.5),
+            "p99": _percentile(cdf, 0.99),
+            "histogram": [round(float(v), 4) for v in coarse],
+        },
+        "clipping": {
+            "shadows": round(shadows, 4),
+            "highlights": round(highlights, 4),
+        },
+        "saturation": {
+            "mean": round(float(np.dot(sat_hist, np.arange(256)) / sat.size), 1),
+            "p95": _percentile(sat_cdf, 0.95),
+            "clipped": round(float(sat_hist[SATURATION_CLIP:].sum() / sat.size), 4),
+        },
+        "analysis_size": [int(gray.shape[1]), int(gray.shape[0])],
+    }
@@ -0,0 +1,506 @@
+# server/jobs.py
+"""
+异步分析任务
+POST /api/jobs 立即返回任务 id，后台 worker 执行分析，客户端轮询 GET /api/jobs/{id}
+或在提交时给出 webhook_url，任务结束后由服务端回调
+（webhook 仅允许白名单主机，回调前解析 DNS 并拒绝内网/回环/链路本地地址，使用独立的短超时客户端）
+
+队列后端：
+- memory（默认）：进程内队列，API 与 worker 在同一进程
+- redis：任何 Redis 协议兼容的服务（Redis/KeyDB/Valkey 等），
+  API 进程（JOB_WORKERS=0）与独立 worker 进程（python jobs.py）可分别扩容；
+  worker 取任务时用 BLMOVE 原子移入自己的处理中列表，完成后再移除，
+  worker 崩溃（心跳超过 JOB_VISIBILITY_TIMEOUT 未刷新）后由其他 worker 的回收任务放回队列
+"""
+import asyncio
+import ipaddress
+import json
+import os
+import socket
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+if __name__ == "__main__":
+    # 作为独立 worker 运行时，须在导入本地模块、读取下方配置之前加载 .env
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=Path(__file__).parent / ".env")
+
+from admission import AdmissionRejected
+from image_artifact import Buffer
+from result_cache import analyze_with_cache, flush_phash_index
+
+JOB_BACKEND = os.getenv("JOB_BACKEND", "memory").lower()
+JOB_REDIS_URL = os.getenv("JOB_REDIS_URL", "redis://localhost:6379/0")
+JOB_REDIS_PREFIX = os.getenv("JOB_REDIS_PREFIX", "hodoyodo:")
+# 当前进程内的 worker 数；API 与 worker 分开部署时 API 进程设为 0
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# 排队中任务数上限，超出时提交返回 429
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "1000"))
+# 任务记录（含结果）保留时长（秒）
+JOB_TTL = int(os.getenv("JOB_TTL", str(24 * 3600)))
+# worker 心跳超时（秒）：超过该时间未刷新心跳的 worker 视为崩溃，其处理中的任务重新入队
+JOB_VISIBILITY_TIMEOUT = int(os.getenv("JOB_VISIBILITY_TIMEOUT", "60"))
+# 同一任务最多被执行的次数（worker 反复崩溃时不再重试，标记为失败）
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# webhook 目标主机白名单（逗号分隔；*.example.com 匹配子域名，* 允许任意公网主机），为空时不接受 webhook_url
+JOB_WEBHOOK_ALLOWED_HOSTS = [
+    h.strip().lower() for h in os.getenv("JOB_WEBHOOK_ALLOWED_HOSTS", "").split(",") if h.strip()
+]
+JOB_WEBHOOK_TIMEOUT = float(os.getenv("JOB_WEBHOOK_TIMEOUT", "5"))
+JOB_WEBHOOK_RETRIES = int(os.getenv("JOB_WEBHOOK_RETRIES", "3"))
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed")
+
+
+class JobQueueFull(Exception):
+    """任务队列已满"""
+
+
+class WebhookRejected(Exception):
+    """webhook_url 不允许回调（未启用、主机不在白名单或解析到非公网地址）"""
+
+
+def new_job(
+    mime: str,
+    target_gender: str,
+    llm_dispatch: Optional[str],
+    webhook_url: Optional[str]
+) -> Dict[str, Any]:
+    return {
+        "job_id": uuid.uuid4().hex,
+        "status": "queued",
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "attempts": 0,
+        "mime": mime,
+        "target_gender": target_gender,
+        "llm_dispatch": llm_dispatch,
+        "webhook_url": webhook_url,
+        "webhook": None,
+        "result": None,
+        "error": None,
+    }
+
+
+def public_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """返回给客户端的任务信息（去掉内部字段，未完成时不含 result）"""
+    view = {k: v for k, v in job.items() if k not in ("mime", "webhook_url")}
+    if job["status"] != "succeeded":
+        view.pop("result", None)
+    return view
+
+
+class MemoryJobBackend:
+    """进程内任务存储与队列"""
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._images: Dict[str, Buffer] = {}
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    def _prune(self) -> None:
+        cutoff = time.time() - JOB_TTL
+        for job_id in [k for k, j in self._jobs.items() if j["finished_at"] and j["finished_at"] < cutoff]:
+            del self._jobs[job_id]
+
+    async def submit(self, job: Dict[str, Any], image_bytes: Buffer) -> None:
+        if self._queue.qsize() >= JOB_QUEUE_MAX:
+            raise JobQueueFull()
+        self._prune()
+        self._jobs[job["job_id"]] = job
+        self._images[job["job_id"]] = image_bytes
+        self._queue.put_nowait(job["job_id"])
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    async def update(self, job_id: str, **fields: Any) -> None:
+        if job_id in self._jobs:
+            self._jobs[job_id].update(fields)
+
+    async def requeue(self, job_id: str, worker: str) -> None:
+        self._queue.put_nowait(job_id)
+
+    async def next_job(self, timeout: float, worker: str) -> Optional[str]:
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    # 进程内队列随进程一起丢失，不需要处理中列表和回收
+    async def ack(self, job_id: str, worker: str) -> None:
+        pass
+
+    async def heartbeat(self, workers: List[str]) -> None:
+        pass
+
+    async def reap(self) -> int:
+        return 0
+
+    async def load_image(self, job_id: str) -> Optional[Buffer]:
+        return self._images.get(job_id)
+
+    async def drop_image(self, job_id: str) -> None:
+        self._images.pop(job_id, None)
+
+    async def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisJobBackend:
+    """
+    Redis 协议兼容的任务存储与队列
+    - {prefix}job:{id}        任务记录（JSON）
+    - {prefix}job:{id}:image  图片字节（任务结束后删除）
+    - {prefix}jobs:queue      待处理任务 id 列表
+    - {prefix}jobs:processing:{worker}  该 worker 已取出、尚未完成的任务 id
+    - {prefix}jobs:worker:{worker}      worker 心跳（过期时间 JOB_VISIBILITY_TIMEOUT）
+    """
+
+    def __init__(self, url: str, prefix: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("JOB_BACKEND=redis requires the 'redis' package (pip install redis)")
+        self._redis = redis.from_url(url)
+        self._prefix = prefix
+        self._queue_key = f"{prefix}jobs:queue"
+        self._processing_prefix = f"{prefix}jobs:processing:"
+
+    def _processing_key(self, worker: str) -> str:
+        return f"{self._processing_prefix}{worker}"
+
+    def _heartbeat_key(self, worker: str) -> str:
+        return f"{self._prefix}jobs:worker:{worker}"
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self._prefix}job:{job_id}"
+
+    async def submit(self, job: Dict[str, Any], image_bytes: Buffer) -> None:
+        if await self._redis.llen(self._queue_key) >= JOB_QUEUE_MAX:
+            raise JobQueueFull()
+        key = self._job_key(job["job_id"])
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.set(key, json.dumps(job, ensure_ascii=False), ex=JOB_TTL)
+            pipe.set(f"{key}:image", image_bytes, ex=JOB_TTL)
+            pipe.rpush(self._queue_key, job["job_id"])
+            await pipe.execute()
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raw = await self._redis.get(self._job_key(job_id))
+        return json.loads(raw) if raw is not None else None
+
+    async def update(self, job_id: str, **fields: Any) -> None:
+        # 同一任务同一时刻只有一个 worker 在写，读-改-写即可
+        job = await self.get(job_id)
+        if job is None:
+            return
+        job.update(fields)
+        await self._redis.set(self._job_key(job_id), json.dumps(job, ensure_ascii=False), ex=JOB_TTL)
+
+    async def requeue(self, job_id: str, worker: str) -> None:
+        """从处理中列表放回队列尾部（同一事务内完成，不会丢失）"""
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.lrem(self._processing_key(worker), 1, job_id)
+            pipe.rpush(self._queue_key, job_id)
+            await pipe.execute()
+
+    async def next_job(self, timeout: float, worker: str) -> Optional[str]:
+        """取出队首任务并原子移入该 worker 的处理中列表（需要 Redis 6.2+ 的 BLMOVE）"""
+        job_id = await self._redis.blmove(
+            self._queue_key, self._processing_key(worker), max(1, int(timeout)), "LEFT", "RIGHT"
+        )
+        if job_id is None:
+            return None
+        return job_id.decode() if isinstance(job_id, bytes) else job_id
+
+    async def ack(self, job_id: str, worker: str) -> None:
+        """任务已结束（成功/失败），从处理中列表移除"""
+        await self._redis.lrem(self._processing_key(worker), 1, job_id)
+
+    async def heartbeat(self, workers: List[str]) -> None:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for worker in workers:
+                pipe.set(self._heartbeat_key(worker), int(time.time()), ex=JOB_VISIBILITY_TIMEOUT)
+            await pipe.execute()
+
+    async def reap(self) -> int:
+        """
+        心跳已过期的 worker：处理中列表里的任务逐个用 LMOVE 放回队首
+        LMOVE 为原子操作，多个进程同时回收时每个任务只会被放回一次
+        """
+        reaped = 0
+        async for key in self._redis.scan_iter(match=f"{self._processing_prefix}*"):
+            key = key.decode() if isinstance(key, bytes) else key
+            worker = key[len(self._processing_prefix):]
+            if await self._redis.exists(self._heartbeat_key(worker)):
+                continue
+            while await self._redis.lmove(key, self._queue_key, "RIGHT", "LEFT") is not None:
+                reaped += 1
+        return reaped
+
+    async def load_image(self, job_id: str) -> Optional[Buffer]:
+        return await self._redis.get(f"{self._job_key(job_id)}:image")
+
+    async def drop_image(self, job_id: str) -> None:
+        await self._redis.delete(f"{self._job_key(job_id)}:image")
+
+    async def queue_depth(self) -> int:
+        return await self._redis.llen(self._queue_key)
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+_backend: Optional[Any] = None
+_workers: List[asyncio.Task] = []
+
+
+def get_job_backend() -> Any:
+    global _backend
+    if _backend is None:
+        if JOB_BACKEND == "redis":
+            _backend = RedisJobBackend(JOB_REDIS_URL, JOB_REDIS_PREFIX)
+        else:
+            _backend = MemoryJobBackend()
+    return _backend
+
+
+_webhook_client: Optional[httpx.AsyncClient] = None
+
+
+def _host_allowed(host: str) -> bool:
+    for pattern in JOB_WEBHOOK_ALLOWED_HOSTS:
+        if pattern == "*" or host == pattern or (pattern.startswith("*.") and host.endswith(pattern[1:])):
+            return True
+    return False
+
+
+def check_webhook_url(url: str) -> httpx.URL:
+    """提交和回调时校验：http(s)、不含用户信息、主机在白名单内"""
+    if not JOB_WEBHOOK_ALLOWED_HOSTS:
+        raise WebhookRejected("Webhooks are disabled")
+    try:
+        parsed = httpx.URL(url)
+    except httpx.InvalidURL:
+        raise WebhookRejected("Invalid webhook_url")
+    if parsed.scheme not in ("http", "https") or not parsed.host or parsed.userinfo:
+        raise WebhookRejected("Invalid webhook_url")
+    if not _host_allowed(parsed.host.lower()):
+        raise WebhookRejected("webhook_url host is not allowed")
+    return parsed
+
+
+async def resolve_public_address(host: str, port: int) -> str:
+    """
+    解析主机，任一地址不是公网地址（回环/RFC1918/链路本地/元数据地址/组播等）时拒绝
+    返回第一个地址：回调直接连接该地址，避免解析后被 DNS 重绑定到内网
+    """
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise WebhookRejected(f"Cannot resolve {host}: {e}")
+    addresses = list(dict.fromkeys(info[4][0] for info in infos))
+    if not addresses:
+        raise WebhookRejected(f"Cannot resolve {host}")
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%")[0])
+        if not ip.is_global or ip.is_multicast:
+            raise WebhookRejected(f"{host} resolves to non-public address {address}")
+    return addresses[0]
+
+
+def _get_webhook_client() -> httpx.AsyncClient:
+    """webhook 专用客户端：不与模型调用共享连接池，不跟随重定向，不读取代理环境变量"""
+    global _webhook_client
+    if _webhook_client is None:
+        _webhook_client = httpx.AsyncClient(
+            timeout=JOB_WEBHOOK_TIMEOUT,
+            follow_redirects=False,
+            trust_env=False,
+            limits=httpx.Limits(max_connections=max(1, JOB_WORKERS), max_keepalive_connections=0),
+        )
+    return _webhook_client
+
+
+async def _post_webhook(url: str, payload: Dict[str, Any]) -> httpx.Response:
+    parsed = check_webhook_url(url)
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    address = await resolve_public_address(parsed.host, port)
+    # 连接已校验的地址；Host 头和 TLS SNI / 证书校验仍使用原主机名
+    return await _get_webhook_client().post(
+        parsed.copy_with(host=address),
+        json=payload,
+        headers={"Host": parsed.netloc.decode("ascii")},
+        extensions={"sni_hostname": parsed.host},
+    )
+
+
+async def _notify_webhook(job: Dict[str, Any]) -> Dict[str, Any]:
+    """任务结束后回调 webhook_url，失败时指数退避重试（地址不允许时不重试）"""
+    payload = {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "result": job["result"],
+        "error": job["error"],
+    }
+    last_error = None
+    for attempt in range(JOB_WEBHOOK_RETRIES):
+        if attempt:
+            await asyncio.sleep(2 ** (attempt - 1))
+        try:
+            resp = await _post_webhook(job["webhook_url"], payload)
+            if resp.status_code < 400:
+                return {"delivered": True, "status_code": resp.status_code, "attempts": attempt + 1}
+            last_error = f"HTTP {resp.status_code}"
+        except WebhookRejected as e:
+            print(f"[Jobs] Webhook rejected for {job['job_id']}: {e}")
+            return {"delivered": False, "error": str(e), "attempts": attempt + 1}
+        except Exception as e:
+            last_error = str(e)
+    print(f"[Jobs] Webhook failed for {job['job_id']}: {last_error}")
+    return {"delivered": False, "error": last_error, "attempts": JOB_WEBHOOK_RETRIES}
+
+
+async def _run_job(backend: Any, job_id: str, worker: str) -> None:
+    job = await backend.get(job_id)
+    image_bytes = await backend.load_image(job_id)
+    if job is None or job["status"] in ("succeeded", "failed"):
+        # 已过期，或在回收与确认之间重复入队的已完成任务
+        return
+    if image_bytes is None:
+        await backend.update(job_id, status="failed", finished_at=time.time(), error="Image expired")
+        return
+    if job["status"] == "running" and job["attempts"] >= JOB_MAX_ATTEMPTS:
+        # 状态仍为 running 说明之前执行它的 worker 已崩溃
+        await backend.update(job_id, status="failed", finished_at=time.time(),
+                             error=f"Job abandoned by crashed workers after {job['attempts']} attempts")
+        await backend.drop_image(job_id)
+        return
+
+    await backend.update(job_id, status="running", started_at=time.time(), attempts=job["attempts"] + 1)
+    try:
+        result = await analyze_with_cache(
+            image_bytes,
+            mime=job["mime"],
+            target_gender=job["target_gender"],
+            llm_dispatch=job["llm_dispatch"]
+        )
+        job.update(status="succeeded", result=result)
+    except AdmissionRejected as e:
+        # 服务繁忙：放回队列稍后重试，worker 暂停一段时间形成背压
+        await backend.update(job_id, status="queued")
+        await asyncio.sleep(min(e.retry_after, 30))
+        await backend.requeue(job_id, worker)
+        return
+    except Exception as e:
+        job.update(status="failed", error=f"Internal server error: {str(e)}")
+
+    job["finished_at"] = time.time()
+    await backend.update(job_id, status=job["status"], result=job["result"], error=job["error"],
+                         finished_at=job["finished_at"])
+    await backend.drop_image(job_id)
+    if job.get("webhook_url"):
+        await backend.update(job_id, webhook=await _notify_webhook(job))
+
+
+def _worker_id(index: int) -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+async def _worker_loop(index: int) -> None:
+    backend = get_job_backend()
+    worker = _worker_id(index)
+    await backend.heartbeat([worker])
+    while True:
+        try:
+            job_id = await backend.next_job(timeout=5, worker=worker)
+            if job_id is None:
+                continue
+            try:
+                await _run_job(backend, job_id, worker)
+            except Exception:
+                # 执行过程出错（如存储不可用）：放回队列，不丢失任务
+                await backend.requeue(job_id, worker)
+                raise
+            await backend.ack(job_id, worker)
+        except asyncio.CancelledError:
+            # 进程退出时处理中的任务留在处理中列表，心跳过期后由回收任务放回队列
+            raise
+        except Exception as e:
+            print(f"[Jobs] Worker {index} error: {e}")
+            await asyncio.sleep(1)
+
+
+async def _maintenance_loop(count: int) -> None:
+    """刷新本进程 worker 的心跳，并回收已崩溃 worker 处理中的任务"""
+    backend = get_job_backend()
+    workers = [_worker_id(i) for i in range(count)]
+    while True:
+        try:
+            await backend.heartbeat(workers)
+            reaped = await backend.reap()
+            if reaped:
+                print(f"[Jobs] Re-queued {reaped} job(s) from crashed workers")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[Jobs] Maintenance error: {e}")
+        await asyncio.sleep(max(1, JOB_VISIBILITY_TIMEOUT // 3))
+
+
+def start_job_workers(count: int = JOB_WORKERS) -> None:
+    """在当前事件循环中启动 worker（以及心跳/回收任务）"""
+    if count <= 0:
+        return
+    for i in range(count):
+        _workers.append(asyncio.create_task(_worker_loop(i)))
+    _workers.append(asyncio.create_task(_maintenance_loop(count)))
+
+
+async def stop_job_workers() -> None:
+    global _backend, _webhook_client
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    if _webhook_client is not None:
+        await _webhook_client.aclose()
+        _webhook_client = None
+    if _backend is not None:
+        await _backend.close()
+        _backend = None
+
+
+async def _run_standalone() -> None:
+    """独立 worker 进程（JOB_BACKEND=redis 时使用）"""
+    from executors import init_executor, shutdown_executor
+    from model_registry import load_models
+    from qwen_client import init_http_client, close_http_client
+
+    init_http_client()
+    init_executor()
+    await load_models()
+    count = max(1, JOB_WORKERS)
+    print(f"[Jobs] Worker process started: backend={JOB_BACKEND}, workers={count}")
+    start_job_workers(count)
+    try:
+        await asyncio.gather(*_workers)
+    finally:
+        await stop_job_workers()
+        await close_http_client()
+        shutdown_executor()
+        flush_phash_index()
+
+
+if __name__ == "__main__":
+    asyncio.run(_run_standalone())
@@ -0,0 +1,206 @@
+# server/llm_image.py
+"""
+发送给模型的图片预处理
+原图（最大 5MB）base64 后请求体约 7MB，上传耗时和图片 token 都随之增长。
+这里把长边缩放到 LLM_IMAGE_MAX_SIDE 并重新编码为 WebP/JPEG；
+本地取证（EXIF/噪声/模糊度/检测）仍使用原图，不受影响
+
+开启 LLM_ROI_CROPS 时，检测到人物/人脸的图片改为发送一张低分辨率全图 + 若干人物区域的高分辨率裁剪，
+person 相关字段（partial_features / body_type / gender_evidence）所依赖的细节仍保留在裁剪中
+"""
+import io
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from image_artifact import DecodedImage
+
+# webp / jpeg / original（original 表示不做处理，直接发送原图）
+LLM_IMAGE_FORMAT = os.getenv("LLM_IMAGE_FORMAT", "webp").lower()
+LLM_IMAGE_MAX_SIDE = int(os.getenv("LLM_IMAGE_MAX_SIDE", "1536"))
+LLM_IMAGE_QUALITY = int(os.getenv("LLM_IMAGE_QUALITY", "85"))
+
+# 人物区域裁剪：全图长边 / 每个裁剪的长边 / 最多裁剪数 / 人物框四周外扩比例
+LLM_ROI_CROPS = os.getenv("LLM_ROI_CROPS", "0") not in ("0", "false", "False")
+LLM_ROI_OVERVIEW_SIDE = int(os.getenv("LLM_ROI_OVERVIEW_SIDE", "768"))
+LLM_ROI_CROP_SIDE = int(os.getenv("LLM_ROI_CROP_SIDE", "512"))
+LLM_ROI_MAX_CROPS = int(os.getenv("LLM_ROI_MAX_CROPS", "3"))
+LLM_ROI_PADDING = float(os.getenv("LLM_ROI_PADDING", "0.15"))
+# 区域在全图中已有的分辨率达到裁剪分辨率的该比例时，裁剪不增加细节，不单独发送
+_ROI_MIN_GAIN = 1.5
+
+_FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+
+# EXIF Orientation -> PIL 变换（与 ImageOps.exif_transpose 一致）
+_ORIENTATION = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+def prepare_llm_image(image: DecodedImage, mime: str) -> Dict[str, Any]:
+    """
+    返回 {"bytes", "mime", "info"}
+    重新编码会丢弃 EXIF，因此先按 Orientation 旋转，保证模型看到的方向与原图一致；
+    编码结果不比原图小时直接发送原图
+    """
+    original_size = len(image.image_bytes)
+    info: Dict[str, Any] = {"format": "original", "original_bytes": original_size}
+    original = {"bytes": image.image_bytes, "mime": mime, "info": info}
+    if LLM_IMAGE_FORMAT not in _FORMATS:
+        info.update(sent_bytes=original_size, bytes_saved=0)
+        return original
+
+    arr, scale = image.downscaled(LLM_IMAGE_MAX_SIDE, kind="rgb")
+    img = _oriented(Image.fromarray(arr), image)
+    encoded = _encode(img)
+    if len(encoded) >= original_size:
+        info.update(sent_bytes=original_size, bytes_saved=0)
+        return original
+
+    info.update(
+        format=LLM_IMAGE_FORMAT,
+        quality=LLM_IMAGE_QUALITY,
+        width=img.width,
+        height=img.height,
+        scale=round(scale, 4),
+        sent_bytes=len(encoded),
+        bytes_saved=original_size - len(encoded),
+    )
+    return {"bytes": encoded, "mime": _FORMATS[LLM_IMAGE_FORMAT][1], "info": info}
+
+
+def _oriented(img: Image.Image, image: DecodedImage) -> Image.Image:
+    """重新编码会丢弃 EXIF，按 Orientation 旋转"""
+    transpose = _ORIENTATION.get(image.exif.get(274))
+    if transpose is not None:
+        img = img.transpose(transpose)
+    return img
+
+
+def _encode(img: Image.Image) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format=_FORMATS[LLM_IMAGE_FORMAT][0], quality=LLM_IMAGE_QUALITY)
+    return buf.getvalue()
+
+
+def _pad(box: List[float], pad: float, w: int, h: int) -> List[int]:
+    bw, bh = box[2] - box[0], box[3] - box[1]
+    return [
+        max(0, int(box[0] - bw * pad)), max(0, int(box[1] - bh * pad)),
+        min(w, int(box[2] + bw * pad)), min(h, int(box[3] + bh * pad)),
+    ]
+
+
+def _contains(outer: List[int], inner: List[int]) -> bool:
+    """inner 的大部分（80%）落在 outer 内"""
+    ix = max(0, min(outer[2], inner[2]) - max(outer[0], inner[0]))
+    iy = max(0, min(outer[3], inner[3]) - max(outer[1], inner[1]))
+    area = (inner[2] - inner[0]) * (inner[3] - inner[1])
+    return area > 0 and ix * iy >= 0.8 * area
+
+
+def select_regions(det: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    选出需要高分辨率裁剪的人物区域（原图坐标），按面积从大到小，最多 LLM_ROI_MAX_CROPS 个
+    - 人物框：外扩 LLM_ROI_PADDING，并向上包含所属人脸
+    - 不在任何人物框内的人脸（人物检测漏检时）：扩展为头肩区域
+    区域在全图中的分辨率已足够时跳过（裁剪不增加细节）
+    """
+    dims = det.get("image_dims") or {}
+    w, h = dims.get("width", 0), dims.get("height", 0)
+    if not w or not h:
+        return []
+    persons = det.get("persons", [])
+    faces = det.get("faces", [])
+    regions = []
+    for i, person in enumerate(persons):
+        box = list(person["bbox"])
+        for face in faces:
+            if face.get("person") == i:
+                box = [min(box[0], face["bbox"][0]), min(box[1], face["bbox"][1]),
+                       max(box[2], face["bbox"][2]), max(box[3], face["bbox"][3])]
+        regions.append({"kind": "person", "bbox": _pad(box, LLM_ROI_PADDING, w, h)})
+    for face in faces:
+        if face.get("person") is None:
+            x0, y0, x1, y1 = face["bbox"]
+            fw, fh = x1 - x0, y1 - y0
+            head = [x0 - fw, y0 - fh * 0.5, x1 + fw, y1 + fh * 2.5]
+            regions.append({"kind": "face", "bbox": _pad(head, 0.0, w, h)})
+
+    overview_scale = min(1.0, LLM_ROI_OVERVIEW_SIDE / max(w, h))
+    selected: List[Dict[str, Any]] = []
+    for region in sorted(regions, key=lambda r: -(r["bbox"][2] - r["bbox"][0]) * (r["bbox"][3] - r["bbox"][1])):
+        x0, y0, x1, y1 = region["bbox"]
+        side = max(x1 - x0, y1 - y0)
+        if side * overview_scale * _ROI_MIN_GAIN >= min(side, LLM_ROI_CROP_SIDE):
+            continue
+        if any(_contains(s["bbox"], region["bbox"]) for s in selected):
+            continue
+        selected.append(region)
+        if len(selected) >= LLM_ROI_MAX_CROPS:
+            break
+    return selected
+
+
+def prepare_roi_request(image: DecodedImage, mime: str, det: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    返回 {"bytes", "mime", "info", "crops"}：低分辨率全图 + 人物区域裁剪（crops 为 [{"bytes", "mime", "caption"}]）
+    没有值得裁剪的区域、未启用重新编码或全图 + 裁剪不比原图小时返回 None，
+    调用方改用 prepare_llm_image 的单张图片
+    """
+    if LLM_IMAGE_FORMAT not in _FORMATS:
+        return None
+    regions = select_regions(det)
+    if not regions:
+        return None
+
+    out_mime = _FORMATS[LLM_IMAGE_FORMAT][1]
+    overview_arr, scale = image.downscaled(LLM_ROI_OVERVIEW_SIDE, kind="rgb")
+    overview = _oriented(Image.fromarray(overview_arr), image)
+    overview_bytes = _encode(overview)
+    original_size = len(image.image_bytes)
+    sent = len(overview_bytes)
+    if sent >= original_size:
+        return None
+
+    rgb = image.rgb
+    crops = []
+    crop_info = []
+    for n, region in enumerate(regions, 1):
+        x0, y0, x1, y1 = region["bbox"]
+        crop = Image.fromarray(np.ascontiguousarray(rgb[y0:y1, x0:x1]))
+        crop.thumbnail((LLM_ROI_CROP_SIDE, LLM_ROI_CROP_SIDE), Image.Resampling.LANCZOS)
+        crop = _oriented(crop, image)
+        encoded = _encode(crop)
+        label = "人物" if region["kind"] == "person" else "人脸（人物检测未覆盖）"
+        crops.append({
+            "bytes": encoded,
+            "mime": out_mime,
+            "caption": f"区域 {n}：{label}，对应原图 {x1 - x0}x{y1 - y0} 像素的区域",
+        })
+        crop_info.append({"kind": region["kind"], "bbox": region["bbox"], "width": crop.width,
+                          "height": crop.height, "bytes": len(encoded)})
+        sent += len(encoded)
+        if sent >= original_size:
+            return None
+
+    info = {
+        "format": f"{LLM_IMAGE_FORMAT}+roi",
+        "original_bytes": original_size,
+        "quality": LLM_IMAGE_QUALITY,
+        "width": overview.width,
+        "height": overview.height,
+        "scale": round(scale, 4),
+        "crops": crop_info,
+        "sent_bytes": sent,
+        "bytes_saved": original_size - sent,
+    }
+    return {"bytes": overview_bytes, "mime": out_mime, "info": info, "crops": crops}
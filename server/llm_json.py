@@ -0,0 +1,314 @@
+# server/llm_json.py
+"""
+模型输出 JSON 的增量解析与容错修复
+流式响应逐块喂入，顶层对象的每个字段在其值闭合时立即可用，
+不需要等完整响应，也不需要先用正则提取代码块；
+单个字段解析失败（多余逗号、缺逗号）或响应被截断时，用 repair_json 单遍修复，
+尽可能保留最长的合法前缀
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# 只有这些字符会改变解析状态，其余字符直接跳过
+_SPECIAL = re.compile(r'["\\{}\[\],]')
+
+# repair_json 的词法单元：完整字符串 / 截断在末尾的字符串 / 标点 / 字面量 / 数字 / 空白 / 其他
+_TOKEN = re.compile(
+    r'"(?:[^"\\]|\\.)*"'
+    r'|"(?:[^"\\]|\\.)*\\?\Z'
+    r'|[{}\[\]:,]'
+    r'|true|false|null'
+    r'|-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?'
+    r'|\s+'
+    r'|.',
+    re.S
+)
+
+
+class _Container:
+    __slots__ = ("kind", "state", "safe")
+
+    def __init__(self, kind: str, safe: int):
+        self.kind = kind      # "{" 或 "["
+        # 对象：key -> colon -> value -> comma；数组：value -> comma
+        self.state = "key" if kind == "{" else "value"
+        self.safe = safe      # 最近一个完整子项之后的输出位置
+
+
+def repair_json(text: str) -> Tuple[Optional[str], bool]:
+    """
+    单遍（线性时间）修复模型输出的 JSON
+
+    - 跳过第一个 '{' 或 '[' 之前的内容（如 ```json 代码块标记），根容器闭合后忽略其余内容
+    - 去掉 '}' / ']' 前多余的逗号，补上相邻值之间缺失的逗号，跳过无法识别的字符
+    - 文本被截断时：未闭合的字符串值直接闭合，不完整的键/数字/字面量丢弃，
+      再依次闭合所有未结束的容器，得到最长的合法前缀
+
+    返回 (修复后的文本, 是否做过修改)；找不到 JSON 起点时返回 (None, False)
+    """
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        return None, False
+    pos = min(starts)
+    out: List[str] = []
+    stack: List[_Container] = []
+    changed = pos > 0
+    n = len(text)
+
+    def value_done() -> None:
+        if stack:
+            top = stack[-1]
+            top.state = "comma"
+            top.safe = len(out)
+
+    for m in _TOKEN.finditer(text, pos):
+        tok = m.group()
+        c = tok[0]
+        if c.isspace():
+            continue
+        top = stack[-1] if stack else None
+
+        if c in "{[":
+            if top is not None:
+                if top.state == "comma":
+                    out.append(",")
+                    top.state = "key" if top.kind == "{" else "value"
+                    changed = True
+                if top.state != "value":
+                    changed = True
+                    continue
+            out.append(tok)
+            stack.append(_Container(tok, len(out)))
+        elif c in "}]":
+            if top is None:
+                changed = True
+                continue
+            if top.kind == "{" and top.state in ("colon", "value"):
+                # 只有键没有值：丢弃这个键
+                del out[top.safe:]
+                changed = True
+            if out and out[-1] == ",":
+                out.pop()
+                changed = True
+            closer = "}" if top.kind == "{" else "]"
+            changed = changed or tok != closer
+            out.append(closer)
+            stack.pop()
+            if not stack:
+                return "".join(out), changed
+            value_done()
+        elif tok == ",":
+            if top is None or top.state != "comma":
+                changed = True
+                continue
+            out.append(",")
+            top.state = "key" if top.kind == "{" else "value"
+        elif tok == ":":
+            if top is None or top.state != "colon":
+                changed = True
+                continue
+            out.append(":")
+            top.state = "value"
+        elif c == '"':
+            complete = _is_closed_string(tok)
+            if top is None:
+                continue
+            if top.state == "comma":
+                out.append(",")
+                top.state = "key" if top.kind == "{" else "value"
+                changed = True
+            if not complete:
+                # 截断在字符串中间（只可能出现在文本末尾）
+                if top.state != "value":
+                    break
+                out.append(_close_string(tok))
+                changed = True
+                value_done()
+                break
+            out.append(tok)
+            if top.state == "key":
+                top.state = "colon"
+            elif top.state == "value":
+                value_done()
+            else:
+                out.pop()
+                changed = True
+        elif c == "-" or c.isdigit() or tok in ("true", "false", "null"):
+            if top is None or m.end() == n and tok not in ("true", "false", "null"):
+                # 末尾的数字可能被截断，丢弃
+                changed = True
+                continue
+            if top.state == "comma":
+                out.append(",")
+                top.state = "key" if top.kind == "{" else "value"
+                changed = True
+            if top.state != "value":
+                changed = True
+                continue
+            out.append(tok)
+            value_done()
+        else:
+            changed = True
+
+    # 文本结束但容器未闭合：回退到最近的完整子项，逐层闭合
+    if not stack:
+        return ("".join(out) if out else None), changed
+    while stack:
+        top = stack.pop()
+        del out[top.safe:]
+        if out and out[-1] == ",":
+            out.pop()
+        out.append("}" if top.kind == "{" else "]")
+        if stack:
+            stack[-1].safe = len(out)
+            stack[-1].state = "comma"
+    return "".join(out), True
+
+
+def _is_closed_string(tok: str) -> bool:
+    """字符串是否以未转义的引号结尾"""
+    if len(tok) < 2 or not tok.endswith('"'):
+        return False
+    backslashes = len(tok) - 1 - len(tok[:-1].rstrip("\\"))
+    return backslashes % 2 == 0
+
+
+def _close_string(tok: str) -> str:
+    """闭合截断的字符串：去掉末尾不完整的转义序列后补引号"""
+    body = re.sub(r'\\u[0-9a-fA-F]{0,3}\Z', "", tok)
+    if (len(body) - len(body.rstrip("\\"))) % 2 == 1:
+        body = body[:-1]
+    return body + '"'
+
+
+def loads_tolerant(text: str) -> Tuple[Any, bool]:
+    """
+    先按标准 JSON 解析，失败时修复后再解析
+    返回 (值, 是否经过修复)；无法恢复时抛出 ValueError
+    """
+    try:
+        return json.loads(text, strict=False), False
+    except json.JSONDecodeError:
+        pass
+    repaired, _ = repair_json(text)
+    if repaired is None:
+        raise ValueError("no JSON object found")
+    return json.loads(repaired, strict=False), True
+
+
+class TopLevelFieldParser:
+    """
+    单遍扫描的顶层字段解析器
+
+    - 跳过第一个 '{' 之前的任何文字（如 ```json 代码块标记）
+    - 跟踪字符串/转义/嵌套深度，深度为 1 时遇到 ',' 或 '}' 即得到一个完整字段
+    - 每个字段只解析一次，整体线性时间；解析失败的字段经 repair_json 修复后再解析
+    - 顶层对象闭合后忽略后续内容（如结尾的 ```）
+    - 流结束时调用 close()，从被截断的最后一个字段中恢复最长的合法前缀
+
+    每次 feed 只扫描新到的文本块；已收到的块和当前字段的片段保存在列表中，
+    完整文本（text）在读取时才拼接，避免每块都复制整个缓冲区
+    """
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self.errors: List[str] = []
+        self.repaired: Set[str] = set()
+        self.started = False
+        self.finished = False
+        self._chunks: List[str] = []
+        self._text: Optional[str] = ""
+        # 当前顶层字段已收到的片段
+        self._member: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        # 上一个块以反斜杠结尾时，下一个块的第一个字符被转义
+        self._escaped = False
+
+    @property
+    def text(self) -> str:
+        """目前收到的完整文本"""
+        if self._text is None:
+            self._text = "".join(self._chunks)
+        return self._text
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """喂入新文本，返回本次新完成的 (字段名, 值) 列表"""
+        self._chunks.append(chunk)
+        self._text = None
+        completed: List[Tuple[str, Any]] = []
+        if self.finished:
+            return completed
+
+        member_start = 0
+        skip = 0 if self._escaped else -1
+        self._escaped = False
+        for m in _SPECIAL.finditer(chunk):
+            i = m.start()
+            c = chunk[i]
+            if not self.started:
+                if c == "{":
+                    self.started = True
+                    self._depth = 1
+                    member_start = i + 1
+                continue
+            if self._in_string:
+                if i == skip:
+                    continue
+                if c == "\\":
+                    skip = i + 1
+                elif c == '"':
+                    self._in_string = False
+                continue
+            if c == '"':
+                self._in_string = True
+            elif c in "{[":
+                self._depth += 1
+            elif c in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit(self._take_member(chunk, member_start, i), completed)
+                    self.finished = True
+                    return completed
+            elif c == "," and self._depth == 1:
+                self._emit(self._take_member(chunk, member_start, i), completed)
+                member_start = i + 1
+        if self.started:
+            self._member.append(chunk[member_start:])
+            self._escaped = skip == len(chunk)
+        return completed
+
+    def _take_member(self, chunk: str, start: int, end: int) -> str:
+        """取出当前字段的完整文本（之前块中的片段 + 本块 [start, end)）"""
+        self._member.append(chunk[start:end])
+        member = "".join(self._member)
+        self._member = []
+        return member
+
+    def close(self) -> List[Tuple[str, Any]]:
+        """流结束：顶层对象未闭合时，修复并返回最后一个（被截断的）字段"""
+        completed: List[Tuple[str, Any]] = []
+        if self.started and not self.finished:
+            self._emit("".join(self._member), completed, truncated=True)
+            self._member = []
+            self.finished = True
+        return completed
+
+    def _emit(self, member: str, out: List[Tuple[str, Any]], truncated: bool = False) -> None:
+        member = member.strip()
+        if not member:
+            return
+        text = "{" + member + ("" if truncated else "}")
+        try:
+            parsed, repaired = loads_tolerant(text)
+        except ValueError as e:
+            self.errors.append(f"{member[:40]}...: {e}")
+            return
+        if not isinstance(parsed, dict):
+            return
+        for key, value in parsed.items():
+            self.fields[key] = value
+            if repaired:
+                self.repaired.add(key)
+            out.append((key, value))
@@ -0,0 +1,307 @@
+# server/llm_prompts.py
+"""
+模型请求的 prompt 与结构化输出定义
+- prompt 按 target_gender 的两个变体在导入时一次性生成，请求之间逐字节一致，
+  固定内容（system）在前、图片和本地辅助信息在后，便于服务端做前缀缓存
+- 模型支持结构化输出时，使用短键名 + 枚举代码的 JSON Schema（response_format），
+  输出更短且一定是合法 JSON；收到的字段再解码回原有的精简格式
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+TARGET_GENDERS = ("boyfriend", "girlfriend")
+
+
+class Codes(dict):
+    """枚举代码 -> 原始取值"""
+
+
+# 叶子：(原字段名, 类型, 说明)；类型为 bool/int/str/str?/[str]、Codes 或嵌套 spec
+HEIGHT = Codes(tall="偏高", mid="中等", short="偏矮", na="无法判断")
+BODY_TYPE = Codes(slim="偏瘦", avg="匀称", solid="偏壮", na="无法判断")
+POSTURE = Codes(upright="挺拔", relaxed="放松", hunched="含胸", na="不确定")
+GENDER = Codes(m="男性", f="女性", na="无法判断")
+LEVEL3 = Codes(h="high", m="medium", l="low")
+LOCATION = Codes(**{"in": "室内", "out": "室外", "na": "无法判断"})
+CONSUMPTION = Codes(high="高", mid="中", mass="大众", na="无法判断")
+PEOPLE = Codes(**{"1": "1", "2": "2", "na": "无法判断"})
+RELATION = Codes(single="独居", couple="情侣", na="无法判断")
+
+OUTPUT_SPEC: Dict[str, Tuple[str, Any, str]] = {
+    "w": ("web_image_check", {
+        "r": ("risk_level", LEVEL3, "网图风险"),
+        "wm": ("watermark", "str?", "水印描述，无则null"),
+        "ss": ("screenshot", "str?", "截图痕迹，无则null"),
+        "pr": ("professional", "str?", "专业摄影特征，无则null"),
+    }, "网图检测"),
+    "p": ("person", {
+        "d": ("detected", "bool", "是否有人"),
+        "n": ("count", "int", "人数"),
+        "h": ("height", HEIGHT, "身高"),
+        "b": ("body_type", BODY_TYPE, "体型"),
+        "po": ("posture", POSTURE, "体态"),
+        "g": ("gender", GENDER, "性别"),
+        "ge": ("gender_evidence", {
+            "a": ("appearance", "str", "外观线索"),
+            "e": ("environment", "str", "环境线索"),
+            "c": ("consistency", "str", "线索一致性"),
+        }, "性别依据"),
+        "ev": ("evidence", {
+            "r": ("reference", "str", "参照物"),
+            "v": ("body_visibility", "str", "全身可见性"),
+            "a": ("angle_impact", "str", "角度影响"),
+        }, "体征依据"),
+        "pf": ("partial_features", {
+            "h": ("hand", "str", "手部"),
+            "a": ("arm", "str", "手臂"),
+            "f": ("face", "str", "脸部"),
+            "n": ("neck_shoulder", "str", "颈肩"),
+            "b": ("body", "str", "身体"),
+            "t": ("body_type_clue", "str", "体型综合判断"),
+        }, "局部特征"),
+        "c": ("confidence", LEVEL3, "置信度"),
+    }, "人物"),
+    "s": ("scene", {
+        "loc": ("location", LOCATION, "室内/室外"),
+        "d": ("desc", "str", "详细环境描述"),
+    }, "场景"),
+    "l": ("lifestyle", {
+        "lv": ("level", CONSUMPTION, "消费水平"),
+        "br": ("brands", "[str]", "品牌列表"),
+    }, "生活方式"),
+    "r": ("room_analysis", {
+        "n": ("people", PEOPLE, "居住人数"),
+        "rel": ("relation", RELATION, "关系"),
+        "ev": ("evidence", "str", "详细依据"),
+    }, "房间分析"),
+    "o": ("objects", "[str]", "检测到的物体"),
+    "d": ("details", {
+        "t": ("text", "[str]", "识别到的文字"),
+        "sp": ("special", "[str]", "特殊元素"),
+    }, "细节"),
+    "i": ("intention", "str", "照片用途详细说明"),
+    "c": ("girlfriend_comments", "[str]", "可疑点口语化吐槽"),
+}
+
+_LEAF_SCHEMA = {
+    "bool": {"type": "boolean"},
+    "int": {"type": "integer"},
+    "str": {"type": "string"},
+    "str?": {"type": ["string", "null"]},
+    "[str]": {"type": "array", "items": {"type": "string"}},
+}
+
+
+def _schema(spec: Dict[str, Tuple[str, Any, str]]) -> Dict[str, Any]:
+    properties: Dict[str, Any] = {}
+    for key, (_, kind, _desc) in spec.items():
+        if isinstance(kind, Codes):
+            properties[key] = {"type": "string", "enum": list(kind)}
+        elif isinstance(kind, dict):
+            properties[key] = _schema(kind)
+        else:
+            properties[key] = dict(_LEAF_SCHEMA[kind])
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(spec),
+        "additionalProperties": False,
+    }
+
+
+def _legend(spec: Dict[str, Tuple[str, Any, str]], indent: str = "") -> List[str]:
+    """键名说明：每行 `键=含义`，枚举附代码含义"""
+    lines = []
+    for key, (_, kind, desc) in spec.items():
+        if isinstance(kind, Codes):
+            codes = "/".join(f"{code}={value}" for code, value in kind.items())
+            lines.append(f"{indent}{key}={desc}（{codes}）")
+        elif isinstance(kind, dict):
+            lines.append(f"{indent}{key}={desc}：")
+            lines.extend(_legend(kind, indent + "  "))
+        else:
+            lines.append(f"{indent}{key}={desc}")
+    return lines
+
+
+def _decode(value: Any, kind: Any) -> Any:
+    if isinstance(kind, Codes):
+        return kind.get(value, value)
+    if isinstance(kind, dict):
+        if not isinstance(value, dict):
+            return value
+        decoded = {}
+        for key, item in value.items():
+            if key in kind:
+                name, child, _ = kind[key]
+                decoded[name] = _decode(item, child)
+            else:
+                decoded[key] = item
+        return decoded
+    return value
+
+
+def decode_field(key: str, value: Any) -> Tuple[str, Any]:
+    """把结构化输出的一个顶层字段解码为原有精简格式的 (字段名, 值)"""
+    if key not in OUTPUT_SPEC:
+        return key, value
+    name, kind, _ = OUTPUT_SPEC[key]
+    return name, _decode(value, kind)
+
+
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "photo_analysis", "strict": True, "schema": _schema(OUTPUT_SPEC)},
+}
+
+
+# 原有的完整 prompt（模型不支持结构化输出时使用）
+_PROSE_TEMPLATE = """你是一个专业的照片分析AI。请分析「{target_word}」发的照片，特别关注{opposite}相关的线索。
+
+**重要：你必须严格按照以下JSON格式输出，不能省略任何字段，所有字段都必须有值。**
+
+输出完整JSON：
+```json
+{{
+  "person": {{
+    "detected": bool,
+    "count": int,
+    "height": "偏高/中等/偏矮/无法判断",
+    "body_type": "偏瘦/匀称/偏壮/无法判断",
+    "posture": "挺拔/放松/含胸/不确定",
+    "gender": "男性/女性/无法判断",
+    "gender_evidence": {{
+      "appearance": "外观线索描述",
+      "environment": "环境线索描述",
+      "consistency": "线索一致性说明"
+    }},
+    "evidence": {{
+      "reference": "参照物描述",
+      "body_visibility": "全身可见性描述",
+      "angle_impact": "角度影响说明"
+    }},
+    "partial_features": {{
+      "hand": "手部特征",
+      "arm": "手臂特征",
+      "face": "脸部特征",
+      "neck_shoulder": "颈肩特征",
+      "body": "身体特征",
+      "body_type_clue": "体型综合判断"
+    }},
+    "confidence": "high/medium/low"
+  }},
+  "web_image_check": {{
+    "risk_level": "high/medium/low",
+    "watermark": "水印描述或null",
+    "screenshot": "截图痕迹或null",
+    "professional": "专业摄影特征或null"
+  }},
+  "scene": {{
+    "location": "室内/室外",
+    "desc": "详细环境描述"
+  }},
+  "lifestyle": {{
+    "level": "高/中/大众/无法判断",
+    "brands": ["品牌列表"]
+  }},
+  "room_analysis": {{
+    "people": "1/2/无法判断",
+    "relation": "独居/情侣/无法判断",
+    "evidence": "详细依据"
+  }},
+  "objects": ["检测到的物体列表"],
+  "details": {{
+    "text": ["识别到的文字列表"],
+    "special": ["特殊元素列表"]
+  }},
+  "intention": "照片用途详细说明",
+  "girlfriend_comments": ["可疑点吐槽列表"]
+}}
+```
+
+规则：
+1. 水印/截图/专业摄影是网图高风险线索
+2. 看到人体任何部位就给体型判断，默认匀称
+3. girlfriend_comments用口语化吐槽，如"宝这图有点意思"
+4. 无依据输出"无法判断"
+5. **必须输出完整的JSON，包含所有字段，不能省略任何字段**
+6. **所有字段都必须有值，不能为null或空**
+7. **只输出JSON，不要任何其他文字、解释或说明**
+8. **确保JSON格式正确，可以直接被解析**"""
+
+_STRUCTURED_TEMPLATE = """你是一个专业的照片分析AI。请分析「{target_word}」发的照片，特别关注{opposite}相关的线索。
+
+按给定的 JSON Schema 输出，键名含义：
+{legend}
+
+规则：
+1. 水印/截图/专业摄影是网图高风险线索
+2. 看到人体任何部位就给体型判断，默认匀称
+3. c 用口语化吐槽，如"宝这图有点意思"
+4. 无依据时枚举用 na，文字写"无法判断"
+5. 描述简洁，每项不超过 40 字"""
+
+
+def _variant_words(target_gender: str) -> Dict[str, str]:
+    return {
+        "target_word": "男朋友" if target_gender == "boyfriend" else "女朋友",
+        "opposite": "女性用品" if target_gender == "boyfriend" else "男性用品",
+    }
+
+
+_LEGEND = "\n".join(_legend(OUTPUT_SPEC))
+PROSE_PROMPTS = {g: _PROSE_TEMPLATE.format(**_variant_words(g)) for g in TARGET_GENDERS}
+STRUCTURED_PROMPTS = {
+    g: _STRUCTURED_TEMPLATE.format(legend=_LEGEND, **_variant_words(g)) for g in TARGET_GENDERS
+}
+
+PROSE_USER_TEXT = "请仔细分析这张照片，严格按照上述JSON格式输出完整结果。必须包含所有字段，不能省略。"
+STRUCTURED_USER_TEXT = "请分析这张照片。"
+
+
+# 附带人物区域裁剪时插在裁剪之前的说明（固定文本）
+CROPS_TEXT = (
+    "第一张图为完整画面（已缩小）。以下为同一画面中人物区域的高分辨率裁剪，"
+    "仅用于观察 person 相关字段（partial_features / body_type / gender_evidence）的细节；"
+    "其他字段以完整画面为准，人数等统计不要重复计算裁剪中的人物"
+)
+
+
+def build_messages(
+    target_gender: str,
+    image_url: str,
+    extra_context: Optional[Dict[str, Any]],
+    structured: bool,
+    cache_prefix: bool = True,
+    crops: Optional[List[Tuple[str, str]]] = None
+) -> List[Dict[str, Any]]:
+    """
+    组装 OpenAI 兼容格式的 messages
+    顺序：system（固定）-> 固定指令 -> 图片 -> 人物区域裁剪 -> 本地辅助信息（每次不同，放最后）
+    cache_prefix 时给 system 加 cache_control 断点（OpenRouter 对支持的模型启用显式缓存）
+    crops: [(说明, 图片 data URL)]，第一张图片为低分辨率全图时附带的人物区域高分辨率裁剪
+    """
+    variant = target_gender if target_gender in TARGET_GENDERS else "girlfriend"
+    system_text = (STRUCTURED_PROMPTS if structured else PROSE_PROMPTS)[variant]
+    system_part: Dict[str, Any] = {"type": "text", "text": system_text}
+    if cache_prefix:
+        system_part["cache_control"] = {"type": "ephemeral"}
+
+    user_content: List[Dict[str, Any]] = [
+        {"type": "text", "text": STRUCTURED_USER_TEXT if structured else PROSE_USER_TEXT},
+        {"type": "image_url", "image_url": {"url": image_url}},
+    ]
+    if crops:
+        user_content.append({"type": "text", "text": CROPS_TEXT})
+        for caption, url in crops:
+            user_content.append({"type": "text", "text": caption})
+            user_content.append({"type": "image_url", "image_url": {"url": url}})
+    if extra_context:
+        user_content.append({
+            "type": "text",
+            "text": f"辅助信息：{json.dumps(extra_context, ensure_ascii=False)}",
+        })
+    return [
+        {"role": "system", "content": [system_part]},
+        {"role": "user", "content": user_content},
+    ]
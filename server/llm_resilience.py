@@ -0,0 +1,171 @@
+# server/llm_resilience.py
+"""
+模型调用的容错组件
+- 重试：可重试的状态码/网络错误按「全抖动」指数退避重试（优先遵循 Retry-After）
+- 对冲：主模型在最近延迟的某个分位数内仍未开始输出时，向备用模型发出同样的请求，
+  先开始输出的一方胜出，另一方取消；对冲比例有上限，平均成本基本不变
+- 熔断：连续失败达到阈值后暂停向该模型发送请求，冷却后放行一个探测请求
+"""
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+LLM_RETRY_MAX = int(os.getenv("LLM_RETRY_MAX", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+# 备用模型（为空则不对冲）
+LLM_HEDGE_MODEL = os.getenv("LLM_HEDGE_MODEL", "")
+# 以主模型「首个字段输出耗时」的该分位数作为对冲延迟
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+# 样本不足时使用的对冲延迟（秒）
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "45"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# 对冲请求数占总请求数的上限
+LLM_HEDGE_MAX_RATIO = float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.1"))
+
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+_LATENCY_WINDOW = 200
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """第 attempt 次重试前的等待时间（从 0 开始计）"""
+    if retry_after is not None:
+        return min(max(0.0, retry_after), LLM_RETRY_MAX_DELAY)
+    return random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After 头（只支持秒数形式）"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class CircuitBreaker:
+    """closed -> open（连续失败达到阈值）-> half_open（冷却后放行一个探测请求）-> closed/open"""
+
+    def __init__(self, name: str, failure_threshold: int, cooldown: float):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def _cooled_down(self) -> bool:
+        return time.monotonic() - self.opened_at >= self.cooldown
+
+    def available(self) -> bool:
+        """是否可以发送请求（不改变状态）"""
+        if self.state == "open":
+            return self._cooled_down()
+        if self.state == "half_open":
+            return not self._probing
+        return True
+
+    def allow(self) -> bool:
+        """申请发送一个请求；half_open 时同一时刻只放行一个探测请求"""
+        if self.state == "open":
+            if not self._cooled_down():
+                return False
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                print(f"[LLM] Circuit opened for {self.name} after {self.failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def record_cancelled(self) -> None:
+        """请求被取消（如对冲失败方）：不计入成败，只释放探测名额"""
+        self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures}
+
+
+class LatencyTracker:
+    """最近若干次成功调用的延迟，用于计算对冲延迟"""
+
+    def __init__(self, window: int = _LATENCY_WINDOW):
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self._samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        idx = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[idx]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_latency: Dict[str, LatencyTracker] = {}
+# secondary_used：最终结果来自备用模型（对冲胜出、熔断改道或失败后切换）
+_counters = {"requests": 0, "hedged": 0, "secondary_used": 0, "retries": 0, "short_circuited": 0}
+
+
+def get_breaker(model: str) -> CircuitBreaker:
+    if model not in _breakers:
+        _breakers[model] = CircuitBreaker(model, LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN)
+    return _breakers[model]
+
+
+def get_latency(model: str) -> LatencyTracker:
+    if model not in _latency:
+        _latency[model] = LatencyTracker()
+    return _latency[model]
+
+
+def count(name: str) -> None:
+    _counters[name] += 1
+
+
+def hedge_delay(model: str) -> Optional[float]:
+    """对冲延迟（秒）；未配置备用模型或已超过对冲比例上限时返回 None"""
+    if not LLM_HEDGE_MODEL or LLM_HEDGE_MODEL == model:
+        return None
+    if _counters["hedged"] >= LLM_HEDGE_MAX_RATIO * max(1, _counters["requests"]):
+        return None
+    p = get_latency(model).percentile(LLM_HEDGE_PERCENTILE)
+    return p if p is not None else LLM_HEDGE_DEFAULT_DELAY
+
+
+def llm_status() -> Dict[str, Any]:
+    """供 /health 使用"""
+    return {
+        **_counters,
+        "hedge_model": LLM_HEDGE_MODEL or None,
+        "breakers": {name: b.stats() for name, b in _breakers.items()},
+        "first_field_p50_s": {
+            name: round(t.percentile(50), 2) for name, t in _latency.items() if t.percentile(50) is not None
+        },
+    }
@@ -0,0 +1,292 @@
+# server/local_heuristics.py
+"""
+纯本地的廉价启发式分析（快速模式 mode=fast 使用）
+只依赖文件头、低分辨率预览和本地检测结果，不调用模型；
+所有结论都标注为「仅本地」，置信度不高于 medium
+"""
+from typing import Any, Dict, List, Optional
+
+import cv2
+
+from image_artifact import DecodedImage
+from modules_credibility import mk_item
+from screenshot_detector import detect_screenshot
+
+LOCAL_ONLY_NOTE = "仅本地快速分析（未调用 AI 模型），结论较粗略"
+
+# 场景统计使用的缩略图长边
+HEURISTIC_SIDE = 256
+
+# 本地检测类别 -> 生活方式线索
+LIFESTYLE_HINTS = {
+    "laptop": "笔记本电脑", "cell phone": "手机", "tv": "电视", "wine glass": "酒杯",
+    "suitcase": "行李箱", "handbag": "手提包", "backpack": "背包", "car": "汽车",
+    "bed": "床", "couch": "沙发", "dining table": "餐桌", "book": "书",
+}
+
+
+def local_item(
+    claim: str,
+    evidence: Optional[List[str]],
+    limitations: Optional[List[str]] = None,
+    confidence: str = "low",
+) -> Dict[str, Any]:
+    """本地快速分析项：limitations 首条固定为「仅本地」说明"""
+    return mk_item(claim, evidence, [LOCAL_ONLY_NOTE] + (limitations or []), confidence)
+
+
+def mark_local(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """给已有分析项（如可信度项）补上「仅本地」说明"""
+    for item in items:
+        limitations = item.setdefault("limitations", [])
+        if LOCAL_ONLY_NOTE not in limitations:
+            limitations.insert(0, LOCAL_ONLY_NOTE)
+    return items
+
+
+def scene_heuristics(image: DecodedImage, preview_side: int) -> Dict[str, Any]:
+    """
+    场景统计（HSV 阈值，向量化）
+    - 顶部三分之一的蓝天占比、全图植被占比 -> 室内/室外
+    - 亮度均值、暖/冷色偏、饱和度
+    """
+    rgb, _ = image.preview(preview_side)
+    h, w = rgb.shape[:2]
+    if max(h, w) > HEURISTIC_SIDE:
+        scale = HEURISTIC_SIDE / max(h, w)
+        rgb = cv2.resize(rgb, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV)
+    hue, sat, val = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+
+    top = slice(0, max(1, hsv.shape[0] // 3))
+    sky = (hue[top] >= 90) & (hue[top] <= 130) & (sat[top] >= 40) & (val[top] >= 110)
+    green = (hue >= 35) & (hue <= 85) & (sat >= 60) & (val >= 50)
+    sky_ratio = float(sky.mean())
+    green_ratio = float(green.mean())
+
+    means = rgb.reshape(-1, 3).mean(axis=0)
+    brightness = float(val.mean())
+    warmth = float((means[0] - means[2]) / max(1.0, means.mean()))
+
+    if sky_ratio >= 0.25 or green_ratio >= 0.2:
+        location = "室外"
+    elif sky_ratio < 0.05 and green_ratio < 0.08:
+        location = "室内"
+    else:
+        location = "无法判断"
+
+    if brightness < 70:
+        lighting = "偏暗"
+    elif brightness > 190:
+        lighting = "明亮"
+    else:
+        lighting = "正常"
+    color_cast = "暖色" if warmth > 0.15 else "冷色" if warmth < -0.1 else "中性"
+
+    return {
+        "location": location,
+        "lighting": lighting,
+        "color_cast": color_cast,
+        "sky_ratio": round(sky_ratio, 3),
+        "green_ratio": round(green_ratio, 3),
+        "brightness": round(brightness, 1),
+        "saturation": round(float(sat.mean()), 1),
+    }
+
+
+def web_image_heuristics(
+    image: DecodedImage,
+    exif: Dict[str, Any],
+    screenshot: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """网图/截图线索：本地截图检测结果（含尺寸判断）+ PNG 无相机信息 + EXIF 为空"""
+    no_camera = not exif.get("camera")
+    fmt = image.pil.format
+    if screenshot is None:
+        screenshot = detect_screenshot(image)
+
+    signals = list(screenshot.get("signals", []))
+    if fmt == "PNG" and no_camera:
+        signals.append("PNG 格式且无相机 EXIF（截图常见特征）")
+    if no_camera and not exif.get("datetime"):
+        signals.append("EXIF 无相机型号/拍摄时间（可能被清除或为转发图）")
+
+    level = screenshot.get("level", "none")
+    if level == "high":
+        risk = "high"
+    elif level == "medium" or (fmt == "PNG" and no_camera):
+        risk = "medium"
+    else:
+        risk = "low"
+    platform = screenshot.get("platform")
+    label = f"手机截图（{platform}）" if platform else "手机截图"
+    return {
+        "risk_level": risk,
+        "screenshot": label if screenshot.get("is_screenshot") else None,
+        "signals": signals,
+    }
+
+
+def web_image_section(web: Dict[str, Any]) -> Dict[str, Any]:
+    """与模型结果展开后的 web_image_check 结构一致"""
+    risk = web["risk_level"]
+    evidence = "；".join(web["signals"])
+    return {
+        "risk_level": risk,
+        "is_likely_web_image": risk == "high",
+        "watermark": {"detected": False, "platform": None, "location": None, "evidence": ""},
+        "screenshot_traces": {
+            "detected": bool(web["screenshot"]),
+            "type": web["screenshot"] or "无",
+            "evidence": evidence,
+        },
+        "professional_photo": {"detected": False, "features": [], "evidence": ""},
+        "image_quality_issues": {"compression_artifacts": False, "resolution_mismatch": False,
+                                 "aspect_ratio_abnormal": False, "evidence": ""},
+        "influencer_style": {"detected": False, "features": [], "evidence": ""},
+        "temporal_inconsistency": {"detected": False, "evidence": ""},
+        "conclusion": f"风险等级: {risk}（本地分析，未检查水印/内容）",
+        "recommendation": "建议使用百度识图验证" if risk == "high" else None,
+        "source": "local",
+    }
+
+
+def merge_screenshot(web_check: Dict[str, Any], screenshot: Dict[str, Any]) -> Dict[str, Any]:
+    """模型未识别出截图、本地检测高置信度命中时，以本地结果补充模型的 web_image_check"""
+    if screenshot.get("level") != "high" or web_check.get("screenshot_traces", {}).get("detected"):
+        return web_check
+    platform = screenshot.get("platform")
+    merged = dict(web_check)
+    merged.update(
+        risk_level="high",
+        is_likely_web_image=True,
+        screenshot_traces={
+            "detected": True,
+            "type": f"手机截图（{platform}）" if platform else "手机截图",
+            "evidence": "；".join(screenshot.get("signals", [])),
+            "source": "local",
+        },
+        conclusion="风险等级: high（本地截图检测）",
+        recommendation="建议使用百度识图验证",
+    )
+    return merged
+
+
+def _scene_section(scene: Optional[Dict[str, Any]], reason: str) -> Dict[str, Any]:
+    if scene is None:
+        return {"location_type": "无法判断", "environment": "", "evidence": [f"来自流程：{reason}"],
+                "confidence": "low", "source": "local"}
+    return {
+        "location_type": scene["location"],
+        "environment": f"光线{scene['lighting']}，{scene['color_cast']}调",
+        "evidence": [
+            f"来自画面统计：顶部蓝天占比 {scene['sky_ratio']:.0%}，植被占比 {scene['green_ratio']:.0%}，"
+            f"亮度均值 {scene['brightness']:.0f}/255"
+        ],
+        "confidence": "low",
+        "source": "local",
+    }
+
+
+def build_local_sections(
+    image: DecodedImage,
+    cred: Dict[str, Any],
+    det: Dict[str, Any],
+    scene: Optional[Dict[str, Any]],
+    scene_reason: str = "场景统计不可用"
+) -> Dict[str, Any]:
+    """
+    用本地信号构建与完整模式同名的各分析模块
+    返回 {"web_image_check", "scene", "objects", "lifestyle", "details", "intention", "room_analysis"}
+    """
+    engine = det.get("engine", "unknown")
+    persons = det.get("persons", [])
+    labels = sorted({o["label"] for o in det.get("objects", [])})
+    try:
+        web = web_image_heuristics(image, cred.get("exif", {}), cred.get("screenshot"))
+    except Exception as e:
+        web = {"risk_level": "无法判断", "screenshot": None, "signals": [f"文件头读取失败: {e}"]}
+    scene_section = _scene_section(scene, scene_reason)
+
+    # lifestyle：本地检测到的物体（HOG 只检测人物，无物体线索）
+    lifestyle_items = []
+    hints = [LIFESTYLE_HINTS[label] for label in labels if label in LIFESTYLE_HINTS]
+    if labels:
+        lifestyle_items.append(local_item(
+            claim=f"本地检测到物体：{', '.join(labels)}",
+            evidence=[f"来自本地检测（引擎：{engine}）：物体检测结果"],
+            limitations=["无法识别品牌/价位，消费水平需 AI 分析"],
+        ))
+    if hints:
+        lifestyle_items.append(local_item(
+            claim=f"可作为生活方式线索的物品：{'、'.join(hints)}",
+            evidence=[f"来自本地检测（引擎：{engine}）：{', '.join(labels)}"],
+        ))
+    if scene is not None:
+        lifestyle_items.append(local_item(
+            claim=f"场景：{scene_section['location_type']}，{scene_section['environment']}",
+            evidence=scene_section["evidence"],
+            limitations=["按颜色统计粗略判断，可能存在误判"],
+        ))
+    if not lifestyle_items:
+        lifestyle_items.append(local_item(
+            claim="无法判断生活方式线索",
+            evidence=[f"来自本地检测（引擎：{engine}）：未检测到物体"],
+        ))
+
+    # details：本地不做文字识别，只给出截图/网图线索
+    if web["signals"]:
+        details_items = [local_item(
+            claim="发现截图/转发图的来源线索",
+            evidence=[f"来自本地检测：{s}" for s in web["signals"]],
+            limitations=["本地分析不做文字/水印识别"],
+        )]
+    else:
+        details_items = [local_item(
+            claim="未发现截图/转发图的来源线索",
+            evidence=[f"来自本地检测：尺寸 {image.dims['width']}x{image.dims['height']}，"
+                      "未发现状态栏/导航栏等界面元素，EXIF 含拍摄信息"],
+            limitations=["本地分析不做文字/水印识别"],
+        )]
+
+    # intention：按构图和来源线索粗略判断
+    main_person = max(persons, key=lambda p: p.get("conf", 0)) if persons else None
+    if web["risk_level"] == "high":
+        intention = ("可能为转发的截图而非本人拍摄", [f"来自本地检测：{web['signals'][0]}"])
+    elif main_person and main_person.get("box_height_ratio", 0) > 0.5:
+        intention = ("以人物为主体的照片（展示本人/自拍倾向）",
+                     [f"来自本地检测：主体人物检测框占画面高度约{main_person['box_height_ratio']:.0%}"])
+    elif not persons:
+        intention = ("以环境/物品为主体的照片（记录或分享场景倾向）", [f"来自本地检测（引擎：{engine}）：未检测到人物"])
+    else:
+        intention = ("照片用途倾向无法稳定判断", [f"来自本地检测：检测到 {len(persons)} 个较小的人物"])
+    intention_items = [local_item(
+        claim=intention[0],
+        evidence=intention[1],
+        limitations=["照片意图判断存在较大不确定性，仅供参考"],
+    )]
+
+    # room_analysis：只有人数线索
+    count = len(persons)
+    room_analysis = {
+        "inferred_people_count": str(count) if count in (1, 2) else "无法判断",
+        "relationship_hint": "无法判断",
+        "evidence": [f"来自本地检测（引擎：{engine}）：检测到 {count} 个人物"],
+        "clues": {},
+        "limitations": [LOCAL_ONLY_NOTE, "人数仅来自人物检测，不含床品/餐具等环境线索"],
+        "confidence": "low",
+    }
+
+    return {
+        "web_image_check": web_image_section(web),
+        "scene": scene_section,
+        "objects": {
+            "detected": labels,
+            "brands": [],
+            "evidence": [f"来自本地检测（引擎：{engine}）"] if labels else [],
+        },
+        "lifestyle": lifestyle_items,
+        "details": details_items,
+        "intention": intention_items,
+        "room_analysis": room_analysis,
+    }
@@ -3,25 +3,82 @@
 FastAPI 入口 - 网恋照片真实性验证与人物画像分析系统
 使用 Gemini 3 多模态模型进行图像分析
 """
+import asyncio
+import json
 import os
+from contextlib import asynccontextmanager
 from pathlib import Path
 from dotenv import load_dotenv
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from pipeline import analyze_image_bytes
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from typing import Any, Dict, List, Optional
 
-# 加载 .env 文件
+# 加载 .env 文件（须在导入本地模块之前：各模块在导入时读取环境变量配置）
 env_path = Path(__file__).parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
+from pipeline import ANALYSIS_MODES, LLM_DISPATCH_MODES, analyze_fast
+from result_cache import analyze_with_cache, flush_phash_index
+from qwen_client import init_http_client, close_http_client
+from llm_resilience import llm_status
+from executors import init_executor, shutdown_executor
+from model_registry import load_models, models_status
+from admission import AdmissionRejected, get_admission
+from upload_limits import MULTIPART_OVERHEAD, UploadLimitMiddleware
+from jobs import (
+    JobQueueFull, WebhookRejected, check_webhook_url, get_job_backend, new_job, public_view,
+    start_job_workers, stop_job_workers
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时创建共享 HTTP 客户端、本地分析执行池、加载检测模型并启动任务 worker，退出时关闭"""
+    init_http_client()
+    init_executor()
+    # 模型加载（含预热推理）可能耗时数秒，不阻塞事件循环
+    # 进程池模式下各子进程会在初始化时各自加载，主进程不加载
+    await load_models()
+    start_job_workers()
+    try:
+        yield
+    finally:
+        await stop_job_workers()
+        await close_http_client()
+        shutdown_executor()
+        flush_phash_index()
+
+
 app = FastAPI(
     title="网恋安全卫士",
     description="你最可靠的网恋侦探",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+MAX_SIZE_BYTES = 5 * 1024 * 1024
+ALLOWED_MIME = {"image/jpeg", "image/png", "image/webp"}
+# SSE 心跳间隔（秒），避免长时间等待模型时被代理断开
+SSE_PING_INTERVAL = 15
+# 批量分析：单次最多图片数、同时处理的图片数、同时进行的模型调用数
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", "20"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+
+# 请求体在 multipart 解析之前即按大小拦截（CORS 在外层，413 响应同样带跨域头）
+_single_upload_limit = MAX_SIZE_BYTES + MULTIPART_OVERHEAD
+app.add_middleware(
+    UploadLimitMiddleware,
+    limits={
+        "/api/analyze": _single_upload_limit,
+        "/api/analyze/stream": _single_upload_limit,
+        "/api/jobs": _single_upload_limit,
+        "/api/analyze/batch": BATCH_MAX_IMAGES * _single_upload_limit,
+    }
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -30,14 +87,64 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-MAX_SIZE_BYTES = 5 * 1024 * 1024
-ALLOWED_MIME = {"image/jpeg", "image/png", "image/webp"}
+
+def _overloaded(e: AdmissionRejected) -> HTTPException:
+    """准入拒绝 -> 429/503 + Retry-After"""
+    return HTTPException(
+        status_code=e.status_code,
+        detail=e.detail,
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+def _check_admission() -> None:
+    """队列已满时在读取上传内容之前直接拒绝"""
+    try:
+        get_admission().check()
+    except AdmissionRejected as e:
+        raise _overloaded(e)
+
+
+async def _read_upload(image: UploadFile, llm_dispatch: Optional[str]) -> memoryview:
+    """
+    校验上传参数并读取图片
+    先按已知大小拒绝超限文件，再一次性读入单个缓冲区，
+    以只读 memoryview 传给后续流程（哈希/解码/base64 均不再复制）
+    """
+    if image.content_type not in ALLOWED_MIME:
+        raise HTTPException(status_code=400, detail="Unsupported file type")
+    if llm_dispatch and llm_dispatch not in LLM_DISPATCH_MODES:
+        raise HTTPException(status_code=400, detail="Invalid llm_dispatch")
+
+    too_large = HTTPException(status_code=400, detail="File too large (max 5MB)")
+    size = image.size
+    if size is not None and size > MAX_SIZE_BYTES:
+        raise too_large
+    if size is None:
+        data = await image.read(MAX_SIZE_BYTES + 1)
+        size, buffer = len(data), memoryview(data)
+    else:
+        buffer = memoryview(bytearray(size))
+        await image.seek(0)
+        # 超过 1MB 的上传已被落盘，读取放到线程中
+        size = await asyncio.to_thread(image.file.readinto, buffer)
+    if size > MAX_SIZE_BYTES:
+        raise too_large
+    return buffer[:size].toreadonly()
+
+
+def _sse(event: str, payload: Any) -> str:
+    """格式化一条 SSE 事件"""
+    data = json.dumps(jsonable_encoder(payload), ensure_ascii=False)
+    return f"event: {event}\ndata: {data}\n\n"
 
 
 @app.post("/api/analyze")
 async def analyze(
     image: UploadFile = File(...),
-    target_gender: str = Form(default="boyfriend")
+    target_gender: str = Form(default="boyfriend"),
+    llm_dispatch: Optional[str] = Form(default=None),
+    mode: str = Form(default="full")
 ):
     """
     上传图片进行分析
@@ -45,6 +152,9 @@ async def analyze(
     - 支持格式: JPEG, PNG, WebP
     - 最大文件大小: 5MB
     - target_gender: 'boyfriend' 或 'girlfriend'
+    - llm_dispatch: 'after_local'（本地分析后再调用模型）或 'early'（立即调用模型，本地分析并行）
+    - mode: 'full'（默认）或 'fast'（不调用模型，只用本地信号在 FAST_MODE_BUDGET_MS 内返回粗略结果，
+      各项均标注为仅本地分析，_meta.mode 为 fast；不经过结果缓存和准入排队）
     
     返回包含以下分析结果:
     - lifestyle: 生活方式线索
@@ -53,20 +163,34 @@ async def analyze(
     - credibility: 可信度分析
     - person: 人物体征估计
     - girlfriend_comments: 口语化吐槽分析
+
+    服务繁忙时返回 429（队列已满）或 503（排队超时），并带 Retry-After 头
     """
-    try:
-        if image.content_type not in ALLOWED_MIME:
-            raise HTTPException(status_code=400, detail="Unsupported file type")
+    if mode not in ANALYSIS_MODES:
+        raise HTTPException(status_code=400, detail="Invalid mode")
+    if mode == "fast":
+        data = await _read_upload(image, llm_dispatch)
+        try:
+            return await analyze_fast(data, mime=image.content_type, target_gender=target_gender)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-        data = await image.read()
-        if len(data) > MAX_SIZE_BYTES:
-            raise HTTPException(status_code=400, detail="File too large (max 5MB)")
+    _check_admission()
+    try:
+        data = await _read_upload(image, llm_dispatch)
 
-        result = await analyze_image_bytes(data, mime=image.content_type, target_gender=target_gender)
+        result = await analyze_with_cache(
+            data,
+            mime=image.content_type,
+            target_gender=target_gender,
+            llm_dispatch=llm_dispatch
+        )
         return result
     except HTTPException:
         # 重新抛出 HTTP 异常
         raise
+    except AdmissionRejected as e:
+        raise _overloaded(e)
     except Exception as e:
         # 捕获其他未预期的异常
         raise HTTPException(
@@ -75,10 +199,240 @@ async def analyze(
         )
 
 
+@app.post("/api/analyze/stream")
+async def analyze_stream(
+    image: UploadFile = File(...),
+    target_gender: str = Form(default="boyfriend"),
+    llm_dispatch: Optional[str] = Form(default=None)
+):
+    """
+    上传图片进行分析（Server-Sent Events 渐进式输出）
+
+    参数与 /api/analyze 相同。各阶段完成后立即推送对应事件：
+    - credibility: 可信度分析（本地）
+    - local_detection: 本地检测结果（含 person_visibility）
+    - llm_field: 模型流式输出中刚闭合的顶层字段 {"key", "value"}（原始格式）
+    - web_image_check / person / scene / lifestyle / room_analysis / objects / details / intention /
+      girlfriend_comments: 模型相关模块
+    - result: 完整结果，与 /api/analyze 的返回完全一致
+    - error: 分析失败，data 为 {"detail": ...}；服务繁忙时另含 {"status", "retry_after"}
+    缓存命中时只推送 result 事件；队列已满时直接返回 429
+    """
+    _check_admission()
+    data = await _read_upload(image, llm_dispatch)
+    mime = image.content_type
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def on_event(event: str, payload: Any) -> None:
+        await queue.put((event, payload))
+
+    async def run() -> None:
+        try:
+            result = await analyze_with_cache(
+                data,
+                mime=mime,
+                target_gender=target_gender,
+                llm_dispatch=llm_dispatch,
+                on_event=on_event
+            )
+            await queue.put(("result", result))
+        except AdmissionRejected as e:
+            await queue.put(("error", {"detail": e.detail, "status": e.status_code, "retry_after": e.retry_after}))
+        except Exception as e:
+            await queue.put(("error", {"detail": f"Internal server error: {str(e)}"}))
+        finally:
+            await queue.put(None)
+
+    async def event_stream():
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=SSE_PING_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if item is None:
+                    break
+                yield _sse(*item)
+        finally:
+            # 客户端断开时取消分析任务
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/api/analyze/batch")
+async def analyze_batch(
+    images: List[UploadFile] = File(...),
+    target_gender: str = Form(default="boyfriend"),
+    llm_dispatch: Optional[str] = Form(default=None),
+    stream: bool = Form(default=False)
+):
+    """
+    批量上传图片进行分析
+
+    - images: 多张图片（单次最多 BATCH_MAX_IMAGES 张），其余参数与 /api/analyze 相同
+    - 本地分析在执行池中并行，模型调用并发数受 BATCH_LLM_CONCURRENCY 限制
+    - 同样受全局准入控制约束：读取上传内容前先做准入预检（队列已满时整批返回 429/503），
+      之后服务繁忙时对应项失败并带 retry_after
+    - 单张图片失败不影响其他图片，每项为
+      {"index", "filename", "ok": true, "result": {...}} 或 {"index", "filename", "ok": false, "error": "..."}
+    - stream=false：按上传顺序返回 {"results": [...], "summary": {...}}
+    - stream=true：SSE，每张完成即推送 item 事件，最后推送 done 事件（summary）
+    """
+    if not images:
+        raise HTTPException(status_code=400, detail="No images")
+    if len(images) > BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=400, detail=f"Too many images (max {BATCH_MAX_IMAGES})")
+    if llm_dispatch and llm_dispatch not in LLM_DISPATCH_MODES:
+        raise HTTPException(status_code=400, detail="Invalid llm_dispatch")
+
+    _check_admission()
+    item_semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    llm_semaphore = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def read_item(upload: UploadFile) -> Dict[str, Any]:
+        loaded: Dict[str, Any] = {"mime": upload.content_type}
+        try:
+            loaded["data"] = await _read_upload(upload, llm_dispatch)
+        except HTTPException as e:
+            loaded["error"] = e.detail
+        return loaded
+
+    # 非流式时接口函数等全部完成才返回，上传文件一直可读：在处理名额内逐张读取，
+    # 同时驻留内存的图片不超过 BATCH_CONCURRENCY 张；
+    # 流式时上传文件在接口函数返回后会被关闭（流式响应在此之后才执行），因此先读取并逐张校验
+    preloaded: Optional[List[Optional[Dict[str, Any]]]] = None
+    if stream:
+        preloaded = [await read_item(upload) for upload in images]
+
+    async def run_item(index: int, upload: UploadFile) -> Dict[str, Any]:
+        item: Dict[str, Any] = {"index": index, "filename": upload.filename}
+        async with item_semaphore:
+            if preloaded is not None:
+                loaded, preloaded[index] = preloaded[index], None
+            else:
+                loaded = await read_item(upload)
+            if "error" in loaded:
+                item.update({"ok": False, "error": loaded["error"]})
+                return item
+            try:
+                item["result"] = await analyze_with_cache(
+                    loaded["data"],
+                    mime=loaded["mime"],
+                    target_gender=target_gender,
+                    llm_dispatch=llm_dispatch,
+                    llm_semaphore=llm_semaphore
+                )
+                item["ok"] = True
+            except AdmissionRejected as e:
+                item.update({"ok": False, "error": e.detail, "retry_after": e.retry_after})
+            except Exception as e:
+                item.update({"ok": False, "error": f"Internal server error: {str(e)}"})
+        return item
+
+    def summarize(items: List[Dict[str, Any]]) -> Dict[str, int]:
+        succeeded = sum(1 for it in items if it["ok"])
+        return {"total": len(items), "succeeded": succeeded, "failed": len(items) - succeeded}
+
+    tasks = [asyncio.create_task(run_item(index, upload)) for index, upload in enumerate(images)]
+
+    if not stream:
+        try:
+            results = await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        return {"results": results, "summary": summarize(results)}
+
+    async def event_stream():
+        done_items: List[Dict[str, Any]] = []
+        pending = set(tasks)
+        try:
+            while pending:
+                finished, pending = await asyncio.wait(
+                    pending, timeout=SSE_PING_INTERVAL, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not finished:
+                    yield ": ping\n\n"
+                    continue
+                for task in finished:
+                    item = task.result()
+                    done_items.append(item)
+                    yield _sse("item", item)
+            yield _sse("done", summarize(done_items))
+        finally:
+            # 客户端断开时取消剩余任务
+            for task in pending:
+                task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/api/jobs", status_code=202)
+async def create_job(
+    image: UploadFile = File(...),
+    target_gender: str = Form(default="boyfriend"),
+    llm_dispatch: Optional[str] = Form(default=None),
+    webhook_url: Optional[str] = Form(default=None)
+):
+    """
+    提交异步分析任务，立即返回任务 id
+
+    - 参数与 /api/analyze 相同
+    - webhook_url: 可选，任务结束后 POST {"job_id", "status", "result", "error"} 到该地址
+      （主机须在 JOB_WEBHOOK_ALLOWED_HOSTS 白名单内，且解析到公网地址）
+    - 通过 GET /api/jobs/{job_id} 查询状态（queued / running / succeeded / failed）和结果
+    """
+    if webhook_url:
+        try:
+            check_webhook_url(webhook_url)
+        except WebhookRejected as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    data = await _read_upload(image, llm_dispatch)
+
+    job = new_job(image.content_type, target_gender, llm_dispatch, webhook_url)
+    try:
+        await get_job_backend().submit(job, data)
+    except JobQueueFull:
+        raise HTTPException(status_code=429, detail="Job queue is full", headers={"Retry-After": "30"})
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "poll_url": f"/api/jobs/{job['job_id']}"
+    }
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """查询异步任务状态；成功时包含 result（与 /api/analyze 的返回一致）"""
+    job = await get_job_backend().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return public_view(job)
+
+
 @app.get("/health")
 async def health_check():
     """健康检查接口"""
-    return {"status": "ok", "provider": "openrouter", "model": os.getenv("OPENROUTER_MODEL", "google/gemini-3-pro-preview")}
+    return {
+        "status": "ok",
+        "provider": "openrouter",
+        "model": os.getenv("OPENROUTER_MODEL", "google/gemini-3-pro-preview"),
+        "models": models_status(),
+        "admission": get_admission().stats(),
+        "llm": llm_status()
+    }
 
 
 # 静态文件服务（Docker部署时使用）
@@ -0,0 +1,82 @@
+# server/micro_batcher.py
+"""
+检测推理的微批处理
+并发请求在执行池线程中调用 submit()，batcher 线程把 max_wait_ms 内到达的输入（最多 max_batch 个）
+合并成一次批量推理，再把每个结果交还给对应的调用线程
+多个 batcher 线程共享同一个队列：空闲时各自处理到达的请求，积压时每个线程都能凑满一批
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+
+class MicroBatcher:
+    """run_batch(输入列表) -> 等长结果列表；异常会传给这一批的所有调用方"""
+
+    def __init__(
+        self,
+        name: str,
+        run_batch: Callable[[Sequence[Any]], List[Any]],
+        max_batch: int,
+        max_wait_ms: float,
+        workers: int = 1
+    ):
+        self.name = name
+        self.run_batch = run_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue: "queue.Queue[Tuple[Any, Future]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._largest = 0
+        for i in range(max(1, workers)):
+            threading.Thread(target=self._loop, name=f"{name}-batcher-{i}", daemon=True).start()
+
+    def submit(self, item: Any) -> Any:
+        """阻塞直到该输入所在的批次完成，返回其结果"""
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future.result()
+
+    def _collect(self) -> List[Tuple[Any, Future]]:
+        """取到第一个输入后继续等待，直到凑满 max_batch 或超过 max_wait"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._collect()
+            try:
+                results = self.run_batch([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            with self._lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._largest = max(self._largest, len(batch))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_batch": self.max_batch,
+                "max_wait_ms": round(self.max_wait * 1000, 1),
+                "batches": self._batches,
+                "items": self._items,
+                "avg_batch": round(self._items / self._batches, 2) if self._batches else 0.0,
+                "largest_batch": self._largest,
+                "queued": self._queue.qsize(),
+            }
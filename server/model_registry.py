@@ -0,0 +1,229 @@
+# server/model_registry.py
+"""
+进程级检测模型注册表
+应用启动时一次性加载 HOG / ONNX / YOLO 检测器和人脸检测器（可选预热推理），
+每种检测器维护一个小型实例池，供执行池中的多个线程安全地借用；
+开启微批处理时，ONNX / YOLO 的并发请求经 MicroBatcher 合并为批量推理
+进程池模式下检测只在子进程中运行，模型由各子进程初始化时加载，主进程不加载（见 load_models）
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import cv2
+
+from executors import CPU_COUNT, LOCAL_EXECUTOR, LOCAL_WORKERS, run_cpu
+from micro_batcher import MicroBatcher
+
+# 每种检测器的实例数：线程池模式下与 worker 数一致，保证并发请求不互相等待；
+# 进程池模式下每个子进程同一时刻只跑一个任务，1 个实例即可
+DETECTOR_POOL_SIZE = int(os.getenv(
+    "DETECTOR_POOL_SIZE",
+    "1" if LOCAL_EXECUTOR == "process" else str(LOCAL_WORKERS)
+))
+# 启动时是否用空白图做一次预热推理（YOLO 首次推理会初始化大量内部状态）
+DETECTOR_WARMUP = os.getenv("DETECTOR_WARMUP", "1") not in ("0", "false", "False")
+# 借用实例的最长等待时间（秒）
+DETECTOR_ACQUIRE_TIMEOUT = float(os.getenv("DETECTOR_ACQUIRE_TIMEOUT", "30"))
+YOLO_MODEL_PATH = os.getenv("YOLO_MODEL", "yolov8n.pt")
+# ONNX Runtime 引擎：导出的 YOLOv8 模型（可为 INT8 量化版本），文件不存在或未安装 onnxruntime 时不可用
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL", "yolov8n.onnx")
+# 每个 ONNX 实例的推理线程数，默认与 OPENCV_THREADS 一样按执行池平分 CPU
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", str(max(1, CPU_COUNT // LOCAL_WORKERS))))
+DETECTOR_CONF = float(os.getenv("DETECTOR_CONF", "0.25"))
+DETECTOR_IOU = float(os.getenv("DETECTOR_IOU", "0.7"))
+# 微批处理：并发请求最多合并 DETECTOR_BATCH_SIZE 张图做一次推理，第一张到达后最多等待 DETECTOR_BATCH_WAIT_MS
+# 默认关闭（1）：只有多核机器上批量推理比逐张推理吞吐更高时才值得开启（见 bench/bench_batching.py）；
+# 进程池模式下每个子进程同一时刻只有一个请求，开启无效
+DETECTOR_BATCH_SIZE = int(os.getenv("DETECTOR_BATCH_SIZE", "1"))
+DETECTOR_BATCH_WAIT_MS = float(os.getenv("DETECTOR_BATCH_WAIT_MS", "5"))
+# 人脸检测：OpenCV DNN 的 YuNet 模型（face_detection_yunet_2023mar.onnx），文件不存在时回退到 OpenCV 自带的 Haar 级联
+FACE_MODEL_PATH = os.getenv("FACE_MODEL", "face_detection_yunet_2023mar.onnx")
+FACE_CONF = float(os.getenv("FACE_CONF", "0.6"))
+FACE_CASCADE_PATH = os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+
+
+class InstancePool:
+    """固定大小的实例池，借出的实例同一时刻只被一个线程使用"""
+
+    def __init__(self, name: str, factory: Callable[[], Any], size: int):
+        self.name = name
+        self.size = max(1, size)
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        for _ in range(self.size):
+            self._queue.put(factory())
+        self._sample = self._queue.queue[0]
+
+    def peek(self) -> Any:
+        """读取实例的只读属性（如模型输入尺寸）时使用，不借出实例"""
+        return self._sample
+
+    @contextmanager
+    def acquire(self, timeout: Optional[float] = DETECTOR_ACQUIRE_TIMEOUT) -> Iterator[Any]:
+        instance = self._queue.get(timeout=timeout)
+        try:
+            yield instance
+        finally:
+            self._queue.put(instance)
+
+    def available(self) -> int:
+        return self._queue.qsize()
+
+
+def _make_hog() -> cv2.HOGDescriptor:
+    hog = cv2.HOGDescriptor()
+    hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+    return hog
+
+
+def _make_yolo() -> Any:
+    from ultralytics import YOLO
+    return YOLO(YOLO_MODEL_PATH)
+
+
+def _make_onnx() -> Any:
+    if not os.path.exists(ONNX_MODEL_PATH):
+        raise FileNotFoundError(ONNX_MODEL_PATH)
+    from onnx_detector import OnnxYoloDetector
+    return OnnxYoloDetector(
+        ONNX_MODEL_PATH, threads=ONNX_THREADS, conf=DETECTOR_CONF, iou=DETECTOR_IOU,
+        max_batch=DETECTOR_BATCH_SIZE
+    )
+
+
+def _make_face_dnn() -> Any:
+    if not os.path.exists(FACE_MODEL_PATH):
+        raise FileNotFoundError(FACE_MODEL_PATH)
+    from face_detector import YuNetFaceDetector
+    return YuNetFaceDetector(FACE_MODEL_PATH, conf=FACE_CONF)
+
+
+def _make_face_cascade() -> Any:
+    from face_detector import CascadeFaceDetector
+    return CascadeFaceDetector(FACE_CASCADE_PATH)
+
+
+_pools: Dict[str, InstancePool] = {}
+_batchers: Dict[str, MicroBatcher] = {}
+_status: Dict[str, Dict[str, Any]] = {}
+# 进程池模式：某个子进程上报的加载状态（主进程本身不加载模型）
+_worker_status: Dict[str, Dict[str, Any]] = {}
+_init_lock = threading.Lock()
+_batcher_lock = threading.Lock()
+_initialized = False
+
+
+def _load(name: str, factory: Callable[[], Any], warmup: Optional[Callable[[Any], None]]) -> None:
+    """加载单个检测器池并记录状态；失败不影响其他检测器"""
+    _status[name] = {"state": "loading"}
+    t0 = time.perf_counter()
+    try:
+        pool = InstancePool(name, factory, DETECTOR_POOL_SIZE)
+        if warmup is not None:
+            with pool.acquire() as instance:
+                warmup(instance)
+    except (ImportError, FileNotFoundError):
+        _status[name] = {"state": "unavailable"}
+        return
+    except Exception as e:
+        print(f"[Registry] Failed to load {name}: {e}")
+        _status[name] = {"state": "error", "error": str(e)}
+        return
+    _pools[name] = pool
+    _status[name] = {
+        "state": "ready",
+        "instances": pool.size,
+        "load_ms": round((time.perf_counter() - t0) * 1000, 1),
+        "warmed_up": warmup is not None,
+    }
+
+
+def init_models(warmup: bool = DETECTOR_WARMUP) -> Dict[str, Dict[str, Any]]:
+    """加载所有检测器（幂等）。返回各检测器的就绪状态"""
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return _status
+        blank = np.zeros((640, 640, 3), dtype=np.uint8)
+        _load(
+            "hog",
+            _make_hog,
+            (lambda hog: hog.detectMultiScale(blank, winStride=(8, 8))) if warmup else None,
+        )
+        _load(
+            "onnx",
+            _make_onnx,
+            (lambda detector: detector.detect(blank)) if warmup else None,
+        )
+        _load(
+            "yolo",
+            _make_yolo,
+            (lambda model: model.predict(source=blank, verbose=False)) if warmup else None,
+        )
+        _load(
+            "face_dnn",
+            _make_face_dnn,
+            (lambda detector: detector.detect(blank)) if warmup else None,
+        )
+        _load("face_cascade", _make_face_cascade, None)
+        _initialized = True
+        return _status
+
+
+async def load_models() -> Dict[str, Dict[str, Any]]:
+    """
+    应用启动时加载检测模型
+    线程池模式在主进程中加载（放到线程中，预热推理可能耗时数秒）；
+    进程池模式下子进程初始化时各自加载，主进程只在一个子进程中触发加载并记录其状态供 /health 使用
+    """
+    if LOCAL_EXECUTOR == "process":
+        status = await run_cpu(init_models)
+        _worker_status.update(status)
+        return status
+    return await asyncio.to_thread(init_models)
+
+
+def get_pool(name: str) -> Optional[InstancePool]:
+    """获取检测器实例池；未初始化时按需加载（或等待正在进行的加载），不可用时返回 None"""
+    if not _initialized:
+        init_models(warmup=False)
+    return _pools.get(name)
+
+
+def get_batcher(name: str, run_batch: Callable[[Sequence[Any]], List[Any]]) -> Optional[MicroBatcher]:
+    """
+    获取检测器的微批处理器（首次调用时创建，每个池实例对应一个 batcher 线程）
+    未开启微批处理或检测器不可用时返回 None，调用方直接单张推理
+    """
+    if DETECTOR_BATCH_SIZE <= 1:
+        return None
+    pool = get_pool(name)
+    if pool is None:
+        return None
+    batcher = _batchers.get(name)
+    if batcher is None:
+        with _batcher_lock:
+            batcher = _batchers.get(name)
+            if batcher is None:
+                batcher = MicroBatcher(name, run_batch, DETECTOR_BATCH_SIZE, DETECTOR_BATCH_WAIT_MS, pool.size)
+                _batchers[name] = batcher
+    return batcher
+
+
+def models_status() -> Dict[str, Any]:
+    """供 /health 使用的就绪状态（进程池模式下为子进程上报的状态，不含可用实例数）"""
+    status = _status or _worker_status
+    return {
+        "ready": status.get("hog", {}).get("state") == "ready",
+        "executor": LOCAL_EXECUTOR,
+        "detectors": {
+            name: {**info, "available": _pools[name].available()} if name in _pools else info
+            for name, info in status.items()
+        },
+        "batching": {name: batcher.stats() for name, batcher in _batchers.items()},
+    }
@@ -1,13 +1,15 @@
 # server/modules_credibility.py
 """
-可信度分析模块：EXIF 提取 + 模糊度检测 + 角度影响评估
+可信度分析模块：EXIF 提取 + 文件头取证预检 + 图像质量指标（模糊度/噪声/曝光/饱和度） + 角度影响评估
 """
-from typing import Any, Dict, List, Optional
-import io
+from typing import Any, Dict, List, Optional, Union
 
-import numpy as np
-import cv2
-from PIL import Image, ExifTags
+from PIL import ExifTags
+
+from forensic_triage import EDITING_SOFTWARE, forensic_triage, triage_summary
+from image_artifact import DecodedImage, as_decoded
+from image_quality import QUALITY_MAX_SIDE, quality_metrics
+from screenshot_detector import detect_screenshot
 
 
 def mk_item(
@@ -38,7 +40,7 @@ def mk_item(
     }
 
 
-def _extract_exif(image_bytes: bytes) -> Dict[str, Any]:
+def _extract_exif(image: DecodedImage) -> Dict[str, Any]:
     """
     提取图片 EXIF 元数据
     包括相机信息、拍摄时间、GPS、焦距等
@@ -54,8 +56,7 @@ def _extract_exif(image_bytes: bytes) -> Dict[str, Any]:
     }
     
     try:
-        img = Image.open(io.BytesIO(image_bytes))
-        exif = img.getexif()
+        exif = image.exif
         
         if not exif:
             return exif_out
@@ -102,39 +103,6 @@ def _extract_exif(image_bytes: bytes) -> Dict[str, Any]:
     return exif_out
 
 
-def _blur_score(image_bytes: bytes) -> float:
-    """
-    计算图片模糊度
-    使用 Laplacian 方差法：数值越高通常越清晰
-    """
-    try:
-        img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        arr = np.array(img)
-        gray = cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY)
-        return float(cv2.Laplacian(gray, cv2.CV_64F).var())
-    except Exception:
-        return -1.0
-
-
-def _noise_estimate(image_bytes: bytes) -> float:
-    """
-    估计图片噪声水平（简单版本）
-    使用高频分量的标准差
-    """
-    try:
-        img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        arr = np.array(img).astype(np.float32)
-        gray = cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY)
-        
-        # 高通滤波提取高频分量
-        blur = cv2.GaussianBlur(gray, (5, 5), 0)
-        high_freq = gray - blur
-        
-        return float(np.std(high_freq))
-    except Exception:
-        return -1.0
-
-
 def _angle_impact_from_exif(exif: Dict[str, Any]) -> Dict[str, str]:
     """
     评估角度影响（基于焦距的广角畸变风险）
@@ -168,52 +136,97 @@ def _angle_impact_from_exif(exif: Dict[str, Any]) -> Dict[str, str]:
     }
 
 
-def _check_editing_hints(exif: Dict[str, Any]) -> List[str]:
-    """检查可能的编辑痕迹提示"""
+def _check_editing_hints(exif: Dict[str, Any], triage: Optional[Dict[str, Any]] = None) -> List[str]:
+    """检查可能的编辑痕迹提示（文件头预检可用时包含 XMP 编辑历史、Photoshop 资源块等）"""
     hints = []
     
-    software = exif.get("software")
-    if software:
-        software_lower = str(software).lower()
-        # 常见图片编辑软件
-        editing_keywords = ["photoshop", "lightroom", "snapseed", "vsco", 
-                          "美图", "facetune", "picsart", "gimp"]
-        for kw in editing_keywords:
-            if kw in software_lower:
-                hints.append(f"EXIF 显示软件字段包含 '{software}'（可能经过编辑）")
-                break
+    if triage and "editing" in triage:
+        hints.extend(f"来自文件头：{hint}（可能经过编辑）" for hint in triage["editing"])
+    else:
+        software = exif.get("software")
+        if software:
+            software_lower = str(software).lower()
+            for kw in EDITING_SOFTWARE:
+                if kw in software_lower:
+                    hints.append(f"来自EXIF：EXIF 显示软件字段包含 '{software}'（可能经过编辑）")
+                    break
     
     # 如果没有任何 EXIF 信息，也值得注意
     if not exif.get("camera") and not exif.get("datetime"):
-        hints.append("EXIF 元数据几乎为空（可能被清除或来自截图/网络图片）")
+        hints.append("来自EXIF：EXIF 元数据几乎为空（可能被清除或来自截图/网络图片）")
     
     return hints
 
 
-def credibility_module(image_bytes: bytes) -> Dict[str, Any]:
+def header_context(
+    image: Union[bytes, DecodedImage],
+    triage: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    仅依赖文件头即可获得的廉价上下文（EXIF + 焦距角度影响 + 取证预检摘要）
+    用于在本地像素分析完成前提前发起 LLM 请求；triage 为流水线已完成的预检结果（未传入时在这里计算）
+    """
+    image = as_decoded(image)
+    exif = _extract_exif(image)
+    context = {
+        "exif": exif,
+        "angle_impact": _angle_impact_from_exif(exif).get("level", "未知"),
+    }
+    try:
+        context["forensics"] = triage_summary(triage if triage is not None else forensic_triage(image))
+    except Exception:
+        pass
+    return context
+
+
+def credibility_module(
+    image: Union[bytes, DecodedImage],
+    preview_side: Optional[int] = None,
+    triage: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
     """
     可信度分析主入口
     
+    Args:
+        image: 共享的 DecodedImage（兼容直接传入图片字节）
+        preview_side: 指定时质量指标在该尺寸的低分辨率预览上计算（快速模式，不做全尺寸解码）
+        triage: 流水线已完成的文件头取证预检结果（未传入时在这里计算）
+    
     返回：
     - items: 标准化分析项列表
     - exif: 原始 EXIF 数据
     - blur_score: 模糊度分数
+    - noise_estimate: 噪声估计
+    - quality: 完整质量指标（曝光/裁切/饱和度，见 image_quality）
     - angle_impact: 角度影响评估
+    - screenshot: 本地截图检测结果（见 screenshot_detector）
+    - triage: 文件头取证预检结果（见 forensic_triage）
     """
+    image = as_decoded(image)
+
+    if triage is None:
+        try:
+            triage = forensic_triage(image)
+        except Exception as e:
+            triage = {"_error": str(e)}
+
     try:
-        exif = _extract_exif(image_bytes)
+        exif = _extract_exif(image)
     except Exception as e:
         exif = {"_error": str(e)}
-    
+
     try:
-        blur = _blur_score(image_bytes)
+        quality = quality_metrics(image, preview_side)
+        blur, noise = quality["blur"], quality["noise"]
     except Exception as e:
-        blur = -1.0
-    
+        quality = {"_error": str(e)}
+        blur, noise = -1.0, -1.0
+
     try:
-        noise = _noise_estimate(image_bytes)
+        screenshot = detect_screenshot(image, preview_side)
     except Exception as e:
-        noise = -1.0
+        screenshot = {"is_screenshot": False, "level": "none", "score": 0.0, "platform": None,
+                      "signals": [], "features": {}, "_error": str(e)}
 
     items = []
     
@@ -235,11 +248,33 @@ def credibility_module(image_bytes: bytes) -> Dict[str, Any]:
         claim=sharp_text,
         evidence=[
             f"来自画面：模糊度指标（Laplacian 方差）≈ {blur:.1f}（数值越高通常越清晰）"
+            + ("，在低分辨率预览上计算" if preview_side else f"，统一缩放到长边 {QUALITY_MAX_SIDE}px 后计算")
         ],
-        limitations=["模糊度指标受分辨率、噪声、锐化影响；仅作技术线索"],
+        limitations=["模糊度指标受噪声、锐化影响；仅作技术线索"],
         confidence=conf,
     ))
 
+    # 1b. 曝光 / 饱和度异常（正常时不输出）
+    if "exposure" in quality:
+        exposure, clipping, saturation = quality["exposure"], quality["clipping"], quality["saturation"]
+        if exposure["label"] != "正常":
+            items.append(mk_item(
+                claim=f"画面{exposure['label']}",
+                evidence=[
+                    f"来自画面：平均亮度 {exposure['mean']:.0f}/255，"
+                    f"高光裁切 {clipping['highlights']:.1%}，暗部裁切 {clipping['shadows']:.1%}"
+                ],
+                limitations=["逆光、夜景等场景本身可能导致曝光异常；仅作技术线索"],
+                confidence="low",
+            ))
+        if saturation["clipped"] >= 0.05:
+            items.append(mk_item(
+                claim="色彩饱和度偏高（可能经过滤镜/调色处理）",
+                evidence=[f"来自画面：{saturation['clipped']:.1%} 的像素饱和度接近上限，平均饱和度 {saturation['mean']:.0f}/255"],
+                limitations=["鲜艳的物体/霓虹灯等场景也会出现高饱和度；仅作参考线索"],
+                confidence="low",
+            ))
+
     # 2. EXIF 元数据分析
     exif_evidence = []
     if exif.get("camera"):
@@ -269,15 +304,33 @@ def credibility_module(image_bytes: bytes) -> Dict[str, Any]:
         ))
 
     # 3. 编辑痕迹提示
-    editing_hints = _check_editing_hints(exif)
+    editing_hints = _check_editing_hints(exif, triage)
     if editing_hints:
         items.append(mk_item(
             claim="检测到可能的编辑痕迹提示",
-            evidence=[f"来自EXIF：{hint}" for hint in editing_hints],
+            evidence=editing_hints,
             limitations=["软件标记可能被修改；仅作参考线索"],
             confidence="low",
         ))
 
+    # 4. 文件头取证线索（编码器 / JPEG 质量 / ICC / XMP）
+    if triage.get("signals"):
+        items.append(mk_item(
+            claim="文件头取证线索（编码来源/压缩质量/色彩配置）",
+            evidence=[f"来自文件头：{s}" for s in triage["signals"]],
+            limitations=["量化表和元数据可被重新编码或改写；编码器来源为基于特征的推测"],
+            confidence="low",
+        ))
+
+    # 5. 手机截图 / App 界面
+    if screenshot["is_screenshot"]:
+        items.append(mk_item(
+            claim="检测到手机截图特征（可能是他人社交平台内容的截图，而非本人拍摄）",
+            evidence=[f"来自画面：{s}" for s in screenshot["signals"]],
+            limitations=["基于界面元素的启发式判断；裁剪过的截图或屏幕翻拍可能漏检"],
+            confidence="medium" if screenshot["level"] == "high" else "low",
+        ))
+
     # 角度影响评估
     angle = _angle_impact_from_exif(exif)
 
@@ -286,5 +339,8 @@ def credibility_module(image_bytes: bytes) -> Dict[str, Any]:
         "exif": exif,
         "blur_score": blur,
         "noise_estimate": noise,
+        "quality": quality,
         "angle_impact": angle,
+        "screenshot": screenshot,
+        "triage": triage,
     }
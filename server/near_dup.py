@@ -0,0 +1,245 @@
+# server/near_dup.py
+"""
+感知哈希近重复检索
+对解码后的图片计算 64 位 pHash（DCT 低频），
+内存中只保存紧凑的 numpy 数组（哈希 / 写入时间 / SQLite rowid，每条 24 字节），
+查询时对全部哈希做向量化异或 + popcount，百万级指纹下约 3ms、内存约 24MB；
+结果缓存 key 只存在 SQLite（未配置目录时为内存数据库），命中后按 rowid 取回
+哈希从低分辨率预览计算（JPEG 在 DCT 阶段缩小解码），不生成全尺寸数组
+"""
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import cv2
+
+from image_artifact import DecodedImage
+
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP_ENABLED", "1") not in ("0", "false", "False")
+# 视为同一张图的最大汉明距离（64 位 pHash）
+NEAR_DUP_MAX_DISTANCE = int(os.getenv("NEAR_DUP_MAX_DISTANCE", "8"))
+
+# 计算哈希使用的预览长边
+PHASH_PREVIEW_SIDE = 256
+# 清理过期记录的最小间隔（秒）
+PRUNE_INTERVAL = 600
+# 磁盘清理每批删除的条数
+PRUNE_BATCH = 1000
+# 写入磁盘的批量提交：累计条数或距上次提交的秒数达到任一阈值时提交
+COMMIT_EVERY = 64
+COMMIT_INTERVAL = 1.0
+# 内存数组初始容量；删除标记的空槽超过一半时压缩
+INITIAL_CAPACITY = 1024
+
+
+def compute_phash(image: DecodedImage) -> int:
+    """
+    64 位 pHash：灰度缩放到 32x32 -> DCT -> 取左上 8x8 低频系数与中位数比较
+    对缩放、重压缩、轻微裁剪和调色鲁棒
+    在 preview 上计算：全尺寸图已解码时复用 RGB 金字塔，否则只做缩小解码
+    """
+    rgb, _ = image.preview(PHASH_PREVIEW_SIDE)
+    gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    # 直流分量不参与中位数计算，避免整体亮度主导
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _to_signed(h: int) -> int:
+    """SQLite INTEGER 为有符号 64 位"""
+    return h - (1 << 64) if h >= 1 << 63 else h
+
+
+class PerceptualIndex:
+    """
+    向量化汉明距离索引 + SQLite 存储
+    每条记录：(哈希, 结果缓存 key, 写入时间)；同一 key 只保留最新一条，超过 ttl 的记录不再返回并定期清理
+    内存数组中每个槽的 id：正数为 SQLite rowid，负数为尚未写入磁盘的记录（key 在 _pending 中），0 为已删除
+    新记录先进入 _pending，累计 COMMIT_EVERY 条或超过 COMMIT_INTERVAL 秒时在一个事务中写入
+    锁分两把：_db_lock 串行化 SQLite 与 _pending，_lock 只保护内存数组（查询只在向量扫描期间持有）
+    """
+
+    def __init__(self, directory: Optional[str] = None, ttl: Optional[int] = None):
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._ttl = ttl
+        self._hashes = np.zeros(INITIAL_CAPACITY, dtype=np.uint64)
+        self._created = np.zeros(INITIAL_CAPACITY, dtype=np.float64)
+        self._ids = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self._count = 0
+        self._dead = 0
+        self._pruned_at = time.time()
+        # 未写入磁盘的记录：临时 id（负数） -> (key, 哈希, 写入时间)
+        self._pending: Dict[int, Tuple[str, int, float]] = {}
+        self._pending_ids: Dict[str, int] = {}
+        self._next_pending = -1
+        self._flushed_at = time.time()
+        if directory:
+            Path(directory).mkdir(parents=True, exist_ok=True)
+            path = str(Path(directory) / "phash.sqlite3")
+        else:
+            path = ":memory:"
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS phashes ("
+            " key TEXT PRIMARY KEY, hash INTEGER NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS phashes_created_at ON phashes (created_at)")
+        if ttl:
+            self._conn.execute("DELETE FROM phashes WHERE created_at < ?", (time.time() - ttl,))
+        self._conn.commit()
+        cursor = self._conn.execute("SELECT rowid, hash, created_at FROM phashes")
+        while True:
+            rows = cursor.fetchmany(65536)
+            if not rows:
+                break
+            ids, hashes, created = zip(*rows)
+            self._append(np.array(hashes, dtype=np.int64).view(np.uint64), np.array(created), np.array(ids))
+
+    def __len__(self) -> int:
+        return self._count - self._dead
+
+    def _append(self, hashes: np.ndarray, created: np.ndarray, ids: np.ndarray) -> None:
+        end = self._count + len(hashes)
+        if end > len(self._hashes):
+            capacity = max(end, len(self._hashes) * 2)
+            for name in ("_hashes", "_created", "_ids"):
+                old = getattr(self, name)
+                grown = np.zeros(capacity, dtype=old.dtype)
+                grown[:self._count] = old[:self._count]
+                setattr(self, name, grown)
+        self._hashes[self._count:end] = hashes
+        self._created[self._count:end] = created
+        self._ids[self._count:end] = ids
+        self._count = end
+
+    def _mark_dead(self, mask: np.ndarray) -> None:
+        """mask 为前 _count 个槽上的布尔数组（只应包含存活的槽）；空槽过半时压缩数组"""
+        self._ids[:self._count][mask] = 0
+        self._dead += int(np.count_nonzero(mask))
+        if self._dead * 2 > self._count:
+            live = self._ids[:self._count] != 0
+            n = int(np.count_nonzero(live))
+            self._hashes[:n] = self._hashes[:self._count][live]
+            self._created[:n] = self._created[:self._count][live]
+            self._ids[:n] = self._ids[:self._count][live]
+            self._ids[n:self._count] = 0
+            self._count, self._dead = n, 0
+
+    def _flush(self, now: float, force: bool = False) -> None:
+        """把 _pending 在一个事务中写入磁盘，并把内存中的临时 id 换成 rowid（调用方持有 _db_lock）"""
+        if not self._pending or not (
+            force or len(self._pending) >= COMMIT_EVERY or now - self._flushed_at >= COMMIT_INTERVAL
+        ):
+            return
+        rowids = np.zeros(-self._next_pending, dtype=np.int64)
+        with self._conn:
+            for pending_id, (key, h, created_at) in self._pending.items():
+                cursor = self._conn.execute(
+                    "INSERT OR REPLACE INTO phashes (key, hash, created_at) VALUES (?, ?, ?)",
+                    (key, _to_signed(h), created_at),
+                )
+                rowids[-pending_id - 1] = cursor.lastrowid
+        with self._lock:
+            ids = self._ids[:self._count]
+            slots = np.flatnonzero(ids < 0)
+            ids[slots] = rowids[-ids[slots] - 1]
+        self._pending.clear()
+        self._pending_ids.clear()
+        self._next_pending = -1
+        self._flushed_at = now
+
+    def _prune(self, now: float) -> None:
+        """
+        删除过期记录，最多每 PRUNE_INTERVAL 秒一次
+        内存为向量化标记；磁盘走 created_at 索引分批删除，每批之间释放 _db_lock
+        """
+        if not self._ttl or now - self._pruned_at < min(PRUNE_INTERVAL, self._ttl):
+            return
+        self._pruned_at = now
+        cutoff = now - self._ttl
+        with self._lock:
+            n = self._count
+            self._mark_dead((self._ids[:n] != 0) & (self._created[:n] < cutoff))
+        with self._db_lock:
+            self._flush(now, force=True)
+        while True:
+            with self._db_lock, self._conn:
+                deleted = self._conn.execute(
+                    "DELETE FROM phashes WHERE rowid IN"
+                    " (SELECT rowid FROM phashes WHERE created_at < ? LIMIT ?)",
+                    (cutoff, PRUNE_BATCH),
+                ).rowcount
+            if deleted < PRUNE_BATCH:
+                break
+
+    def add(self, h: int, key: str) -> None:
+        now = time.time()
+        with self._db_lock:
+            old = self._pending_ids.get(key)
+            if old is not None:
+                del self._pending[old]
+            else:
+                row = self._conn.execute("SELECT rowid FROM phashes WHERE key = ?", (key,)).fetchone()
+                old = row[0] if row is not None else None
+            pending_id = self._next_pending
+            self._next_pending -= 1
+            self._pending[pending_id] = (key, h, now)
+            self._pending_ids[key] = pending_id
+            # 内存更新也在 _db_lock 内进行，保证同一 key 的并发写入按顺序生效
+            with self._lock:
+                if old is not None:
+                    self._mark_dead(self._ids[:self._count] == old)
+                self._append(np.array([h], dtype=np.uint64), np.array([now]), np.array([pending_id]))
+            self._flush(now)
+        self._prune(now)
+
+    def flush(self) -> None:
+        """立即写入尚未落盘的记录（进程退出前调用）"""
+        with self._db_lock:
+            self._flush(time.time(), force=True)
+
+    def query(self, h: int, max_distance: int, key_suffix: str = "") -> List[Tuple[int, str]]:
+        """
+        返回距离 <= max_distance 的 (距离, key) 列表，按距离升序
+        key_suffix 用于过滤 target_gender/模型/llm_dispatch 不同的记录
+        """
+        now = time.time()
+        with self._lock:
+            n = self._count
+            distances = np.bitwise_count(self._hashes[:n] ^ np.uint64(h))
+            mask = (distances <= max_distance) & (self._ids[:n] != 0)
+            if self._ttl:
+                mask &= self._created[:n] >= now - self._ttl
+            hits = np.flatnonzero(mask)
+            found = dict(zip(self._ids[hits].tolist(), distances[hits].tolist()))
+        if not found:
+            return []
+        keys: List[Tuple[int, str]] = []
+        with self._db_lock:
+            rowids = []
+            for entry_id in found:
+                if entry_id > 0:
+                    rowids.append(entry_id)
+                elif entry_id in self._pending:
+                    keys.append((entry_id, self._pending[entry_id][0]))
+            # 单条语句的参数个数有上限，分批查询
+            for i in range(0, len(rowids), 500):
+                batch = rowids[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                keys.extend(self._conn.execute(
+                    f"SELECT rowid, key FROM phashes WHERE rowid IN ({placeholders})", batch
+                ))
+        matches = [(found[entry_id], key) for entry_id, key in keys if key.endswith(key_suffix)]
+        matches.sort()
+        return matches
@@ -0,0 +1,186 @@
+# server/onnx_detector.py
+"""
+ONNX Runtime 运行的 YOLOv8 检测器（CPU）
+不依赖 ultralytics / torch：letterbox 预处理、输出解码和 NMS 都用 NumPy 实现
+每个实例持有预分配的 letterbox 画布和输入张量，由 model_registry 的实例池借出，同一时刻只被一个线程使用
+模型由 `yolo export model=yolov8n.pt format=onnx` 导出，也可以是 INT8 量化后的版本（输入输出形状不变）；
+以 dynamic=True（或 batch=N）导出时 detect_batch 把多张图放进同一次推理
+"""
+import ast
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import cv2
+
+# COCO 80 类（模型元数据中没有 names 时使用）
+COCO_NAMES = [
+    "person", "bicycle", "car", "motorcycle", "airplane", "bus", "train", "truck", "boat", "traffic light",
+    "fire hydrant", "stop sign", "parking meter", "bench", "bird", "cat", "dog", "horse", "sheep", "cow",
+    "elephant", "bear", "zebra", "giraffe", "backpack", "umbrella", "handbag", "tie", "suitcase", "frisbee",
+    "skis", "snowboard", "sports ball", "kite", "baseball bat", "baseball glove", "skateboard", "surfboard",
+    "tennis racket", "bottle", "wine glass", "cup", "fork", "knife", "spoon", "bowl", "banana", "apple",
+    "sandwich", "orange", "broccoli", "carrot", "hot dog", "pizza", "donut", "cake", "chair", "couch",
+    "potted plant", "bed", "dining table", "toilet", "tv", "laptop", "mouse", "remote", "keyboard",
+    "cell phone", "microwave", "oven", "toaster", "sink", "refrigerator", "book", "clock", "vase",
+    "scissors", "teddy bear", "hair drier", "toothbrush",
+]
+
+# letterbox 填充灰度（与 ultralytics 一致）
+PAD_VALUE = 114
+# 进入 NMS 的候选框上限（按分数取前 N 个）
+MAX_CANDIDATES = 1024
+# 不同类别的框平移到互不重叠的区域，一次 NMS 完成按类别抑制
+_CLASS_OFFSET = 4096
+
+
+def _model_names(session: Any) -> List[str]:
+    """ultralytics 导出时把类别名写入模型元数据 names（Python dict 字面量）"""
+    meta = session.get_modelmeta().custom_metadata_map
+    try:
+        names = ast.literal_eval(meta["names"])
+        return [names[i] for i in range(len(names))]
+    except (KeyError, ValueError, SyntaxError):
+        return COCO_NAMES
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """
+    贪心 NMS：一次算出候选框两两 IoU 矩阵，之后每保留一个框只做一次整行布尔运算
+    boxes: (N, 4) xyxy；返回保留框的下标（按分数降序）
+    """
+    order = np.argsort(-scores)[:MAX_CANDIDATES]
+    b = boxes[order]
+    area = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    lt = np.maximum(b[:, None, :2], b[None, :, :2])
+    rb = np.minimum(b[:, None, 2:], b[None, :, 2:])
+    wh = np.clip(rb - lt, 0, None)
+    inter = wh[..., 0] * wh[..., 1]
+    over = inter > iou_threshold * (area[:, None] + area[None, :] - inter)
+
+    suppressed = np.zeros(len(order), dtype=bool)
+    keep = []
+    for i in range(len(order)):
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        suppressed |= over[i]
+    return order[keep]
+
+
+class OnnxYoloDetector:
+    """单个推理实例：InferenceSession + 预分配的 letterbox 画布 / 输入张量"""
+
+    def __init__(
+        self,
+        model_path: str,
+        threads: int = 1,
+        conf: float = 0.25,
+        iou: float = 0.7,
+        max_batch: int = 1
+    ):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = max(1, threads)
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        # 动态尺寸导出的模型按 640 处理
+        side = inp.shape[2] if isinstance(inp.shape[2], int) else 640
+        self.size = side
+        # 固定 batch 的模型每次推理都要填满 batch；动态 batch 最多放 max_batch 张
+        self.fixed_batch = inp.shape[0] if isinstance(inp.shape[0], int) else None
+        self.max_batch = self.fixed_batch or max(1, max_batch)
+        self.names = _model_names(self.session)
+        self.conf = conf
+        self.iou = iou
+        self._canvas = np.full((side, side, 3), PAD_VALUE, dtype=np.uint8)
+        self._input = np.zeros((self.max_batch, 3, side, side), dtype=np.float32)
+
+    def _letterbox(self, rgb: np.ndarray, slot: int = 0) -> Tuple[float, int, int]:
+        """等比缩放后居中放入画布并写入输入张量第 slot 张（CHW、0~1），返回 (缩放比例, 左/上填充)"""
+        h, w = rgb.shape[:2]
+        r = min(self.size / h, self.size / w)
+        nw, nh = int(round(w * r)), int(round(h * r))
+        left, top = (self.size - nw) // 2, (self.size - nh) // 2
+        canvas = self._canvas
+        canvas.fill(PAD_VALUE)
+        canvas[top:top + nh, left:left + nw] = (
+            cv2.resize(rgb, (nw, nh), interpolation=cv2.INTER_LINEAR) if (nw, nh) != (w, h) else rgb
+        )
+        np.multiply(canvas.transpose(2, 0, 1), np.float32(1 / 255), out=self._input[slot], casting="unsafe")
+        return r, left, top
+
+    def _decode(self, pred: np.ndarray, r: float, left: int, top: int) -> List[Tuple[int, float, np.ndarray]]:
+        """单张图的输出 (4 + 类别数, N) -> [(类别, 分数, 原图坐标 xyxy)]"""
+        cls_scores = pred[4:]
+        cls_ids = cls_scores.argmax(axis=0)
+        scores = cls_scores[cls_ids, np.arange(pred.shape[1])]
+        mask = scores >= self.conf
+        if not mask.any():
+            return []
+        cx, cy, bw, bh = pred[:4, mask]
+        boxes = np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+        scores, cls_ids = scores[mask], cls_ids[mask]
+
+        keep = nms(boxes + (cls_ids * _CLASS_OFFSET)[:, None], scores, self.iou)
+        boxes = (boxes[keep] - np.array([left, top, left, top], dtype=np.float32)) / r
+        return list(zip(cls_ids[keep].tolist(), scores[keep].tolist(), boxes))
+
+    def detect(self, rgb: np.ndarray, scale: float = 1.0, dims: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """
+        rgb: 输入数组（可为缩放后的预览，scale 为其相对原图的比例）
+        dims: 原图尺寸，检测框坐标和占比都相对原图
+        返回与 YOLO 引擎相同的 {persons, objects}
+        """
+        return self.detect_batch([(rgb, scale, dims)])[0]
+
+    def detect_batch(
+        self,
+        items: Sequence[Tuple[np.ndarray, float, Optional[Dict[str, int]]]]
+    ) -> List[Dict[str, Any]]:
+        """多张图按 max_batch 分组，每组 letterbox 到同一个输入张量后做一次推理；返回顺序与 items 一致"""
+        results: List[Dict[str, Any]] = []
+        for start in range(0, len(items), self.max_batch):
+            chunk = items[start:start + self.max_batch]
+            boxes = [self._letterbox(rgb, slot) for slot, (rgb, _, _) in enumerate(chunk)]
+            # 固定 batch 的模型整块输入（多余的槽位保留上次内容，输出忽略）
+            batch = self._input if self.fixed_batch else self._input[:len(chunk)]
+            output = self.session.run(None, {self.input_name: batch})[0]
+            for i, (rgb, scale, dims) in enumerate(chunk):
+                results.append(self._collect(output[i], boxes[i], rgb, scale, dims))
+        return results
+
+    def _collect(
+        self,
+        pred: np.ndarray,
+        letterbox: Tuple[float, int, int],
+        rgb: np.ndarray,
+        scale: float,
+        dims: Optional[Dict[str, int]]
+    ) -> Dict[str, Any]:
+        """单张图的解码结果映射回原图坐标，分为 persons / objects"""
+        h, w = (dims["height"], dims["width"]) if dims else rgb.shape[:2]
+        bounds = np.array([w, h, w, h], dtype=np.float32)
+
+        persons, objects = [], []
+        for cls_id, conf, box in self._decode(pred, *letterbox):
+            x0, y0, x1, y1 = np.clip(box / scale, 0, bounds)
+            label = self.names[cls_id] if cls_id < len(self.names) else str(cls_id)
+            height_ratio = (y1 - y0) / h
+            item = {
+                "label": label,
+                "conf": round(conf, 3),
+                "bbox": [int(x0), int(y0), int(x1), int(y1)],
+                "box_height_ratio": round(float(height_ratio), 3),
+                "box_width_ratio": round(float((x1 - x0) / w), 3),
+            }
+            if label == "person":
+                item["is_full_body"] = bool(height_ratio > 0.6)
+                persons.append(item)
+            else:
+                objects.append(item)
+        return {"persons": persons, "objects": objects}
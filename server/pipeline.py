@@ -2,14 +2,56 @@
 """
 统一输出管道 + "无 evidence 自动降级" + 人物 gate 机制
 """
+import asyncio
+import contextlib
+import os
+import time
 import uuid
-from typing import Any, Dict, List, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 
+from admission import AdmissionController
+from executors import run_cpu
 from qwen_client import analyze_with_qwen
-from modules_credibility import credibility_module
+from modules_credibility import credibility_module, header_context
+from detection_profiles import select_profile
 from detectors import run_detection
+from face_detector import attach_faces, detect_faces
+from forensic_triage import forensic_triage, triage_summary
+from image_artifact import Buffer, DecodedImage
+from llm_image import LLM_ROI_CROPS, prepare_llm_image, prepare_roi_request
+from local_heuristics import LOCAL_ONLY_NOTE, build_local_sections, mark_local, merge_screenshot, scene_heuristics
 from modules_person import person_module, validate_person_evidence
 
+# LLM 发起时机：
+# - after_local: 等本地分析完成，把检测结果写入 prompt（默认）
+# - early: 只用 EXIF 等廉价上下文立即发起，本地检测并行运行，结果在融合阶段合并
+LLM_DISPATCH_MODES = {"after_local", "early"}
+DEFAULT_LLM_DISPATCH = os.getenv("LLM_DISPATCH", "after_local")
+
+# 分析模式：full（本地 + 模型）/ fast（仅本地，受时间预算约束）
+ANALYSIS_MODES = {"full", "fast"}
+# 快速模式的时间预算（毫秒），超出预算仍未完成的阶段使用默认值
+FAST_MODE_BUDGET_MS = float(os.getenv("FAST_MODE_BUDGET_MS", "300"))
+# 快速模式使用的预览长边（像素），不做全尺寸解码
+FAST_PREVIEW_SIDE = int(os.getenv("FAST_PREVIEW_SIDE", "640"))
+
+# 本地截图检测高置信度命中时对模型调用的处理：
+# - off: 只在 credibility 中报告，并补充到 web_image_check
+# - downgrade: 改用 SCREENSHOT_LLM_MODEL（未配置时仍用默认模型）（默认）
+# - skip: 不调用模型，web_image_check 等模块直接由本地结果构建（early 模式下取消已发出的请求）
+SCREENSHOT_LLM_POLICY = os.getenv("SCREENSHOT_LLM_POLICY", "downgrade").lower()
+SCREENSHOT_LLM_MODEL = os.getenv("SCREENSHOT_LLM_MODEL", "")
+
+# 文件头取证预检判定为截图时，本地阶段改用预览（不做全尺寸解码）和 fast 检测档位；
+# 文件头带截图标记（high）时不等像素检测，直接按 SCREENSHOT_LLM_POLICY 处理模型调用
+TRIAGE_ROUTING = os.getenv("TRIAGE_ROUTING", "1") not in ("0", "false", "False")
+
+# 渐进式输出回调：(事件名, 该部分结果)，用于 SSE 等流式接口
+EventCallback = Callable[[str, Any], Awaitable[None]]
+
+# LLM 完成后按顺序推送的分析模块（credibility 在本地阶段已推送）
+LLM_SECTIONS = ["web_image_check", "person", "scene", "lifestyle", "room_analysis", "objects", "details", "intention"]
+
 
 # ----------------------------
 # 品牌价格区间数据库
@@ -475,56 +517,148 @@ def _build_room_analysis(qwen_result: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-async def analyze_image_bytes(image_bytes: bytes, mime: str, target_gender: str = "boyfriend") -> Dict[str, Any]:
+def _fallback_credibility(e: BaseException) -> Dict[str, Any]:
+    """可信度分析失败时的默认值"""
+    return {
+        "items": [mk_item(
+            claim="可信度分析失败",
+            evidence=[f"错误: {str(e)}"],
+            limitations=["本地分析模块异常"],
+            confidence="low"
+        )],
+        "exif": {},
+        "blur_score": -1.0,
+        "noise_estimate": -1.0,
+        "quality": {},
+        "angle_impact": {"level": "未知", "evidence": "分析失败"},
+        "screenshot": {"is_screenshot": False, "level": "none", "score": 0.0, "platform": None,
+                       "signals": [], "features": {}},
+        "triage": {},
+    }
+
+
+def _fallback_detection(e: BaseException) -> Dict[str, Any]:
+    """本地检测失败时的默认值"""
+    return {
+        "engine": "unknown",
+        "persons": [],
+        "objects": [],
+        "reference_objects": [],
+        "person_visibility": {"visibility": "不可见", "detail": f"检测失败: {str(e)}"},
+        "image_dims": {"width": 0, "height": 0}
+    }
+
+
+async def _run_local_stages(
+    image: DecodedImage,
+    timings: Dict[str, float],
+    t0: float,
+    on_event: Optional[EventCallback] = None,
+    triage: Optional[Dict[str, Any]] = None,
+    cheap: bool = False,
+    faces: bool = False
+):
     """
-    主分析流程
-    
-    1. 本地检测（EXIF/模糊度/HOG或YOLO）
-    2. Gemini 3 多模态分析
-    3. 融合结果 + evidence gate 校验
-    
-    Args:
-        image_bytes: 图片二进制数据
-        mime: MIME类型
-        target_gender: 分析对象性别 ('boyfriend' 或 'girlfriend')
+    可信度分析与本地检测在执行池中并行运行
+    两个阶段均为 CPU 密集，不阻塞事件循环；失败时返回默认值
+    每个阶段完成后立即通过 on_event 推送
+    cheap: 文件头预检判定为截图时使用预览和 fast 检测档位
+    faces: 同时运行人脸检测（生成人物区域裁剪时使用），完成后与人物框关联写入 det["faces"]
     """
-    image_id = uuid.uuid4().hex[:8]
+    preview_side = FAST_PREVIEW_SIDE if cheap else None
+
+    async def credibility_stage():
+        try:
+            cred = await run_cpu(credibility_module, image, preview_side, triage)
+        except Exception as e:
+            cred = _fallback_credibility(e)
+        if on_event:
+            await on_event("credibility", {"items": cred["items"]})
+        return cred
+
+    async def detection_stage():
+        # 提交到执行池前按当前负载选择检测档位
+        selection = select_profile("fast" if cheap else None)
+        try:
+            det = await run_cpu(run_detection, image, preview_side, selection["profile"])
+        except Exception as e:
+            det = _fallback_detection(e)
+        det["profile_selection"] = selection
+        if on_event:
+            await on_event("local_detection", det)
+        return det
+
+    async def face_stage():
+        if not faces:
+            return None
+        try:
+            return await run_cpu(detect_faces, image, preview_side)
+        except Exception as e:
+            print(f"[FACE] Face detection failed: {e}")
+            return None
+
+    cred, det, face_result = await asyncio.gather(credibility_stage(), detection_stage(), face_stage())
+    if face_result is not None:
+        attach_faces(det, face_result)
+    timings["local"] = round((time.perf_counter() - t0) * 1000, 1)
+    return cred, det
+
 
+async def _timed_llm_call(
+    timings: Dict[str, float],
+    t0: float,
+    on_event: Optional[EventCallback] = None,
+    llm_semaphore: Optional[asyncio.Semaphore] = None,
+    admission: Optional[AdmissionController] = None,
+    **kwargs: Any
+) -> Dict[str, Any]:
+    """
+    调用 Gemini 3 并记录完成时刻（相对请求开始）；传入 llm_semaphore 时受其并发限制
+    传入 admission 时只在模型调用期间占用准入名额（排队超时/队列已满抛出 AdmissionRejected），
+    排队耗时写入结果的 _admission
+    """
+    if on_event:
+        # 模型流式输出中每个顶层字段闭合时即推送原始字段
+        async def on_field(key: str, value: Any) -> None:
+            await on_event("llm_field", {"key": key, "value": value})
+        kwargs["on_field"] = on_field
+    async with llm_semaphore or contextlib.nullcontext():
+        if admission is None:
+            result = await analyze_with_qwen(**kwargs)
+        else:
+            async with admission.slot() as ticket:
+                result = await analyze_with_qwen(**kwargs)
+            result["_admission"] = ticket
+    timings["llm"] = round((time.perf_counter() - t0) * 1000, 1)
+    return result
+
+
+async def _prepare_llm_image(image: DecodedImage, mime: str) -> Dict[str, Any]:
+    """在执行池中缩放/重编码发送给模型的图片；失败时回退为原图"""
     try:
-        # 1) 可信度/EXIF/质量分析（本地）
-        cred = credibility_module(image_bytes)
+        return await run_cpu(prepare_llm_image, image, mime)
     except Exception as e:
-        # 如果可信度分析失败，使用默认值
-        cred = {
-            "items": [mk_item(
-                claim="可信度分析失败",
-                evidence=[f"错误: {str(e)}"],
-                limitations=["本地分析模块异常"],
-                confidence="low"
-            )],
-            "exif": {},
-            "blur_score": -1.0,
-            "noise_estimate": -1.0,
-            "angle_impact": {"level": "未知", "evidence": "分析失败"}
+        print(f"[LLM] Image preparation failed, sending original: {e}")
+        size = len(image.image_bytes)
+        return {
+            "bytes": image.image_bytes,
+            "mime": mime,
+            "info": {"format": "original", "original_bytes": size, "sent_bytes": size, "bytes_saved": 0},
         }
 
+
+async def _prepare_roi_image(image: DecodedImage, mime: str, det: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """低分辨率全图 + 人物区域裁剪；没有可裁剪的区域或失败时返回 None（改用单张图片）"""
     try:
-        # 2) 本地检测（person + 参照物候选）
-        det = run_detection(image_bytes)
+        return await run_cpu(prepare_roi_request, image, mime, det)
     except Exception as e:
-        # 如果检测失败，使用默认值
-        det = {
-            "engine": "unknown",
-            "persons": [],
-            "objects": [],
-            "reference_objects": [],
-            "person_visibility": {"visibility": "不可见", "detail": f"检测失败: {str(e)}"},
-            "image_dims": {"width": 0, "height": 0}
-        }
+        print(f"[LLM] ROI crop preparation failed, sending single image: {e}")
+        return None
+
 
-    # 3) 调用 Gemini 3 进行多模态分析
-    # 将本地检测结果作为辅助上下文
-    extra_context = {
+def _build_llm_context(cred: Dict[str, Any], det: Dict[str, Any]) -> Dict[str, Any]:
+    """将本地分析结果整理为 LLM 辅助上下文"""
+    return {
         "local_detection": {
             "engine": det.get("engine"),
             "person_count": len(det.get("persons", [])),
@@ -532,21 +666,203 @@ async def analyze_image_bytes(image_bytes: bytes, mime: str, target_gender: str
         },
         "exif": cred.get("exif", {}),
         "blur_score": cred.get("blur_score"),
+        "exposure": (cred.get("quality") or {}).get("exposure", {}).get("label", "未知"),
+        "forensics": triage_summary(cred.get("triage") or {}),
         "angle_impact": cred.get("angle_impact", {}).get("level", "未知")
     }
+
+
+def _screenshot_hit(cred: Dict[str, Any]) -> bool:
+    """本地截图检测是否高置信度命中"""
+    return (cred.get("screenshot") or {}).get("level") == "high"
+
+
+def _local_engine_meta(det: Dict[str, Any]) -> Dict[str, Any]:
+    """_meta.local_engine：实际使用的检测引擎和档位，以及是否因负载降级"""
+    selection = det.get("profile_selection") or {}
+    return {
+        "engine": det.get("engine", "unknown"),
+        "profile": det.get("profile", selection.get("profile")),
+        "requested_profile": selection.get("requested", det.get("profile")),
+        "degraded_by": selection.get("degraded_by", []),
+        "load": selection.get("load"),
+        "face_engine": det.get("face_engine"),
+    }
+
+
+async def _run_triage(image: DecodedImage, timings: Dict[str, float], t0: float) -> Optional[Dict[str, Any]]:
+    """文件头取证预检（只读文件头，几毫秒）；失败时返回 None，按完整路径处理"""
+    try:
+        triage = await run_cpu(forensic_triage, image)
+    except Exception as e:
+        print(f"[TRIAGE] Header triage failed: {e}")
+        triage = None
+    timings["triage"] = round((time.perf_counter() - t0) * 1000, 1)
+    return triage
+
+
+def _triage_meta(triage: Optional[Dict[str, Any]], cheap: bool = False) -> Dict[str, Any]:
+    """_meta.triage：预检摘要，routed 表示是否因此走了廉价路径"""
+    return {**triage_summary(triage or {}), "routed": cheap}
+
+
+def _screenshot_meta(cred: Dict[str, Any]) -> Dict[str, Any]:
+    shot = cred.get("screenshot") or {}
+    return {"level": shot.get("level", "none"), "score": shot.get("score", 0.0), "platform": shot.get("platform")}
+
+
+def _skipped_llm_result(reason: str) -> Dict[str, Any]:
+    return {"_success": False, "_error": reason, "_model": None, "_skipped": "screenshot"}
+
+
+async def analyze_image_bytes(
+    image_bytes: Buffer,
+    mime: str,
+    target_gender: str = "boyfriend",
+    llm_dispatch: Optional[str] = None,
+    image: Optional[DecodedImage] = None,
+    on_event: Optional[EventCallback] = None,
+    llm_semaphore: Optional[asyncio.Semaphore] = None,
+    admission: Optional[AdmissionController] = None
+) -> Dict[str, Any]:
+    """
+    主分析流程
     
-    qwen_result = await analyze_with_qwen(
-        image_bytes=image_bytes,
-        mime=mime,
-        extra_context=extra_context,
-        target_gender=target_gender
-    )
+    1. 本地检测（EXIF/模糊度/HOG或YOLO）
+    2. Gemini 3 多模态分析
+    3. 融合结果 + evidence gate 校验
+    
+    Args:
+        image_bytes: 图片二进制数据（bytes 或上传缓冲区的 memoryview）
+        mime: MIME类型
+        target_gender: 分析对象性别 ('boyfriend' 或 'girlfriend')
+        llm_dispatch: LLM 发起时机，'after_local' 或 'early'（默认取环境变量 LLM_DISPATCH）
+        image: 调用方已创建的 DecodedImage（如缓存层计算感知哈希时），可复用其解码结果
+        on_event: 渐进式输出回调，各阶段完成后推送对应的结果模块
+        llm_semaphore: 限制模型调用并发数（如批量分析时）
+        admission: 全局准入控制，只包住模型调用（本地分析不占名额）；排队耗时见 _meta.admission
+    """
+    image_id = uuid.uuid4().hex[:8]
+    # 每个请求只解码一次，所有本地分析共享同一个图片对象
+    if image is None:
+        image = DecodedImage(image_bytes)
+    dispatch = llm_dispatch or DEFAULT_LLM_DISPATCH
+    if dispatch not in LLM_DISPATCH_MODES:
+        dispatch = "after_local"
+    timings: Dict[str, float] = {}
+    t0 = time.perf_counter()
+
+    # 0) 文件头取证预检：判定为截图时走廉价路径（预览 + fast 档位），
+    #    带截图标记时在任何解码之前就能决定跳过/降级模型调用
+    triage = await _run_triage(image, timings, t0)
+    cheap = TRIAGE_ROUTING and bool(triage) and triage["route"] == "screenshot"
+    header_hit = cheap and triage["screenshot"] == "high"
+    header_skip = header_hit and SCREENSHOT_LLM_POLICY == "skip"
+    # 人物区域裁剪需要本地检测结果，只在 after_local 模式下生成（early 模式发起请求时检测尚未完成）
+    roi = LLM_ROI_CROPS and not cheap
+
+    if dispatch == "early" and not header_skip:
+        # 1) 仅读取文件头获得廉价上下文，立即发起 Gemini 3 请求
+        #    （先提交到执行池，保证排在像素分析之前）
+        early_context = asyncio.ensure_future(run_cpu(header_context, image, triage))
+        llm_image_task = asyncio.ensure_future(_prepare_llm_image(image, mime))
+        local_task = asyncio.ensure_future(_run_local_stages(image, timings, t0, on_event, triage, cheap))
+        try:
+            extra_context = await early_context
+        except Exception:
+            extra_context = {}
+        llm_image = await llm_image_task
+        model_kwargs = {}
+        if header_hit and SCREENSHOT_LLM_POLICY == "downgrade" and SCREENSHOT_LLM_MODEL:
+            model_kwargs["model"] = SCREENSHOT_LLM_MODEL
+        llm_task = asyncio.ensure_future(_timed_llm_call(
+            timings, t0, on_event, llm_semaphore, admission,
+            image_bytes=llm_image["bytes"],
+            mime=llm_image["mime"],
+            extra_context=extra_context,
+            target_gender=target_gender,
+            **model_kwargs
+        ))
+        # 2) 本地分析与 LLM 并行，结果只在融合阶段合并
+        try:
+            cred, det = await local_task
+        except BaseException:
+            llm_task.cancel()
+            raise
+        if SCREENSHOT_LLM_POLICY == "skip" and _screenshot_hit(cred) and not llm_task.done():
+            # 已发出的请求直接取消
+            llm_task.cancel()
+            qwen_result = _skipped_llm_result("本地截图检测命中，已取消模型调用")
+        else:
+            image.release()
+            qwen_result = await llm_task
+    else:
+        # 1) 可信度/EXIF/质量分析 + 2) 本地检测（person + 参照物候选）
+        #    发送给模型的图片与本地分析同时准备（文件头已决定跳过模型时不准备）
+        #    开启人物区域裁剪时单张图片仍提前准备，没有可裁剪的人物时直接使用
+        llm_image_task = None if header_skip else asyncio.ensure_future(_prepare_llm_image(image, mime))
+        try:
+            cred, det = await _run_local_stages(image, timings, t0, on_event, triage, cheap, roi)
+        except BaseException:
+            if llm_image_task:
+                llm_image_task.cancel()
+            raise
+
+        # 3) 调用 Gemini 3 进行多模态分析，将本地检测结果作为辅助上下文
+        #    本地截图检测高置信度命中时按 SCREENSHOT_LLM_POLICY 跳过或改用更便宜的模型
+        hit = header_hit or _screenshot_hit(cred)
+        if hit and SCREENSHOT_LLM_POLICY == "skip":
+            if llm_image_task:
+                llm_image_task.cancel()
+            llm_image = {"info": None}
+            source = "文件头截图标记" if header_hit else "本地截图检测"
+            qwen_result = _skipped_llm_result(f"{source}命中，已跳过模型调用")
+        else:
+            llm_image = await _prepare_roi_image(image, mime, det) if roi else None
+            if llm_image is None:
+                llm_image = await llm_image_task
+            else:
+                llm_image_task.cancel()
+            model_kwargs = {}
+            if hit and SCREENSHOT_LLM_POLICY == "downgrade" and SCREENSHOT_LLM_MODEL:
+                model_kwargs["model"] = SCREENSHOT_LLM_MODEL
+            # 模型请求所需的图片已准备好，等待准入名额/模型响应期间不再持有解码后的像素
+            image.release()
+            qwen_result = await _timed_llm_call(
+                timings, t0, on_event, llm_semaphore, admission,
+                image_bytes=llm_image["bytes"],
+                mime=llm_image["mime"],
+                extra_context=_build_llm_context(cred, det),
+                target_gender=target_gender,
+                crops=llm_image.get("crops"),
+                **model_kwargs
+            )
 
     # 4) 人物体征分析（严格 evidence gate）
     person = person_module(det, cred, qwen_result)
 
     # 5) 构建各分析模块输出
-    if qwen_result.get("_success"):
+    local_sections = None
+    if qwen_result.get("_skipped"):
+        # 截图命中跳过模型：各模块由本地信号构建（与快速模式相同）
+        try:
+            scene = await run_cpu(scene_heuristics, image, FAST_PREVIEW_SIDE)
+        except Exception as e:
+            scene = None
+            print(f"[SCREENSHOT] Scene heuristics failed: {e}")
+        local_sections = build_local_sections(image, cred, det, scene)
+        lifestyle_items = local_sections["lifestyle"]
+        details_items = local_sections["details"]
+        intention_items = local_sections["intention"]
+        room_analysis = local_sections["room_analysis"]
+        lifestyle_output = {
+            "items": lifestyle_items,
+            "consumption_level": "无法判断",
+            "accommodation_level": "无法判断",
+            "brands_detected": {},
+            "brands_info": {"items": [], "summary": "未识别到品牌", "highest_tier": None},
+        }
+    elif qwen_result.get("_success"):
         lifestyle_items = _build_lifestyle_items(qwen_result, det)
         details_items = _build_details_items(qwen_result)
         intention_items = _build_intention_items(qwen_result)
@@ -643,6 +959,8 @@ async def analyze_image_bytes(image_bytes: bytes, mime: str, target_gender: str
             }
         )
     else:
+        if qwen_result.get("_skipped"):
+            llm_payload["skipped"] = qwen_result["_skipped"]
         llm_payload.update(
             {
                 "error": qwen_result.get("_error", "unknown error"),
@@ -650,11 +968,18 @@ async def analyze_image_bytes(image_bytes: bytes, mime: str, target_gender: str
             }
         )
 
-    # 提取 web_image_check（网图检测结果）
+    # 提取 web_image_check（网图检测结果），模型漏判的高置信度截图由本地检测补充
     web_image_check = qwen_result.get("web_image_check", {})
+    if qwen_result.get("_success"):
+        web_image_check = merge_screenshot(web_image_check, cred.get("screenshot") or {})
     
     # 提取 objects（物体检测结果，直接返回完整数据）
     objects_data = qwen_result.get("objects", {})
+    scene_data = qwen_result.get("scene", {}) if qwen_result.get("_success") else {}
+    if local_sections is not None:
+        web_image_check = local_sections["web_image_check"]
+        objects_data = local_sections["objects"]
+        scene_data = local_sections["scene"]
     
     # 构建完整的返回结果，确保所有数据都被包含
     result = {
@@ -667,20 +992,35 @@ async def analyze_image_bytes(image_bytes: bytes, mime: str, target_gender: str
             "person": person,
             "room_analysis": room_analysis,
             "web_image_check": web_image_check,  # 添加网图检测结果
-            "scene": qwen_result.get("scene", {}) if qwen_result.get("_success") else {},  # 添加场景分析
+            "scene": scene_data,  # 添加场景分析
             "objects": objects_data,  # 添加完整的物体检测结果
         },
         "girlfriend_comments": qwen_result.get("girlfriend_comments", []),
         "llm": llm_payload,
         "_meta": {
+            "mode": "full",
             "model": qwen_result.get("_model", "unknown"),
             "model_success": qwen_result.get("_success", False),
-            "local_engine": det.get("engine", "unknown"),
+            "local_engine": _local_engine_meta(det),
             "response_length": qwen_result.get("_response_length", 0),
             "missing_fields": qwen_result.get("_missing_fields", []),
-            "is_partial": qwen_result.get("_partial", False)
+            "is_partial": qwen_result.get("_partial", False),
+            "repaired_fields": qwen_result.get("_repaired_fields", []),
+            "llm_dispatch": dispatch,
+            "llm_image": llm_image["info"],
+            "llm_calls": qwen_result.get("_calls", []),
+            "llm_hedged": qwen_result.get("_hedged", False),
+            "structured_output": qwen_result.get("_structured_output", False),
+            "usage": qwen_result.get("_usage"),
+            "screenshot": _screenshot_meta(cred),
+            "triage": _triage_meta(triage, cheap),
+            "llm_skipped": qwen_result.get("_skipped"),
+            "timings_ms": {**timings, "total": round((time.perf_counter() - t0) * 1000, 1)}
         }
     }
+    if admission is not None:
+        # 跳过模型调用时未占用名额，为 None
+        result["_meta"]["admission"] = qwen_result.get("_admission")
     
     # 调试：检查关键数据是否存在
     if qwen_result.get("_success"):
@@ -693,5 +1033,103 @@ async def analyze_image_bytes(image_bytes: bytes, mime: str, target_gender: str
             missing_keys.append("scene")
         if missing_keys:
             print(f"[DEBUG] Missing keys in qwen_result: {missing_keys}")
+
+    # 推送 LLM 相关的各模块（最终完整结果由调用方推送）
+    if on_event:
+        for section in LLM_SECTIONS:
+            await on_event(section, result["analysis"][section])
+        await on_event("girlfriend_comments", result["girlfriend_comments"])
     
     return result
+
+
+def _discard_result(task: "asyncio.Future") -> None:
+    """超出预算后不再等待的阶段：取走结果/异常，避免未读取异常的警告"""
+    if not task.cancelled():
+        task.exception()
+
+
+async def analyze_fast(
+    image_bytes: Buffer,
+    mime: str,
+    target_gender: str = "boyfriend",
+    image: Optional[DecodedImage] = None
+) -> Dict[str, Any]:
+    """
+    快速模式（mode=fast）：不调用模型，只用本地信号构建与完整模式结构相同的结果
+
+    - 可信度、本地检测、场景统计在执行池中并行，均使用低分辨率预览（不做全尺寸解码）
+    - 超过 FAST_MODE_BUDGET_MS 仍未完成的阶段不再等待，以默认值代替，见 _meta.timed_out
+    - 所有分析项都标注为仅本地分析，置信度偏低
+    """
+    image_id = uuid.uuid4().hex[:8]
+    if image is None:
+        image = DecodedImage(image_bytes)
+    t0 = time.perf_counter()
+
+    stages = {
+        "credibility": asyncio.ensure_future(run_cpu(credibility_module, image, FAST_PREVIEW_SIDE)),
+        "detection": asyncio.ensure_future(run_cpu(run_detection, image, FAST_PREVIEW_SIDE, "fast")),
+        "scene": asyncio.ensure_future(run_cpu(scene_heuristics, image, FAST_PREVIEW_SIDE)),
+    }
+    await asyncio.wait(stages.values(), timeout=FAST_MODE_BUDGET_MS / 1000)
+
+    outcomes: Dict[str, Any] = {}
+    errors: Dict[str, BaseException] = {}
+    timed_out = []
+    for name, task in stages.items():
+        if not task.done():
+            timed_out.append(name)
+            task.add_done_callback(_discard_result)
+            errors[name] = TimeoutError(f"超出快速模式时间预算（{FAST_MODE_BUDGET_MS:.0f}ms）")
+        elif task.exception() is not None:
+            errors[name] = task.exception()
+        else:
+            outcomes[name] = task.result()
+    local_ms = round((time.perf_counter() - t0) * 1000, 1)
+
+    cred = outcomes.get("credibility") or _fallback_credibility(errors["credibility"])
+    det = outcomes.get("detection") or _fallback_detection(errors["detection"])
+    scene_error = errors.get("scene")
+    sections = build_local_sections(
+        image, cred, det, outcomes.get("scene"),
+        scene_reason=f"场景统计失败: {scene_error}" if scene_error else "场景统计不可用"
+    )
+
+    person = person_module(det, cred, {})
+    person["limitations"] = [LOCAL_ONLY_NOTE] + person.get("limitations", [])
+
+    return {
+        "image_id": image_id,
+        "analysis": {
+            "lifestyle": {
+                "items": sections["lifestyle"],
+                "consumption_level": "无法判断",
+                "accommodation_level": "无法判断",
+                "brands_detected": {},
+                "brands_info": {"items": [], "summary": "未识别到品牌", "highest_tier": None},
+            },
+            "details": {"items": sections["details"]},
+            "intention": {"items": sections["intention"]},
+            "credibility": {"items": mark_local(cred["items"])},
+            "person": person,
+            "room_analysis": sections["room_analysis"],
+            "web_image_check": sections["web_image_check"],
+            "scene": sections["scene"],
+            "objects": sections["objects"],
+        },
+        "girlfriend_comments": [],
+        "llm": {"success": False, "model": None, "skipped": "mode=fast"},
+        "_meta": {
+            "mode": "fast",
+            "model": None,
+            "model_success": False,
+            "local_engine": _local_engine_meta(det),
+            "budget_ms": FAST_MODE_BUDGET_MS,
+            "preview_side": FAST_PREVIEW_SIDE,
+            "timed_out": timed_out,
+            "screenshot": _screenshot_meta(cred),
+            "triage": _triage_meta(cred.get("triage")),
+            "timings_ms": {"local": local_ms, "total": round((time.perf_counter() - t0) * 1000, 1)},
+        },
+    }
@@ -2,212 +2,437 @@
 """
 Gemini 3 多模态模型客户端（通过 OpenRouter API）
 """
+import asyncio
 import os
 import base64
 import json
-import requests
-from typing import Any, Dict, Optional
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+import httpx
+
+from llm_json import TopLevelFieldParser
+from llm_prompts import RESPONSE_FORMAT, build_messages, decode_field
+from llm_resilience import (
+    LLM_HEDGE_MODEL, LLM_RETRY_MAX, RETRYABLE_STATUS, backoff_delay, count,
+    get_breaker, get_latency, hedge_delay, parse_retry_after
+)
 
 DEFAULT_MODEL = os.getenv("OPENROUTER_MODEL", "google/gemini-3-pro-preview")
 OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_MODELS_URL = "https://openrouter.ai/api/v1/models/{model}/endpoints"
+
+# 结构化输出：auto（按模型能力自动判断）/ 1（总是请求）/ 0（只用 prompt 约束格式）
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "auto").lower()
+# 给固定的 system prompt 加缓存断点
+LLM_PROMPT_CACHE = os.getenv("LLM_PROMPT_CACHE", "1") not in ("0", "false", "False")
+
+# 连接池配置（单 worker 可同时承载的在途分析数）
+HTTP_MAX_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "64"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("OPENROUTER_MAX_KEEPALIVE", "16"))
+HTTP_TIMEOUT = float(os.getenv("OPENROUTER_TIMEOUT", "120"))
+HTTP2_ENABLED = os.getenv("OPENROUTER_HTTP2", "1") not in ("0", "false", "False")
+
+FieldCallback = Callable[[str, Any], Awaitable[None]]
+# structured -> messages
+MessagesBuilder = Callable[[bool], List[Dict[str, Any]]]
+
+# 模型是否支持结构化输出（按模型缓存）
+_structured_support: Dict[str, bool] = {}
+
+# 进程级共享的异步客户端，由 main.py 的 lifespan 负责创建和关闭
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _http2_available() -> bool:
+    """HTTP/2 需要可选依赖 h2（httpx[http2]）"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def init_http_client() -> httpx.AsyncClient:
+    """
+    创建共享的 httpx.AsyncClient
+    保持长连接，可用时开启 HTTP/2 多路复用
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=HTTP2_ENABLED and _http2_available(),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            ),
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=10.0),
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """关闭共享客户端（应用退出时调用）"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
 
 
-def _image_to_base64_url(image_bytes: bytes, mime: str = "image/jpeg") -> str:
+def get_http_client() -> httpx.AsyncClient:
+    """获取共享客户端；未经 lifespan 初始化时（如脚本直接调用）按需创建"""
+    return init_http_client()
+
+
+def _image_to_base64_url(image_bytes: Union[bytes, memoryview], mime: str = "image/jpeg") -> str:
     b64 = base64.b64encode(image_bytes).decode("utf-8")
     return f"data:{mime};base64,{b64}"
 
 
 async def analyze_with_qwen(
-    image_bytes: bytes,
+    image_bytes: Union[bytes, memoryview],
     mime: str = "image/jpeg",
     model: str = DEFAULT_MODEL,
     extra_context: Optional[Dict[str, Any]] = None,
-    target_gender: str = "boyfriend"
+    target_gender: str = "boyfriend",
+    on_field: Optional[FieldCallback] = None,
+    crops: Optional[List[Dict[str, Any]]] = None
 ) -> Dict[str, Any]:
-    """使用 Gemini 3 分析图片，输出完整分析结果"""
+    """
+    使用 Gemini 3 分析图片，输出完整分析结果
+
+    以流式方式请求，顶层字段（web_image_check/person/scene/...）闭合后
+    立即通过 on_field(字段名, 原始值) 回调，调用方可据此提前推送或决策
+    prompt 为预先生成的固定文本（见 llm_prompts），模型支持时使用结构化输出
+    crops: 人物区域裁剪 [{"bytes", "mime", "caption"}]（见 llm_image.prepare_roi_request），随全图一起发送
+    """
     
     openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
     if not openrouter_api_key:
         return {"_success": False, "_error": "缺少 OPENROUTER_API_KEY", "_model": model}
     
-    target_word = "男朋友" if target_gender == "boyfriend" else "女朋友"
-    opposite = "女性用品" if target_gender == "boyfriend" else "男性用品"
-
-    # 完整 prompt，输出详细分析结果
-    system_prompt = f"""你是一个专业的照片分析AI。请分析「{target_word}」发的照片，特别关注{opposite}相关的线索。
-
-**重要：你必须严格按照以下JSON格式输出，不能省略任何字段，所有字段都必须有值。**
-
-输出完整JSON：
-```json
-{{
-  "person": {{
-    "detected": bool,
-    "count": int,
-    "height": "偏高/中等/偏矮/无法判断",
-    "body_type": "偏瘦/匀称/偏壮/无法判断",
-    "posture": "挺拔/放松/含胸/不确定",
-    "gender": "男性/女性/无法判断",
-    "gender_evidence": {{
-      "appearance": "外观线索描述",
-      "environment": "环境线索描述",
-      "consistency": "线索一致性说明"
-    }},
-    "evidence": {{
-      "reference": "参照物描述",
-      "body_visibility": "全身可见性描述",
-      "angle_impact": "角度影响说明"
-    }},
-    "partial_features": {{
-      "hand": "手部特征",
-      "arm": "手臂特征",
-      "face": "脸部特征",
-      "neck_shoulder": "颈肩特征",
-      "body": "身体特征",
-      "body_type_clue": "体型综合判断"
-    }},
-    "confidence": "high/medium/low"
-  }},
-  "web_image_check": {{
-    "risk_level": "high/medium/low",
-    "watermark": "水印描述或null",
-    "screenshot": "截图痕迹或null",
-    "professional": "专业摄影特征或null"
-  }},
-  "scene": {{
-    "location": "室内/室外",
-    "desc": "详细环境描述"
-  }},
-  "lifestyle": {{
-    "level": "高/中/大众/无法判断",
-    "brands": ["品牌列表"]
-  }},
-  "room_analysis": {{
-    "people": "1/2/无法判断",
-    "relation": "独居/情侣/无法判断",
-    "evidence": "详细依据"
-  }},
-  "objects": ["检测到的物体列表"],
-  "details": {{
-    "text": ["识别到的文字列表"],
-    "special": ["特殊元素列表"]
-  }},
-  "intention": "照片用途详细说明",
-  "girlfriend_comments": ["可疑点吐槽列表"]
-}}
-```
-
-规则：
-1. 水印/截图/专业摄影是网图高风险线索
-2. 看到人体任何部位就给体型判断，默认匀称
-3. girlfriend_comments用口语化吐槽，如"宝这图有点意思"
-4. 无依据输出"无法判断"
-5. **必须输出完整的JSON，包含所有字段，不能省略任何字段**
-6. **所有字段都必须有值，不能为null或空**
-7. **只输出JSON，不要任何其他文字、解释或说明**
-8. **确保JSON格式正确，可以直接被解析**"""
-
     image_url = _image_to_base64_url(image_bytes, mime)
-    user_text = "请仔细分析这张照片，严格按照上述JSON格式输出完整结果。必须包含所有字段，不能省略。"
-    if extra_context:
-        user_text += f"\n辅助信息：{json.dumps(extra_context, ensure_ascii=False)}"
-
-    # OpenRouter/Gemini 使用 OpenAI 兼容格式
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": [
-            {"type": "text", "text": user_text},
-            {"type": "image_url", "image_url": {"url": image_url}}
-        ]}
-    ]
+    crop_urls = [(c["caption"], _image_to_base64_url(c["bytes"], c["mime"])) for c in crops or []]
 
-    try:
-        resp = requests.post(
-            OPENROUTER_API_URL,
-            headers={
-                "Authorization": f"Bearer {openrouter_api_key}",
-                "Content-Type": "application/json",
-                "HTTP-Referer": "https://github.com/your-repo",  # OpenRouter 推荐
-                "X-Title": "Watcha Security"  # OpenRouter 推荐（使用英文避免编码问题）
-            },
-            json={"model": model, "messages": messages, "temperature": 0.0},
-            timeout=120
+    def make_messages(structured: bool) -> List[Dict[str, Any]]:
+        return build_messages(target_gender, image_url, extra_context, structured, LLM_PROMPT_CACHE, crop_urls)
+
+    headers = {
+        "Authorization": f"Bearer {openrouter_api_key}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": "https://github.com/your-repo",  # OpenRouter 推荐
+        "X-Title": "Watcha Security"  # OpenRouter 推荐（使用英文避免编码问题）
+    }
+    return await _dispatch(model, headers, make_messages, on_field)
+
+
+async def _dispatch(
+    model: str,
+    headers: Dict[str, str],
+    make_messages: MessagesBuilder,
+    on_field: Optional[FieldCallback]
+) -> Dict[str, Any]:
+    """
+    主模型请求（带重试），必要时向备用模型发出对冲请求
+    先输出第一个字段的一方胜出：只有胜出方的字段会转发给 on_field，另一方随即取消
+    """
+    count("requests")
+    primary = model
+    secondary = LLM_HEDGE_MODEL if LLM_HEDGE_MODEL and LLM_HEDGE_MODEL != model else None
+    if secondary and not get_breaker(primary).available() and get_breaker(secondary).available():
+        # 主模型熔断中：直接改用备用模型
+        primary, secondary = secondary, None
+
+    tasks: Dict[str, asyncio.Task] = {}
+    winner: Optional[str] = None
+    hedged = False
+
+    def make_on_field(name: str) -> FieldCallback:
+        async def forward(key: str, value: Any) -> None:
+            nonlocal winner
+            if winner is None:
+                winner = name
+                for other, task in tasks.items():
+                    if other != name:
+                        task.cancel()
+            if winner == name and on_field is not None:
+                await on_field(key, value)
+        return forward
+
+    def launch(name: str) -> None:
+        tasks[name] = asyncio.create_task(
+            _call_with_retries(name, headers, make_messages, make_on_field(name), record_latency=name == model)
         )
-        
-        if not resp.ok:
-            return {"_success": False, "_error": f"HTTP {resp.status_code}", "_raw_response": resp.text[:500], "_model": model}
 
-        data = resp.json()
-        content = ""
+    launch(primary)
+    result: Optional[Dict[str, Any]] = None
+    try:
+        delay = hedge_delay(primary) if secondary else None
+        if delay is not None:
+            done, _ = await asyncio.wait({tasks[primary]}, timeout=delay)
+            if not done and winner is None and get_breaker(secondary).available():
+                count("hedged")
+                hedged = True
+                print(f"[LLM] No output from {primary} after {delay:.1f}s, hedging to {secondary}")
+                launch(secondary)
+
+        pending = set(tasks.values())
+        while pending and not (result and result.get("_success")):
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.cancelled():
+                    continue
+                r = task.result()
+                if r.get("_success") or result is None:
+                    result = r
+
+        # 主模型失败且未尝试过备用模型：再用备用模型请求一次
+        if secondary and secondary not in tasks and result and not result.get("_success") and result.get("_retryable"):
+            launch(secondary)
+            fallback = await tasks[secondary]
+            fallback["_calls"] = result.get("_calls", []) + fallback.get("_calls", [])
+            result = fallback
+    finally:
+        for task in tasks.values():
+            task.cancel()
+
+    if result is None:
+        result = {"_success": False, "_error": "all model requests cancelled", "_model": primary}
+    if result.get("_model") != model and result.get("_success"):
+        count("secondary_used")
+    result["_hedged"] = hedged
+    return result
+
+
+async def _call_with_retries(
+    model: str,
+    headers: Dict[str, str],
+    make_messages: MessagesBuilder,
+    on_field: FieldCallback,
+    record_latency: bool = True
+) -> Dict[str, Any]:
+    """
+    对单个模型的请求 + 重试 + 熔断
+    已经有字段输出后不再重试（输出可能已推送给客户端）
+    """
+    breaker = get_breaker(model)
+    calls: List[Dict[str, Any]] = []
+    result: Dict[str, Any] = {}
+    for attempt in range(LLM_RETRY_MAX + 1):
+        if not breaker.allow():
+            count("short_circuited")
+            result = {"_success": False, "_error": f"circuit open for {model}", "_model": model, "_retryable": True}
+            break
+
+        t0 = time.perf_counter()
+        first_field: List[float] = []
+
+        async def on_attempt_field(key: str, value: Any) -> None:
+            if not first_field:
+                first_field.append(time.perf_counter() - t0)
+            await on_field(key, value)
+
         try:
-            content = data.get("choices", [])[0].get("message", {}).get("content", "")
-        except:
-            pass
-
-        if not content:
-            return {"_success": False, "_error": "empty response", "_raw_response": resp.text[:500], "_model": model}
-
-        # 去除代码块包裹，支持多种格式
-        import re
-        # 尝试提取代码块中的 JSON
-        m = re.search(r"```(?:json)?\s*(.*?)```", content, re.S)
-        if m:
-            content = m.group(1).strip()
-        else:
-            # 如果没有代码块，尝试直接提取 JSON 对象
-            # 查找第一个 { 到最后一个 } 之间的内容
-            first_brace = content.find('{')
-            last_brace = content.rfind('}')
-            if first_brace >= 0 and last_brace > first_brace:
-                content = content[first_brace:last_brace+1].strip()
-
-        # 解析 JSON
+            result = await _analyze_once(model, headers, make_messages, on_attempt_field)
+        except asyncio.CancelledError:
+            breaker.record_cancelled()
+            raise
+        call = {"model": model, "ms": round((time.perf_counter() - t0) * 1000, 1), "success": result["_success"]}
+        if not result["_success"]:
+            call["error"] = result.get("_error")
+        calls.append(call)
+
+        if result["_success"] or not result.get("_retryable"):
+            # 非网络/服务端错误（如 401、JSON 解析失败）说明端点本身可用
+            breaker.record_success()
+            if result["_success"] and first_field and record_latency:
+                get_latency(model).record(first_field[0])
+            break
+        breaker.record_failure()
+        if first_field or attempt == LLM_RETRY_MAX:
+            break
+        count("retries")
+        delay = backoff_delay(attempt, result.get("_retry_after"))
+        print(f"[LLM] {model} failed ({result.get('_error')}), retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+    result["_calls"] = calls
+    return result
+
+
+async def supports_structured_output(model: str) -> bool:
+    """
+    模型是否支持 response_format JSON Schema
+    LLM_STRUCTURED_OUTPUT=auto 时查询 OpenRouter 的模型端点信息（每个模型只查一次）
+    """
+    if LLM_STRUCTURED_OUTPUT in ("0", "false", "off"):
+        return False
+    if LLM_STRUCTURED_OUTPUT in ("1", "true", "on"):
+        return _structured_support.get(model, True)
+    if model not in _structured_support:
         try:
-            parsed = json.loads(content)
-            
-            # 转换模型输出格式到完整格式（兼容完整和精简格式）
-            result = _expand_compact_result(parsed)
-            result["_success"] = True
-            result["_model"] = model
-            result["_raw_response"] = content
-            # 添加调试信息：检查关键字段是否存在
-            missing_fields = []
-            if not result.get("person"):
-                missing_fields.append("person")
-            if not result.get("web_image_check"):
-                missing_fields.append("web_image_check")
-            if not result.get("scene"):
-                missing_fields.append("scene")
-            if not result.get("lifestyle"):
-                missing_fields.append("lifestyle")
-            if missing_fields:
-                result["_missing_fields"] = missing_fields
-            return result
-        except json.JSONDecodeError as e:
-            # 尝试修复截断的 JSON
-            try:
-                last_brace = content.rfind('}')
-                if last_brace > 0:
-                    partial = json.loads(content[:last_brace+1])
-                    result = _expand_compact_result(partial)
-                    result["_success"] = True
-                    result["_model"] = model
-                    result["_partial"] = True
-                    result["_raw_response"] = content[:500]
-                    return result
-            except Exception as e2:
-                pass
-            # 返回错误信息，包含原始响应以便调试
-            return {
-                "_success": False, 
-                "_error": f"JSON parse error: {e}", 
-                "_raw_response": content[:1000],  # 增加长度以便调试
-                "_model": model
-            }
+            resp = await get_http_client().get(
+                OPENROUTER_MODELS_URL.format(model=model), timeout=10.0
+            )
+            endpoints = resp.json().get("data", {}).get("endpoints", []) if resp.is_success else []
+            _structured_support[model] = any(
+                "structured_outputs" in (e.get("supported_parameters") or []) for e in endpoints
+            )
+        except Exception as e:
+            # 查询失败时按不支持处理（本进程内不再重复查询）
+            print(f"[LLM] Capability lookup failed for {model}: {e}")
+            _structured_support[model] = False
+        print(f"[LLM] Structured output for {model}: {_structured_support[model]}")
+    return _structured_support[model]
+
 
+async def _analyze_once(
+    model: str,
+    headers: Dict[str, str],
+    make_messages: MessagesBuilder,
+    on_field: Optional[FieldCallback]
+) -> Dict[str, Any]:
+    """单次请求；结构化输出被拒绝（400）时记为不支持，立即改用普通 prompt 再请求一次"""
+    structured = await supports_structured_output(model)
+    result = await _stream_once(model, headers, make_messages(structured), structured, on_field)
+    if structured and result.get("_status") == 400:
+        print(f"[LLM] {model} rejected response_format, falling back to prompt-only JSON")
+        _structured_support[model] = False
+        result = await _stream_once(model, headers, make_messages(False), False, on_field)
+    return result
+
+
+async def _stream_once(
+    model: str,
+    headers: Dict[str, str],
+    messages: List[Dict[str, Any]],
+    structured: bool,
+    on_field: Optional[FieldCallback]
+) -> Dict[str, Any]:
+    """
+    单次流式请求
+    失败结果中 _retryable 表示是否值得重试（网络错误、429/5xx、流中断且无输出）
+    """
+    # usage.include：流式响应最后一个块附带 token 用量，便于评估图片预处理的效果
+    payload: Dict[str, Any] = {
+        "model": model,
+        "messages": messages,
+        "temperature": 0.0,
+        "stream": True,
+        "usage": {"include": True},
+    }
+    if structured:
+        payload["response_format"] = RESPONSE_FORMAT
+        # 只路由到支持该参数的服务商
+        payload["provider"] = {"require_parameters": True}
+
+    # 流式读取：顶层字段一闭合就解析出来，可通过 on_field 提前使用
+    # 结构化输出的短键名/枚举代码在这里逐字段解码回原有格式
+    parser = TopLevelFieldParser()
+    fields: Dict[str, Any] = {}
+    stream_error = None
+    usage = None
+    repaired: List[str] = []
+
+    async def deliver(completed: List[Tuple[str, Any]]) -> None:
+        for key, value in completed:
+            was_repaired = key in parser.repaired
+            if structured:
+                key, value = decode_field(key, value)
+            fields[key] = value
+            if was_repaired:
+                repaired.append(key)
+            if on_field is not None:
+                try:
+                    await on_field(key, value)
+                except Exception as e:
+                    print(f"[LLM] on_field callback failed: {e}")
+
+    try:
+        async with get_http_client().stream("POST", OPENROUTER_API_URL, headers=headers, json=payload) as resp:
+            if not resp.is_success:
+                body = (await resp.aread()).decode("utf-8", "replace")
+                return {
+                    "_success": False,
+                    "_error": f"HTTP {resp.status_code}",
+                    "_raw_response": body[:500],
+                    "_model": model,
+                    "_status": resp.status_code,
+                    "_retryable": resp.status_code in RETRYABLE_STATUS,
+                    "_retry_after": parse_retry_after(resp.headers.get("retry-after")),
+                }
+
+            async for line in resp.aiter_lines():
+                # SSE：忽略空行和 ": OPENROUTER PROCESSING" 之类的注释行
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                except json.JSONDecodeError:
+                    continue
+                if chunk.get("error"):
+                    stream_error = chunk["error"].get("message", str(chunk["error"])) if isinstance(chunk["error"], dict) else str(chunk["error"])
+                    break
+                if chunk.get("usage"):
+                    usage = chunk["usage"]
+                try:
+                    delta = chunk.get("choices", [])[0].get("delta", {}).get("content") or ""
+                except (IndexError, AttributeError):
+                    delta = ""
+                if not delta:
+                    continue
+                await deliver(parser.feed(delta))
+    except httpx.TransportError as e:
+        # 连接失败/超时/读取中断：未得到任何字段时可重试
+        return {"_success": False, "_error": str(e) or type(e).__name__, "_model": model,
+                "_retryable": not fields}
     except Exception as e:
         return {"_success": False, "_error": str(e), "_model": model}
 
+    # 顶层对象未闭合（max_tokens 截断、流中断）：修复最后一个字段，保留最长的合法前缀
+    truncated = parser.started and not parser.finished
+    await deliver(parser.close())
+
+    content = parser.text
+    if not content:
+        return {"_success": False, "_error": stream_error or "empty response", "_model": model, "_retryable": True}
+
+    if not fields:
+        # 返回错误信息，包含原始响应以便调试
+        return {
+            "_success": False,
+            "_error": stream_error or f"JSON parse error: {'; '.join(parser.errors) or 'no JSON object found'}",
+            "_raw_response": content[:1000],  # 增加长度以便调试
+            "_model": model,
+            "_retryable": stream_error is not None,
+        }
+
+    # 转换模型输出格式到完整格式（兼容完整和精简格式）
+    # 响应被截断时，已闭合的字段仍然可用
+    result = _expand_compact_result(fields)
+    result["_success"] = True
+    result["_model"] = model
+    result["_raw_response"] = content
+    result["_response_length"] = len(content)
+    result["_structured_output"] = structured
+    if truncated or stream_error:
+        result["_partial"] = True
+    if repaired:
+        result["_repaired_fields"] = repaired
+    if usage:
+        result["_usage"] = usage
+    # 添加调试信息：检查关键字段是否存在
+    missing_fields = [
+        f for f in ("person", "web_image_check", "scene", "lifestyle")
+        if f not in fields
+    ]
+    if missing_fields:
+        result["_missing_fields"] = missing_fields
+    return result
+
 
 def _expand_compact_result(compact: Dict[str, Any]) -> Dict[str, Any]:
     """将模型输出格式转换为完整格式，兼容 pipeline.py"""
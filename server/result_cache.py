@@ -0,0 +1,301 @@
+# server/result_cache.py
+"""
+分析结果缓存（内容寻址）
+key = sha256(图片字节) + target_gender + 模型名 + LLM 发起时机（llm_dispatch）
+两级缓存：
+- 内存 LRU（有界）
+- 磁盘 SQLite（带 TTL 与容量淘汰，重启后仍可命中）
+只缓存由默认模型调用成功的结果（截图降级、对冲次模型给出的结果不写入默认模型的 key）
+
+精确 key 未命中时，再用感知哈希（near_dup）查找近重复图片，
+被缩放/重压缩/轻微裁剪的转发图也能复用之前的分析结果
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from admission import get_admission
+from executors import run_cpu
+from image_artifact import Buffer, DecodedImage
+from near_dup import NEAR_DUP_ENABLED, NEAR_DUP_MAX_DISTANCE, PerceptualIndex, compute_phash
+from pipeline import DEFAULT_LLM_DISPATCH, analyze_image_bytes
+from qwen_client import DEFAULT_MODEL
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") not in ("0", "false", "False")
+RESULT_CACHE_MEMORY_ITEMS = int(os.getenv("RESULT_CACHE_MEMORY_ITEMS", "256"))
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", str(Path(__file__).parent / ".cache"))
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", str(7 * 24 * 3600)))
+RESULT_CACHE_DISK_MB = int(os.getenv("RESULT_CACHE_DISK_MB", "512"))
+
+
+def cache_key(image_bytes: Buffer, target_gender: str, model: str, llm_dispatch: str) -> str:
+    """内容寻址 key（含 llm_dispatch，按请求对比不同发起时机时不会互相命中）"""
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    return f"{digest}:{target_gender}:{model}:{llm_dispatch}"
+
+
+class MemoryLRU:
+    """有界内存 LRU，值为 (写入时间, 结果)"""
+
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self._data: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > RESULT_CACHE_TTL:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def put(self, key: str, created_at: float, value: Dict[str, Any]) -> None:
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            self._data[key] = (created_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+
+class DiskStore:
+    """SQLite 持久化存储，按最近访问时间做容量淘汰"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        self.path = str(Path(directory) / "results.sqlite3")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " payload TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON results(accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created_at, payload FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[0] > RESULT_CACHE_TTL:
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return row[0], json.loads(row[1])
+
+    def put(self, key: str, created_at: float, value: Dict[str, Any]) -> None:
+        payload = json.dumps(value, ensure_ascii=False)
+        size = len(payload.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, created_at, accessed_at, size, payload)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, created_at, created_at, size, payload),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """删除过期项；超出容量时按最近访问时间从旧到新删除，直到降到上限的 90%"""
+        self._conn.execute("DELETE FROM results WHERE created_at < ?", (time.time() - RESULT_CACHE_TTL,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute("SELECT key, size FROM results ORDER BY accessed_at").fetchall()
+        victims = []
+        for key, size in rows:
+            if total <= target:
+                break
+            victims.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM results WHERE key = ?", victims)
+
+
+class ResultCache:
+    """两级结果缓存 + 命中统计"""
+
+    def __init__(self):
+        self.memory = MemoryLRU(RESULT_CACHE_MEMORY_ITEMS)
+        self.disk: Optional[DiskStore] = None
+        try:
+            self.disk = DiskStore(RESULT_CACHE_DIR, RESULT_CACHE_DISK_MB * 1024 * 1024)
+        except Exception as e:
+            print(f"[Cache] Disk store unavailable, memory only: {e}")
+        self.hits = 0
+        self.misses = 0
+
+    async def get(
+        self, key: str, count_miss: bool = True
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str], Optional[float]]:
+        """返回 (结果, 命中层级 memory/disk, 写入时间)"""
+        entry = self.memory.get(key)
+        tier = "memory"
+        if entry is None and self.disk is not None:
+            try:
+                entry = await asyncio.to_thread(self.disk.get, key)
+            except Exception as e:
+                print(f"[Cache] Disk read failed: {e}")
+                entry = None
+            tier = "disk"
+            if entry is not None:
+                self.memory.put(key, entry[0], entry[1])
+        if entry is None:
+            if count_miss:
+                self.misses += 1
+            return None, None, None
+        self.hits += 1
+        return copy.deepcopy(entry[1]), tier, entry[0]
+
+    async def put(self, key: str, value: Dict[str, Any]) -> None:
+        created_at = time.time()
+        value = copy.deepcopy(value)
+        self.memory.put(key, created_at, value)
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.put, key, created_at, value)
+            except Exception as e:
+                print(f"[Cache] Disk write failed: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+_cache: Optional[ResultCache] = None
+_phash_index: Optional[PerceptualIndex] = None
+_phash_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    global _cache
+    if _cache is None:
+        _cache = ResultCache()
+    return _cache
+
+
+def get_phash_index() -> PerceptualIndex:
+    """感知哈希索引（首次使用时从磁盘加载）"""
+    global _phash_index
+    with _phash_lock:
+        if _phash_index is None:
+            try:
+                _phash_index = PerceptualIndex(RESULT_CACHE_DIR, RESULT_CACHE_TTL)
+            except Exception as e:
+                print(f"[Cache] Perceptual index persistence unavailable, memory only: {e}")
+                _phash_index = PerceptualIndex()
+        return _phash_index
+
+
+def flush_phash_index() -> None:
+    """进程退出前写入感知哈希索引中尚未落盘的记录"""
+    if _phash_index is not None:
+        _phash_index.flush()
+
+
+def _cache_meta(
+    tier: Optional[str],
+    created_at: Optional[float],
+    cache: ResultCache,
+    distance: Optional[int] = None
+) -> Dict[str, Any]:
+    meta = {
+        "hit": tier is not None,
+        "tier": tier,
+        "age_s": round(time.time() - created_at, 1) if created_at else None,
+        **cache.stats(),
+    }
+    if distance is not None:
+        meta["phash_distance"] = distance
+    return meta
+
+
+def _query_index(h: int, key_suffix: str) -> List[Tuple[int, str]]:
+    return get_phash_index().query(h, NEAR_DUP_MAX_DISTANCE, key_suffix)
+
+
+async def _admitted_analyze(image_bytes: Buffer, **kwargs: Any) -> Dict[str, Any]:
+    """执行完整分析；准入名额只在模型调用期间占用（见 pipeline._timed_llm_call）"""
+    return await analyze_image_bytes(image_bytes, admission=get_admission(), **kwargs)
+
+
+async def analyze_with_cache(
+    image_bytes: Buffer,
+    mime: str,
+    target_gender: str = "boyfriend",
+    **kwargs: Any
+) -> Dict[str, Any]:
+    """
+    在 analyze_image_bytes 前加一层结果缓存
+    命中时直接返回缓存结果，_meta.cache 中给出命中层级、缓存年龄和命中统计
+    未命中时先做准入预检（队列已满时在解码之前抛出 AdmissionRejected），
+    模型调用前再排队获取名额，排队耗时见 _meta.admission
+    """
+    if not RESULT_CACHE_ENABLED:
+        get_admission().check()
+        return await _admitted_analyze(image_bytes, mime=mime, target_gender=target_gender, **kwargs)
+
+    cache = get_result_cache()
+    dispatch = kwargs.get("llm_dispatch") or DEFAULT_LLM_DISPATCH
+    key = cache_key(image_bytes, target_gender, DEFAULT_MODEL, dispatch)
+    cached, tier, created_at = await cache.get(key, count_miss=not NEAR_DUP_ENABLED)
+    if cached is not None:
+        cached.setdefault("_meta", {})["cache"] = _cache_meta(tier, created_at, cache)
+        return cached
+
+    get_admission().check()
+    # 近重复查找：感知哈希只用低分辨率预览，图片对象随后交给分析流程复用
+    image = DecodedImage(image_bytes)
+    phash = None
+    if NEAR_DUP_ENABLED:
+        key_suffix = key[key.index(":"):]
+        try:
+            # 哈希计算在执行池中进行；索引只存在于主进程，查询放到线程中（首次会从磁盘加载）
+            phash = await run_cpu(compute_phash, image)
+            matches = await asyncio.to_thread(_query_index, phash, key_suffix)
+        except Exception as e:
+            print(f"[Cache] Perceptual hash failed: {e}")
+            matches = []
+        for distance, near_key in matches:
+            cached, tier, created_at = await cache.get(near_key, count_miss=False)
+            if cached is not None:
+                cached.setdefault("_meta", {})["cache"] = _cache_meta(f"near_{tier}", created_at, cache, distance)
+                return cached
+        cache.misses += 1
+
+    result = await _admitted_analyze(
+        image_bytes, mime=mime, target_gender=target_gender, image=image, **kwargs
+    )
+    # 只缓存默认模型调用成功的结果：失败/降级结果下次仍重新分析，
+    # 实际由其他模型（截图降级 SCREENSHOT_LLM_MODEL、对冲次模型）给出的结果不能挂在默认模型的 key 下
+    meta = result.get("_meta", {})
+    if meta.get("model_success") and meta.get("model") == DEFAULT_MODEL:
+        await cache.put(key, result)
+        if phash is not None:
+            await asyncio.to_thread(get_phash_index().add, phash, key)
+    result.setdefault("_meta", {})["cache"] = _cache_meta(None, None, cache)
+    return result
@@ -0,0 +1,211 @@
+# server/screenshot_detector.py
+"""
+本地手机截图 / App 界面检测
+诈骗图片中很大一部分是他人社交平台内容的截图。这里在可信度阶段用廉价的像素统计识别：
+- 尺寸：宽度与常见手机屏幕分辨率一致、长宽比 1.7~2.3
+- 状态栏：顶部背景均匀的横带，左侧（时间）和右侧（电池/信号）有小图标，电池图标模板匹配
+- 底部导航：底部均匀横带，中间的 Home 指示条（模板匹配）或三个导航按钮
+- 圆角遮罩：四角在圆弧外侧为纯色
+- App 界面：大面积完全平坦的区域和整行同色的分隔条/标题栏
+全部基于按行/列的向量化统计，在宽度归一化为 NORM_WIDTH 的灰度图上计算
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import cv2
+
+from image_artifact import DecodedImage
+
+# 归一化宽度（约等于手机逻辑分辨率 dp/pt）
+NORM_WIDTH = 360
+
+# 常见手机屏幕短边像素（截图尺寸与屏幕分辨率一致）
+PHONE_SCREEN_WIDTHS = {640, 720, 750, 828, 1080, 1125, 1170, 1179, 1206, 1242, 1284, 1290, 1320, 1440}
+
+# 状态栏 / 底部导航所在横带的高度（相对宽度）
+_BAND_RATIO = 0.14
+# 与背景差值超过该值的像素视为图标/文字
+_GLYPH_DELTA = 60
+_TEMPLATE_THRESHOLD = 0.6
+
+# 各信号的权重，总分截断到 1
+_WEIGHTS = {
+    "screen_size": 0.35,
+    "aspect": 0.15,
+    "status_bar": 0.3,
+    "battery_icon": 0.1,
+    "nav_bar": 0.2,
+    "rounded_corners": 0.1,
+    "app_chrome": 0.15,
+}
+LEVEL_THRESHOLDS = (("high", 0.7), ("medium", 0.4), ("low", 0.15))
+
+
+def _make_templates() -> Dict[str, np.ndarray]:
+    """归一化宽度下的合成模板（亮图标、暗背景；匹配时取相关系数绝对值，兼容深色模式）"""
+    home = np.zeros((13, 140), np.float32)
+    cv2.rectangle(home, (8, 4), (131, 8), 255, -1)
+    battery = np.zeros((16, 32), np.float32)
+    cv2.rectangle(battery, (2, 2), (26, 13), 255, 1)
+    cv2.rectangle(battery, (5, 5), (21, 10), 255, -1)
+    cv2.rectangle(battery, (27, 6), (29, 9), 255, -1)
+    return {name: cv2.GaussianBlur(t, (3, 3), 0) for name, t in (("home_indicator", home), ("battery", battery))}
+
+
+_TEMPLATES = _make_templates()
+
+
+def _normalized_gray(image: DecodedImage, preview_side: Optional[int]) -> np.ndarray:
+    dims = image.dims
+    w, h = dims["width"], dims["height"]
+    max_side = max(w, h) if w <= NORM_WIDTH else int(round(max(w, h) * NORM_WIDTH / w))
+    if not preview_side:
+        rgb, _ = image.downscaled(max_side)
+        return cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+    # 快速模式：复用同一份预览，不再单独解码
+    gray = cv2.cvtColor(image.preview(preview_side)[0], cv2.COLOR_RGB2GRAY)
+    ph, pw = gray.shape
+    if pw > NORM_WIDTH:
+        gray = cv2.resize(gray, (NORM_WIDTH, max(1, int(round(ph * NORM_WIDTH / pw)))), interpolation=cv2.INTER_AREA)
+    return gray
+
+
+def _band_stats(band: np.ndarray) -> Dict[str, Any]:
+    """横带统计：背景占比、图标像素占比、图标在左/中/右三段的分布、背景是否按行一致"""
+    bg = float(np.median(band))
+    dev = np.abs(band.astype(np.int16) - int(bg))
+    glyph = dev > _GLYPH_DELTA
+    cols = glyph.any(axis=0)
+    w = band.shape[1]
+    third = max(1, w // 3)
+    row_medians = np.median(band, axis=1)
+    return {
+        "bg_fraction": float((dev <= 10).mean()),
+        "glyph_fraction": float(glyph.mean()),
+        "left": bool(cols[:third].any()),
+        "center": bool(cols[third:w - third].any()),
+        "right": bool(cols[w - third:].any()),
+        "clusters": _count_runs(cols, min_gap=max(4, w // 20)),
+        "row_consistent": float(np.std(row_medians)) < 6,
+    }
+
+
+def _count_runs(mask: np.ndarray, min_gap: int) -> int:
+    """一维布尔序列中的连续段数（间隔小于 min_gap 的段合并）"""
+    idx = np.flatnonzero(mask)
+    if idx.size == 0:
+        return 0
+    return int(1 + np.count_nonzero(np.diff(idx) > min_gap))
+
+
+def _template_score(region: np.ndarray, template: np.ndarray) -> float:
+    if region.shape[0] < template.shape[0] or region.shape[1] < template.shape[1]:
+        return 0.0
+    res = cv2.matchTemplate(region.astype(np.float32), template, cv2.TM_CCOEFF_NORMED)
+    lo, hi, _, _ = cv2.minMaxLoc(res)
+    return float(max(hi, -lo))
+
+
+def _rounded_corners(gray: np.ndarray) -> int:
+    """四角中呈圆角遮罩的个数：圆弧外侧为纯色，且与弧内侧明显不同"""
+    h, w = gray.shape
+    r = max(6, int(w * 0.08))
+    if h < 2 * r or w < 2 * r:
+        return 0
+    yy, xx = np.mgrid[0:r, 0:r]
+    dist = np.hypot(r - yy - 0.5, r - xx - 0.5)
+    outside = dist > r + 1
+    inside_rim = (dist < r - 2) & (dist > r * 0.6)
+    corners = [gray[:r, :r], gray[:r, -r:][:, ::-1], gray[-r:, :r][::-1, :], gray[-r:, -r:][::-1, ::-1]]
+    count = 0
+    for patch in corners:
+        out_px = patch[outside].astype(np.float32)
+        in_px = patch[inside_rim].astype(np.float32)
+        if out_px.std() < 4 and abs(out_px.mean() - in_px.mean()) > 25:
+            count += 1
+    return count
+
+
+def _app_chrome(gray: np.ndarray) -> Tuple[float, float]:
+    """(水平方向完全平坦的像素占比, 整行同色的行占比)"""
+    g = gray.astype(np.int16)
+    flat = float((np.abs(np.diff(g, axis=1)) <= 1).mean())
+    uniform_rows = float((g.std(axis=1) < 3).mean())
+    return flat, uniform_rows
+
+
+def detect_screenshot(image: DecodedImage, preview_side: Optional[int] = None) -> Dict[str, Any]:
+    """
+    返回 {"is_screenshot", "level", "score", "platform", "signals", "features"}
+    level: high / medium / low / none；high 时可直接作为网图结论，跳过或降级模型调用
+    preview_side: 指定时使用不做全尺寸解码的预览（快速模式）
+    """
+    dims = image.dims
+    w, h = dims["width"], dims["height"]
+    short, long = min(w, h), max(w, h)
+    aspect = long / short if short else 0.0
+    portrait = h >= w
+
+    hits: Dict[str, bool] = {}
+    signals: List[str] = []
+    features: Dict[str, Any] = {"aspect": round(aspect, 3)}
+    platform = None
+
+    hits["screen_size"] = short in PHONE_SCREEN_WIDTHS and 1.7 <= aspect <= 2.3
+    hits["aspect"] = not hits["screen_size"] and portrait and 1.9 <= aspect <= 2.3
+    if hits["screen_size"]:
+        signals.append(f"尺寸 {w}x{h} 与常见手机屏幕分辨率一致（长宽比 {aspect:.2f}）")
+    elif hits["aspect"]:
+        signals.append(f"长宽比 {aspect:.2f} 与全面屏手机屏幕一致")
+
+    gray = _normalized_gray(image, preview_side)
+    gh, gw = gray.shape
+    band_h = max(8, int(gw * _BAND_RATIO))
+    if portrait and gh >= 4 * band_h:
+        top = _band_stats(gray[:band_h])
+        bottom = _band_stats(gray[-band_h:])
+        battery = _template_score(gray[:band_h, gw * 2 // 3:], _TEMPLATES["battery"])
+        home = _template_score(gray[-band_h:, gw // 4: gw - gw // 4], _TEMPLATES["home_indicator"])
+        features.update(status_band=top, nav_band=bottom, battery_match=round(battery, 3), home_match=round(home, 3))
+
+        hits["status_bar"] = (
+            top["bg_fraction"] >= 0.75 and top["row_consistent"]
+            and 0.003 <= top["glyph_fraction"] <= 0.2 and top["left"] and top["right"]
+        )
+        hits["battery_icon"] = hits["status_bar"] and battery >= _TEMPLATE_THRESHOLD
+        if hits["status_bar"]:
+            signals.append("顶部有背景均匀、两端带图标/文字的状态栏"
+                           + ("，右侧匹配到电池图标" if hits["battery_icon"] else ""))
+
+        nav_uniform = bottom["bg_fraction"] >= 0.8 and bottom["row_consistent"]
+        home_indicator = nav_uniform and home >= 0.75
+        three_buttons = nav_uniform and bottom["clusters"] == 3 and bottom["left"] and bottom["center"] and bottom["right"]
+        hits["nav_bar"] = home_indicator or three_buttons
+        if home_indicator:
+            platform = "iOS"
+            signals.append("底部中央有 Home 指示条")
+        elif three_buttons:
+            platform = "Android"
+            signals.append("底部有三键导航栏")
+
+    corners = _rounded_corners(gray)
+    hits["rounded_corners"] = corners >= 3
+    if hits["rounded_corners"]:
+        signals.append(f"{corners} 个角为圆角遮罩")
+
+    flat, uniform_rows = _app_chrome(gray)
+    features.update(corners=corners, flat_ratio=round(flat, 3), uniform_row_ratio=round(uniform_rows, 3))
+    hits["app_chrome"] = flat >= 0.5 and uniform_rows >= 0.12
+    if hits["app_chrome"]:
+        signals.append(f"大面积纯色平坦区域（{flat:.0%}）和整行同色的界面分隔（{uniform_rows:.0%} 的行）")
+
+    score = min(1.0, sum((_WEIGHTS[k] for k, v in hits.items() if v), 0.0))
+    level = next((name for name, threshold in LEVEL_THRESHOLDS if score >= threshold), "none")
+    return {
+        "is_screenshot": level in ("high", "medium"),
+        "level": level,
+        "score": round(score, 3),
+        "platform": platform,
+        "signals": signals,
+        "features": features,
+    }
@@ -0,0 +1,32 @@
+# server/tests/conftest.py
+"""
+测试公共配置：server/ 下为平铺模块，加入 sys.path 后按模块名直接导入
+运行：cd server && python -m pytest -q
+"""
+import io
+import sys
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+_XMP_PREFIX = b"http://ns.adobe.com/xap/1.0/\x00"
+
+
+def make_jpeg(width: int = 320, height: int = 240, quality: int = 85, exif: Optional[Image.Exif] = None,
+              xmp: Optional[str] = None, seed: int = 0) -> bytes:
+    """生成带可选 EXIF / XMP（APP1）的 JPEG 字节"""
+    rng = np.random.default_rng(seed)
+    arr = rng.integers(0, 255, (height // 8, width // 8, 3), dtype=np.uint8)
+    img = Image.fromarray(arr).resize((width, height), Image.Resampling.BILINEAR)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=quality, **({"exif": exif} if exif is not None else {}))
+    data = buf.getvalue()
+    if xmp is not None:
+        payload = _XMP_PREFIX + xmp.encode("utf-8")
+        segment = b"\xff\xe1" + (len(payload) + 2).to_bytes(2, "big") + payload
+        data = data[:2] + segment + data[2:]
+    return data
@@ -0,0 +1,116 @@
+# server/tests/test_admission.py
+import asyncio
+
+import pytest
+
+import pipeline
+from admission import AdmissionController, AdmissionRejected
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_immediate_admission():
+    async def scenario():
+        ctl = AdmissionController(2, 4, 1.0)
+        async with ctl.slot() as ticket:
+            assert ctl.active == 1
+            assert ticket["queued_ms"] < 50
+        assert ctl.active == 0 and ctl.admitted == 1
+    run(scenario())
+
+
+def test_fifo_handoff_never_exceeds_limit():
+    async def scenario():
+        ctl = AdmissionController(1, 10, 5.0)
+        order, peak = [], [0]
+
+        async def worker(i):
+            async with ctl.slot():
+                peak[0] = max(peak[0], ctl.active)
+                order.append(i)
+                await asyncio.sleep(0.01)
+
+        tasks = []
+        for i in range(5):
+            tasks.append(asyncio.create_task(worker(i)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        assert order == [0, 1, 2, 3, 4]
+        assert peak[0] == 1 and ctl.active == 0 and ctl.queued == 0
+    run(scenario())
+
+
+def test_queue_full_rejects_with_429():
+    async def scenario():
+        ctl = AdmissionController(1, 1, 5.0)
+        release = asyncio.Event()
+
+        async def hold():
+            async with ctl.slot():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        assert ctl.queued == 1
+        with pytest.raises(AdmissionRejected) as e:
+            ctl.check()
+        assert e.value.status_code == 429 and e.value.retry_after >= 1
+        with pytest.raises(AdmissionRejected):
+            async with ctl.slot():
+                pass
+        assert ctl.rejected_queue_full == 2
+        release.set()
+        await asyncio.gather(holder, waiter)
+    run(scenario())
+
+
+def test_wait_timeout_rejects_with_503():
+    async def scenario():
+        ctl = AdmissionController(1, 4, 0.05)
+        async with ctl.slot():
+            with pytest.raises(AdmissionRejected) as e:
+                async with ctl.slot():
+                    pass
+            assert e.value.status_code == 503
+            assert ctl.queued == 0
+        assert ctl.active == 0 and ctl.rejected_timeout == 1
+    run(scenario())
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def scenario():
+        ctl = AdmissionController(1, 4, 5.0)
+        async with ctl.slot():
+            async def wait():
+                async with ctl.slot():
+                    pass
+            task = asyncio.create_task(wait())
+            await asyncio.sleep(0)
+            assert ctl.queued == 1
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert ctl.queued == 0
+        assert ctl.active == 0
+    run(scenario())
+
+
+def test_slot_covers_only_the_model_call(monkeypatch):
+    async def scenario():
+        ctl = AdmissionController(1, 4, 5.0)
+        seen = {}
+
+        async def fake_llm(**kwargs):
+            seen["active"] = ctl.active
+            return {"_success": True}
+
+        monkeypatch.setattr(pipeline, "analyze_with_qwen", fake_llm)
+        timings = {}
+        result = await pipeline._timed_llm_call(timings, 0.0, None, None, ctl, image_bytes=b"")
+        assert seen["active"] == 1 and ctl.active == 0
+        assert "queued_ms" in result["_admission"] and "llm" in timings
+    run(scenario())
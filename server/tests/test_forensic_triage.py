@@ -0,0 +1,85 @@
+# server/tests/test_forensic_triage.py
+import io
+import struct
+import zlib
+
+import numpy as np
+from PIL import Image
+
+from conftest import make_jpeg
+from forensic_triage import forensic_triage, triage_summary
+from image_artifact import DecodedImage
+from modules_credibility import credibility_module, header_context
+
+PHOTOSHOP_XMP = """<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">
+<rdf:Description xmp:CreatorTool="Adobe Photoshop 25.0" crs:Exposure2012="+0.35">
+<xmpMM:History><rdf:Seq>
+<rdf:li stEvt:action="created" stEvt:softwareAgent="Adobe Photoshop 25.0"/>
+<rdf:li stEvt:action="saved" stEvt:softwareAgent="Adobe Photoshop 25.0"/>
+</rdf:Seq></xmpMM:History>
+</rdf:Description></rdf:RDF></x:xmpmeta>"""
+
+
+def _png_with_chunk(kind: bytes, width: int = 1170, height: int = 2532) -> bytes:
+    """在 IHDR 之后插入一个私有块的 PNG"""
+    buf = io.BytesIO()
+    Image.fromarray(np.zeros((height, width, 3), dtype=np.uint8)).save(buf, "PNG")
+    data = buf.getvalue()
+    chunk = struct.pack(">I", 4) + kind + b"\x00" * 4
+    chunk += struct.pack(">I", zlib.crc32(kind + b"\x00" * 4))
+    ihdr_end = 8 + 12 + 13
+    return data[:ihdr_end] + chunk + data[ihdr_end:]
+
+
+def test_ijg_quality_estimate():
+    for quality in (60, 85, 95):
+        triage = forensic_triage(DecodedImage(make_jpeg(quality=quality)))
+        assert triage["jpeg"]["standard"] is True
+        assert triage["jpeg"]["quality"] == quality
+        assert triage["encoder"].startswith("libjpeg")
+        assert triage["route"] == "full"
+
+
+def test_xmp_editing_hints():
+    triage = forensic_triage(DecodedImage(make_jpeg(xmp=PHOTOSHOP_XMP)))
+    assert "软件标记包含 'Adobe Photoshop 25.0'" in triage["editing"]
+    assert "XMP 含 Camera Raw / Lightroom 调整参数" in triage["editing"]
+    assert any(s.startswith("XMP 编辑历史 2 条") for s in triage["signals"])
+    assert triage_summary(triage)["editing"] == 2
+
+
+def test_credibility_reports_header_editing_hints():
+    """回归：预检给出的编辑痕迹必须进入可信度分析项，而不只是 EXIF 为空的提示"""
+    image = DecodedImage(make_jpeg(xmp=PHOTOSHOP_XMP))
+    for triage in (None, forensic_triage(image)):
+        cred = credibility_module(image, triage=triage)
+        editing = [item for item in cred["items"] if item["claim"] == "检测到可能的编辑痕迹提示"]
+        assert len(editing) == 1
+        evidence = editing[0]["evidence"]
+        assert any("Adobe Photoshop 25.0" in e for e in evidence)
+        assert any("Camera Raw" in e for e in evidence)
+
+
+def test_header_context_reuses_triage():
+    image = DecodedImage(make_jpeg())
+    triage = forensic_triage(image)
+    triage["route"] = "sentinel"
+    assert header_context(image, triage)["forensics"]["route"] == "sentinel"
+    assert header_context(image)["forensics"]["route"] == "full"
+
+
+def test_png_apple_chunk_routes_screenshot():
+    triage = forensic_triage(DecodedImage(_png_with_chunk(b"iDOT")))
+    assert triage["screenshot"] == "high"
+    assert triage["route"] == "screenshot"
+
+
+def test_png_screen_size_without_marker_is_medium():
+    triage = forensic_triage(DecodedImage(_png_with_chunk(b"zzZz")))
+    assert triage["screenshot"] == "medium"
+
+
+def test_plain_photo_size_png_is_full():
+    triage = forensic_triage(DecodedImage(_png_with_chunk(b"zzZz", width=640, height=480)))
+    assert triage["screenshot"] == "none"
+    assert triage["route"] == "full"
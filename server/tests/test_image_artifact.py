@@ -0,0 +1,74 @@
+# server/tests/test_image_artifact.py
+import pickle
+import threading
+import time
+
+import image_artifact
+from conftest import make_jpeg
+from image_artifact import DecodedImage
+
+
+def _slow(value, delay=0.2):
+    def compute():
+        time.sleep(delay)
+        return value
+    return compute
+
+
+def test_independent_keys_compute_concurrently():
+    image = DecodedImage(make_jpeg())
+    threads = [threading.Thread(target=image._cached, args=(key, _slow(key))) for key in ("a", "b")]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert time.perf_counter() - t0 < 0.35
+    assert image._cache["a"] == "a" and image._cache["b"] == "b"
+
+
+def test_same_key_computed_once():
+    image = DecodedImage(make_jpeg())
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.05)
+        return object()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(image._cached("k", compute))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1 and len({id(r) for r in results}) == 1
+
+
+def test_pyramid_levels_share_base():
+    image = DecodedImage(make_jpeg(4000, 3000))
+    small, scale = image.downscaled(640)
+    assert max(small.shape[:2]) == 640 and abs(scale - 0.16) < 1e-6
+    assert ("pyramid", "rgb", image_artifact.PYRAMID_BASE_SIDE) in image._cache
+    image.release()
+    assert not image._cache
+    assert image.downscaled(640)[0].shape == small.shape
+
+
+def test_unpickled_copies_share_worker_cache(monkeypatch):
+    monkeypatch.setattr(image_artifact, "_worker_images", image_artifact.OrderedDict())
+    image = DecodedImage(make_jpeg())
+    payload = pickle.dumps(image)
+    first = pickle.loads(payload)
+    rgb = first.rgb
+    second = pickle.loads(payload)
+    assert second.image_id == image.image_id
+    assert second.rgb is rgb
+
+
+def test_worker_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(image_artifact, "_worker_images", image_artifact.OrderedDict())
+    monkeypatch.setattr(image_artifact, "PROCESS_IMAGE_CACHE", 2)
+    for seed in range(4):
+        pickle.loads(pickle.dumps(DecodedImage(make_jpeg(seed=seed))))
+    assert len(image_artifact._worker_images) == 2
@@ -0,0 +1,74 @@
+# server/tests/test_job_webhooks.py
+import asyncio
+
+import httpx
+import pytest
+
+import jobs
+from jobs import WebhookRejected, check_webhook_url, resolve_public_address
+
+
+@pytest.fixture
+def allow_hosts(monkeypatch):
+    def set_hosts(*hosts):
+        monkeypatch.setattr(jobs, "JOB_WEBHOOK_ALLOWED_HOSTS", list(hosts))
+    return set_hosts
+
+
+def test_webhooks_disabled_without_allow_list(allow_hosts):
+    allow_hosts()
+    with pytest.raises(WebhookRejected, match="disabled"):
+        check_webhook_url("https://hooks.example.com/done")
+
+
+def test_allow_list_matching(allow_hosts):
+    allow_hosts("hooks.example.com", "*.example.org")
+    assert check_webhook_url("https://hooks.example.com/done").host == "hooks.example.com"
+    assert check_webhook_url("http://a.b.example.org:8080/x").port == 8080
+    for url in ("https://example.org/", "https://evil.com/", "https://hooks.example.com.evil.com/",
+                "ftp://hooks.example.com/", "https://user:pw@hooks.example.com/", "not a url"):
+        with pytest.raises(WebhookRejected):
+            check_webhook_url(url)
+
+
+@pytest.mark.parametrize("host", ["127.0.0.1", "10.1.2.3", "192.168.0.10", "172.16.5.5",
+                                  "169.254.169.254", "100.64.0.1", "0.0.0.0", "::1", "fd00::1",
+                                  "::ffff:127.0.0.1", "224.0.0.1"])
+def test_non_public_addresses_rejected(host):
+    with pytest.raises(WebhookRejected, match="non-public"):
+        asyncio.run(resolve_public_address(host, 443))
+
+
+def test_public_address_accepted():
+    assert asyncio.run(resolve_public_address("8.8.8.8", 443)) == "8.8.8.8"
+
+
+def test_post_connects_to_resolved_address(allow_hosts, monkeypatch):
+    allow_hosts("*")
+    seen = {}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.update(url=str(request.url), host=request.headers["host"],
+                    sni=request.extensions.get("sni_hostname"))
+        return httpx.Response(204)
+
+    async def fake_resolve(host, port):
+        return "93.184.216.34"
+
+    monkeypatch.setattr(jobs, "resolve_public_address", fake_resolve)
+    monkeypatch.setattr(jobs, "_webhook_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    job = {"job_id": "j1", "status": "succeeded", "result": {}, "error": None,
+           "webhook_url": "https://hooks.example.com:8443/done"}
+    outcome = asyncio.run(jobs._notify_webhook(job))
+    assert outcome == {"delivered": True, "status_code": 204, "attempts": 1}
+    assert seen == {"url": "https://93.184.216.34:8443/done", "host": "hooks.example.com:8443",
+                    "sni": "hooks.example.com"}
+
+
+def test_rejected_webhook_is_not_retried(allow_hosts, monkeypatch):
+    allow_hosts("*")
+    job = {"job_id": "j2", "status": "failed", "result": None, "error": "x",
+           "webhook_url": "http://127.0.0.1:9/hook"}
+    outcome = asyncio.run(jobs._notify_webhook(job))
+    assert outcome["delivered"] is False and outcome["attempts"] == 1
+    assert "non-public" in outcome["error"]
@@ -0,0 +1,25 @@
+# server/tests/test_llm_image.py
+from conftest import make_jpeg
+from image_artifact import DecodedImage
+from llm_image import prepare_roi_request
+
+
+def _person_det(width, height):
+    return {
+        "image_dims": {"width": width, "height": height},
+        "persons": [{"bbox": [width // 2, height // 3, width // 2 + 300, height // 3 + 500]}],
+        "faces": [],
+    }
+
+
+def test_roi_request_is_smaller_than_original():
+    data = make_jpeg(2400, 1800, quality=95, seed=1)
+    roi = prepare_roi_request(DecodedImage(data), "image/jpeg", _person_det(2400, 1800))
+    assert roi is not None and roi["crops"]
+    assert roi["info"]["sent_bytes"] < len(data)
+    assert roi["info"]["bytes_saved"] > 0
+
+
+def test_roi_request_falls_back_when_not_smaller():
+    data = make_jpeg(2400, 1800, quality=5, seed=1)
+    assert prepare_roi_request(DecodedImage(data), "image/jpeg", _person_det(2400, 1800)) is None
@@ -0,0 +1,92 @@
+# server/tests/test_llm_json.py
+import json
+import random
+
+import pytest
+
+from llm_json import TopLevelFieldParser, loads_tolerant, repair_json
+
+RESPONSE = {
+    "scene": {"type": "室内", "note": "带 \"引号\"、反斜杠 \\\\ 和 {括号} [方括号], 逗号"},
+    "objects": {"items": [{"label": "cup", "conf": 0.9}, {"label": "phone", "conf": -1.5e-3}]},
+    "person": {"visible": True, "age": None},
+    "girlfriend_comments": ["第一条", "第二条\\n换行"],
+}
+TEXT = "```json\n" + json.dumps(RESPONSE, ensure_ascii=False, indent=2) + "\n```\n说明文字 }"
+
+
+def _stream(text, sizes):
+    parser = TopLevelFieldParser()
+    fields, pos = [], 0
+    for size in sizes:
+        fields += parser.feed(text[pos:pos + size])
+        pos += size
+    fields += parser.feed(text[pos:])
+    fields += parser.close()
+    return parser, fields
+
+
+def test_fields_in_order_regardless_of_chunking():
+    expected = list(RESPONSE.items())
+    rng = random.Random(3)
+    for sizes in ([len(TEXT)], [1] * len(TEXT), [rng.randint(1, 9) for _ in range(len(TEXT))]):
+        parser, fields = _stream(TEXT, sizes)
+        assert fields == expected
+        assert parser.finished and not parser.repaired and not parser.errors
+        assert parser.text == TEXT[:sum(sizes)] + TEXT[sum(sizes):]
+
+
+@pytest.mark.parametrize("cut", range(1, 40))
+def test_escape_split_across_chunks(cut):
+    text = '{"a": "x\\\\", "b": "q\\"}, ", "c": 1}'
+    parser, fields = _stream(text, [cut])
+    assert dict(fields) == {"a": "x\\", "b": 'q"}, ', "c": 1}
+
+
+def test_feed_after_close_of_object_is_ignored():
+    parser = TopLevelFieldParser()
+    assert parser.feed('{"a": 1}') == [("a", 1)]
+    assert parser.feed(', "b": 2}') == []
+    assert parser.text == '{"a": 1}, "b": 2}'
+
+
+def test_truncated_stream_recovers_prefix():
+    text = json.dumps(RESPONSE, ensure_ascii=False)
+    cut = text.index("第二条") + 2
+    parser, fields = _stream(text[:cut], [7] * (cut // 7))
+    values = dict(fields)
+    assert values["girlfriend_comments"] == ["第一条", "第二"]
+    assert parser.repaired == {"girlfriend_comments"}
+
+
+def test_malformed_member_is_repaired():
+    parser, fields = _stream('{"a": [1, 2,], "b": {"x": 1 "y": 2}}', [5] * 8)
+    assert dict(fields) == {"a": [1, 2], "b": {"x": 1, "y": 2}}
+    assert parser.repaired == {"a", "b"}
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ('{"a": 1,}', {"a": 1}),
+    ('{"a": [1, 2,,]}', {"a": [1, 2]}),
+    ('{"a": 1 "b": 2}', {"a": 1, "b": 2}),
+    ('```json\n{"a": "x"}\n```', {"a": "x"}),
+    ('{"a": "trunc', {"a": "trunc"}),
+    ('{"a": "esc\\', {"a": "esc"}),
+    ('{"a": "u\\u00', {"a": "u"}),
+    ('{"a": 1, "b": 12', {"a": 1}),
+    ('{"a": 1, "b"', {"a": 1}),
+    ('{"a": {"b": [1, {"c": tr', {"a": {"b": [1, {}]}}),
+    ('[1, 2', [1]),
+])
+def test_repair_json(raw, expected):
+    repaired, changed = repair_json(raw)
+    assert changed
+    assert json.loads(repaired) == expected
+
+
+def test_repair_json_unchanged_and_missing():
+    assert repair_json('{"a": [1, {"b": null}]}') == ('{"a":[1,{"b":null}]}', False)
+    assert repair_json("no json here") == (None, False)
+    with pytest.raises(ValueError):
+        loads_tolerant("no json here")
+    assert loads_tolerant('{"a": 1,}') == ({"a": 1}, True)
@@ -0,0 +1,127 @@
+# server/tests/test_near_dup.py
+import io
+import random
+
+import pytest
+from PIL import Image
+
+import near_dup
+from conftest import make_jpeg
+from image_artifact import DecodedImage
+from near_dup import PerceptualIndex, compute_phash, hamming
+
+
+def _reencode(data: bytes, scale: float, quality: int) -> bytes:
+    img = Image.open(io.BytesIO(data))
+    img = img.resize((int(img.width * scale), int(img.height * scale)), Image.Resampling.BILINEAR)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def test_phash_robust_to_resize_and_recompression():
+    original = make_jpeg(1600, 1200, quality=92, seed=1)
+    h = compute_phash(DecodedImage(original))
+    for scale, quality in ((0.5, 70), (0.3, 60), (1.0, 50)):
+        assert hamming(h, compute_phash(DecodedImage(_reencode(original, scale, quality)))) <= 8
+    assert hamming(h, compute_phash(DecodedImage(make_jpeg(1600, 1200, seed=2)))) > 8
+
+
+def test_phash_does_not_decode_full_resolution():
+    image = DecodedImage(make_jpeg(2400, 1800))
+    compute_phash(image)
+    assert "rgb" not in image._cache and "gray" not in image._cache
+
+
+def test_phash_reuses_decoded_pyramid():
+    data = make_jpeg(1200, 900, seed=3)
+    decoded = DecodedImage(data)
+    decoded.rgb
+    assert hamming(compute_phash(decoded), compute_phash(DecodedImage(data))) <= 4
+
+
+def test_query_matches_brute_force():
+    rng = random.Random(7)
+    index = PerceptualIndex()
+    hashes = {}
+    base = rng.getrandbits(64)
+    for i in range(2000):
+        h = base ^ sum(1 << b for b in rng.sample(range(64), rng.randint(0, 12))) if i % 4 == 0 else rng.getrandbits(64)
+        hashes[f"k{i}:boyfriend:m"] = h
+        index.add(h, f"k{i}:boyfriend:m")
+    expected = sorted((hamming(base, h), k) for k, h in hashes.items() if hamming(base, h) <= 8)
+    assert index.query(base, 8, ":boyfriend:m") == expected
+    assert index.query(base, 8, ":girlfriend:m") == []
+
+
+def test_readding_key_does_not_duplicate():
+    index = PerceptualIndex()
+    index.add(0x0123456789ABCDEF, "a:boyfriend:m")
+    index.add(0x0123456789ABCDEF, "a:boyfriend:m")
+    assert len(index) == 1
+    assert index.query(0x0123456789ABCDEF, 8) == [(0, "a:boyfriend:m")]
+    # 同一 key 更新为新哈希后，旧哈希的桶里不再有它
+    index.add(0xFEDCBA9876543210, "a:boyfriend:m")
+    assert index.query(0x0123456789ABCDEF, 8) == []
+    assert index.query(0xFEDCBA9876543210, 8) == [(0, "a:boyfriend:m")]
+    assert len(index) == 1
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(near_dup.time, "time", lambda: now[0])
+    return now
+
+
+def test_ttl_expiry_and_prune(clock, tmp_path):
+    index = PerceptualIndex(str(tmp_path), ttl=3600)
+    index.add(1, "old:boyfriend:m")
+    clock[0] += 3000
+    index.add(2, "new:boyfriend:m")
+    clock[0] += 1000
+    # 过期记录不再返回，且在下一次写入时从内存和磁盘清理
+    assert index.query(1, 8) == [(2, "new:boyfriend:m")]
+    index.add(1 << 40, "other:boyfriend:m")
+    assert len(index) == 2
+    assert len(PerceptualIndex(str(tmp_path), ttl=3600)) == 2
+
+
+def test_persistence_round_trip(tmp_path):
+    h = 0xF0F0F0F0F0F0F0F0
+    index = PerceptualIndex(str(tmp_path), ttl=3600)
+    index.add(h, "a:boyfriend:m")
+    index.add(h, "a:boyfriend:m")
+    # 写入按批提交，未满一批时需显式 flush
+    assert len(PerceptualIndex(str(tmp_path), ttl=3600)) == 0
+    index.flush()
+    reloaded = PerceptualIndex(str(tmp_path), ttl=3600)
+    assert len(reloaded) == 1
+    assert reloaded.query(h, 0) == [(0, "a:boyfriend:m")]
+
+
+def test_batched_commits_and_replacing_flushed_keys(tmp_path):
+    index = PerceptualIndex(str(tmp_path), ttl=3600)
+    for i in range(near_dup.COMMIT_EVERY):
+        index.add(i << 20, f"k{i}:boyfriend:m")
+    assert len(PerceptualIndex(str(tmp_path), ttl=3600)) == near_dup.COMMIT_EVERY
+    # 已落盘的 key 更新后，旧槽被删除，新哈希在下一批之前也能查到
+    index.add(0xFFFF_0000_0000_0000, "k0:boyfriend:m")
+    assert len(index) == near_dup.COMMIT_EVERY
+    assert index.query(0, 0) == []
+    assert index.query(0xFFFF_0000_0000_0000, 0) == [(0, "k0:boyfriend:m")]
+    index.flush()
+    reloaded = PerceptualIndex(str(tmp_path), ttl=3600)
+    assert reloaded.query(0xFFFF_0000_0000_0000, 0) == [(0, "k0:boyfriend:m")]
+    assert reloaded.query(1 << 20, 0) == [(0, "k1:boyfriend:m")]
+
+
+def test_compaction_keeps_live_entries():
+    index = PerceptualIndex()
+    for version in range(3):
+        for i in range(100):
+            index.add((i << 8) | version, f"k{i}:boyfriend:m")
+    assert len(index) == 100 and index._count < 300
+    assert index.query(5 << 8, 0) == []
+    assert index.query((5 << 8) | 2, 0) == [(0, "k5:boyfriend:m")]
+    assert index.query((99 << 8) | 2, 0) == [(0, "k99:boyfriend:m")]
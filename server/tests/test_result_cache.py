@@ -0,0 +1,60 @@
+# server/tests/test_result_cache.py
+import asyncio
+
+import pytest
+
+import result_cache
+from conftest import make_jpeg
+from qwen_client import DEFAULT_MODEL
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def fresh_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_ENABLED", True)
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(result_cache, "NEAR_DUP_ENABLED", False)
+    monkeypatch.setattr(result_cache, "_cache", None)
+    calls = []
+
+    async def fake_analyze(image_bytes, **kwargs):
+        calls.append(kwargs)
+        return {"_meta": {"model_success": True, "model": fake_analyze.model}}
+
+    fake_analyze.model = DEFAULT_MODEL
+    monkeypatch.setattr(result_cache, "_admitted_analyze", fake_analyze)
+    return fake_analyze, calls
+
+
+def test_default_model_result_is_cached(fresh_cache):
+    _, calls = fresh_cache
+    data = make_jpeg(seed=1)
+    first = run(result_cache.analyze_with_cache(data, mime="image/jpeg"))
+    second = run(result_cache.analyze_with_cache(data, mime="image/jpeg"))
+    assert not first["_meta"]["cache"]["hit"]
+    assert second["_meta"]["cache"]["hit"]
+    assert len(calls) == 1
+
+
+def test_result_from_other_model_is_not_cached(fresh_cache):
+    fake_analyze, calls = fresh_cache
+    fake_analyze.model = "fallback/screenshot-model"
+    data = make_jpeg(seed=2)
+    run(result_cache.analyze_with_cache(data, mime="image/jpeg"))
+    second = run(result_cache.analyze_with_cache(data, mime="image/jpeg"))
+    assert not second["_meta"]["cache"]["hit"]
+    assert len(calls) == 2
+
+
+def test_llm_dispatch_is_part_of_the_key(fresh_cache):
+    _, calls = fresh_cache
+    data = make_jpeg(seed=3)
+    run(result_cache.analyze_with_cache(data, mime="image/jpeg", llm_dispatch="after_local"))
+    early = run(result_cache.analyze_with_cache(data, mime="image/jpeg", llm_dispatch="early"))
+    assert not early["_meta"]["cache"]["hit"]
+    again = run(result_cache.analyze_with_cache(data, mime="image/jpeg", llm_dispatch="early"))
+    assert again["_meta"]["cache"]["hit"]
+    assert [c["llm_dispatch"] for c in calls] == ["after_local", "early"]
@@ -0,0 +1,105 @@
+# server/tests/test_upload_limits.py
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from upload_limits import UploadLimitMiddleware
+
+LIMIT = 100
+
+
+def _echo_app(calls):
+    """读完请求体后返回 200，记录收到的字节数；收到 disconnect 时像 multipart 解析一样抛错"""
+    async def app(scope, receive, send):
+        calls.append(scope["path"])
+        body = b""
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                await send({"type": "http.response.start", "status": 400, "headers": []})
+                await send({"type": "http.response.body", "body": b"parse error"})
+                raise RuntimeError("client disconnected")
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": str(len(body)).encode()})
+    return app
+
+
+def _call(path, chunks, method="POST", content_length=None):
+    calls, sent, received = [], [], []
+    headers = [] if content_length is None else [(b"content-length", str(content_length).encode())]
+    scope = {"type": "http", "path": path, "method": method, "headers": headers}
+    messages = [{"type": "http.request", "body": c, "more_body": i < len(chunks) - 1} for i, c in enumerate(chunks)]
+
+    async def receive():
+        received.append(1)
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    middleware = UploadLimitMiddleware(_echo_app(calls), {"/upload": LIMIT})
+    asyncio.run(middleware(scope, receive, send))
+    status = next(m["status"] for m in sent if m["type"] == "http.response.start")
+    body = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+    return status, body, calls, len(received)
+
+
+def test_within_limit_passes_through():
+    status, body, calls, _ = _call("/upload", [b"x" * 60, b"x" * 40], content_length=100)
+    assert (status, body, calls) == (200, b"100", ["/upload"])
+
+
+def test_declared_length_rejected_before_reading():
+    status, body, calls, reads = _call("/upload", [b"x" * 10], content_length=LIMIT + 1)
+    assert status == 413 and calls == [] and reads == 0
+    assert "max 100 bytes" in json.loads(body)["detail"]
+
+
+def test_chunked_body_cut_off_once_limit_is_exceeded():
+    chunks = [b"x" * 40] * 10
+    status, body, calls, reads = _call("/upload", chunks)
+    assert status == 413 and calls == ["/upload"]
+    # 超出后不再读取剩余的块，应用自己的 400 响应被替换
+    assert reads == 3 and b"parse error" not in body
+
+
+def test_understated_content_length_is_still_enforced():
+    status, _, _, _ = _call("/upload", [b"x" * 80, b"x" * 80], content_length=10)
+    assert status == 413
+
+
+def test_other_paths_and_methods_are_not_limited():
+    assert _call("/other", [b"x" * 500])[0] == 200
+    assert _call("/upload", [b"x" * 500], method="PUT")[0] == 200
+
+
+def test_app_routes_reject_oversized_uploads():
+    import main
+    client = TestClient(main.app)
+    limit = main.MAX_SIZE_BYTES + main.MULTIPART_OVERHEAD
+    response = client.post("/api/analyze", content=b"", headers={
+        "content-length": str(limit + 1), "content-type": "multipart/form-data; boundary=x"
+    })
+    assert response.status_code == 413
+
+
+def test_read_upload_rejects_known_size_before_reading():
+    import main
+    from fastapi import HTTPException, UploadFile
+    from starlette.datastructures import Headers
+
+    class Unreadable:
+        def seek(self, *args):
+            raise AssertionError("must not read an oversized upload")
+        read = readinto = seek
+
+    upload = UploadFile(Unreadable(), size=main.MAX_SIZE_BYTES + 1,
+                        headers=Headers({"content-type": "image/jpeg"}))
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main._read_upload(upload, None))
+    assert exc.value.status_code == 400
@@ -0,0 +1,85 @@
+# server/upload_limits.py
+"""
+上传大小的提前拦截（ASGI 中间件）
+multipart 表单在进入接口函数之前就会被完整解析并缓存，
+接口内再检查大小为时已晚。这里在请求体到达时就按 Content-Length
+和已接收字节数判断，超出上限立即返回 413，不再继续读取
+"""
+import json
+from typing import Any, Awaitable, Callable, Dict
+
+Scope = Dict[str, Any]
+Message = Dict[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+
+# multipart 边界、表单字段等额外开销
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadLimitMiddleware:
+    """按路径限制 POST 请求体大小：limits = {路径: 最大字节数}"""
+
+    def __init__(self, app: Callable, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        limit = self.limits.get(scope.get("path", "")) if scope["type"] == "http" else None
+        if limit is None or scope.get("method") != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        # 1) Content-Length 已超出：不读取请求体，直接拒绝
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    if int(value) > limit:
+                        await self._reject(send, limit)
+                        return
+                except ValueError:
+                    pass
+                break
+
+        # 2) 未声明长度（chunked）或声明不实：边接收边计数，超出后中断解析
+        received = 0
+        exceeded = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, exceeded
+            if exceeded:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message: Message) -> None:
+            # 解析被中断后应用返回的错误响应（通常是 400）由 413 替代
+            if not exceeded:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded:
+            await self._reject(send, limit)
+
+    @staticmethod
+    async def _reject(send: Send, limit: int) -> None:
+        body = json.dumps({"detail": f"Request body too large (max {limit} bytes)"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -66,18 +66,64 @@ function App() {
     handleFileSelect(file)
   }, [handleFileSelect])
 
+  // 解析 SSE 事件流，逐步合并到 result 中
+  const readAnalysisStream = async (response) => {
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+    
+    const handleEvent = (event, payload) => {
+      if (event === 'result') {
+        console.log('API Response:', payload) // 调试用
+        setResult(payload)
+      } else if (event === 'error') {
+        throw new Error(payload.detail || '分析失败')
+      } else if (event === 'llm_field') {
+        // 模型原始字段，界面等待整理后的模块事件
+        return
+      } else if (event === 'girlfriend_comments') {
+        setResult(prev => ({ ...prev, analysis: prev?.analysis || {}, girlfriend_comments: payload, _partial: true }))
+      } else if (event === 'local_detection') {
+        setResult(prev => ({ ...prev, analysis: prev?.analysis || {}, local_detection: payload, _partial: true }))
+      } else {
+        setResult(prev => ({ ...prev, analysis: { ...prev?.analysis, [event]: payload }, _partial: true }))
+      }
+    }
+    
+    while (true) {
+      const { done, value } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+      
+      let sep
+      while ((sep = buffer.indexOf('\n\n')) >= 0) {
+        const block = buffer.slice(0, sep)
+        buffer = buffer.slice(sep + 2)
+        let event = 'message'
+        let dataLines = []
+        for (const line of block.split('\n')) {
+          if (line.startsWith('event:')) event = line.slice(6).trim()
+          else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim())
+        }
+        if (dataLines.length) handleEvent(event, JSON.parse(dataLines.join('\n')))
+      }
+    }
+  }
+
   const analyzeImage = async () => {
     if (!selectedFile) return
     
     setLoading(true)
     setError(null)
+    setResult(null)
     
     try {
       const formData = new FormData()
       formData.append('image', selectedFile)
       formData.append('target_gender', targetGender)
       
-      const response = await fetch('/api/analyze', {
+      // 使用 SSE 流式接口：各模块完成后立即渲染，最后的 result 事件与 /api/analyze 返回一致
+      const response = await fetch('/api/analyze/stream', {
         method: 'POST',
         body: formData,
       })
@@ -87,9 +133,7 @@ function App() {
         throw new Error(errorData.detail || '分析失败')
       }
       
-      const data = await response.json()
-      console.log('API Response:', data) // 调试用
-      setResult(data)
+      await readAnalysisStream(response)
     } catch (err) {
       setError(err.message || '网络错误，请重试')
     } finally {
@@ -335,7 +379,7 @@ function App() {
 
         {/* 右侧结果区域 */}
         <div className="results-column">
-          {loading ? (
+          {loading && !data?.analysis ? (
             <div className="window-card">
               <div className="loading-overlay">
                 <div className="loading-spinner"></div>
@@ -344,6 +388,31 @@ function App() {
             </div>
           ) : data && data.analysis ? (
             <>
+              {/* ========== 0. 流式进度：本地分析已完成，等待 AI 结果 ========== */}
+              {loading && (
+                <div className="window-card">
+                  <div className="window-header">
+                    <div className="window-header-left">
+                      <span className="window-header-icon">⏳</span>
+                      <span>本地分析完成，AI 分析中...</span>
+                    </div>
+                  </div>
+                  <div className="loading-overlay">
+                    <div className="loading-spinner"></div>
+                    {result?.local_detection && (
+                      <p className="loading-text">
+                        本地检测（{result.local_detection.engine}）：
+                        {result.local_detection.persons?.length || 0} 人，
+                        {result.local_detection.person_visibility?.visibility || '不可见'}
+                      </p>
+                    )}
+                    {data.analysis.credibility?.items?.map((item, idx) => (
+                      <p key={idx} className="loading-text">◆ {item.claim}</p>
+                    ))}
+                  </div>
+                </div>
+              )}
+
               {/* ========== 1. 网图检测警告（最重要，放最前面） ========== */}
               {data.webCheck && (data.webCheck.risk_level === 'high' || data.webCheck.risk_level === 'medium') && (
                 <div className={`window-card webcheck-card ${getWebCheckRiskClass(data.webCheck.risk_level)}`}>
@@ -869,6 +938,7 @@ function App() {
               )}
 
               {/* ========== 10. 可靠性评估 ========== */}
+              {!result._partial && (
               <div className="window-card reliability-card">
                 <div className="window-header" onClick={() => toggleCollapse('reliability')} style={{ cursor: 'pointer' }}>
                   <div className="window-header-left">
@@ -916,6 +986,7 @@ function App() {
                   </div>
                 )}
               </div>
+              )}
             </>
           ) : (
             <div className="awaiting-card">